@@ -13,10 +13,15 @@ import pystray
 from pystray import MenuItem as item
 
 from utils import get_appdata_path, create_tray_icon
+from event_bus import EventBus, create_file_log
+from photo_io import read_photo_header, oriented_size, thumbnail_size
 from database import FaceDatabase
 from thumbnail_cache import ThumbnailCache
 from settings import Settings
-from workers import ScanWorker, ClusterWorker
+from workers import ScanWorker, ClusterWorker, ReembedWorker
+from face_models import MODEL_PRECISIONS, DETECTION_SIZES
+from folder_watcher import FolderWatcher
+from path_filter import PathFilter
 
 
 class API:
@@ -27,10 +32,15 @@ class API:
         db_path = get_appdata_path()
         print(f"Database location: {db_path}")
         
-        self._db = FaceDatabase(str(db_path))
+        self._db = FaceDatabase(str(db_path), settings.get('embedding_storage', 'lmdb'),
+                                settings.get('embedding_format', 'float32'))
+        # Memory for the embeddings kept between clusterings, so recalibrating does not reload them
+        self._db.embedding_cache.set_max_bytes(int(settings.get('embedding_cache_mb', 1024)) * 1024 * 1024)
         self._window = None
         self._scan_worker = None
+        self._reembed_worker = None
         self._cluster_worker = None
+        self._folder_watcher = None
         self._tray_icon = None
         self._close_to_tray = settings.get('close_to_tray', True)
         self._quit_flag = False
@@ -40,9 +50,14 @@ class API:
         cache_path = db_path.parent / "thumbnail_cache"
         self._thumbnail_cache = ThumbnailCache(str(cache_path))
         print(f"Thumbnail cache location: {cache_path}")
+        
+        self._log = create_file_log(db_path.parent / "logs")
+        self._events = EventBus(self._evaluate_js)
 
     def set_window(self, window):
         self._window = window
+        self._events.start()
+        self.start_folder_watcher()
         self._setup_window_events()
         if self._close_to_tray:
             self._setup_tray()
@@ -120,15 +135,20 @@ class API:
         tray_thread = threading.Thread(target=self._tray_icon.run, daemon=False)
         tray_thread.start()
     
-    def update_status(self, message: str):
+    def _evaluate_js(self, script: str):
         if self._window:
-            safe_message = message.replace('"', '\\"').replace('\n', ' ')
-            self._window.evaluate_js(f'updateStatusMessage("{safe_message}")')
+            self._window.evaluate_js(script)
+    
+    def update_status(self, message: str):
+        self._log.info(message)
+        self._events.post_status(message)
+    
+    def log_detail(self, message: str):
+        """Per-file details go to the log file only, so they do not flood the UI"""
+        self._log.info(message)
     
     def update_progress(self, current: int, total: int):
-        if self._window:
-            percent = (current / total) * 100 if total > 0 else 0
-            self._window.evaluate_js(f'updateProgress({current}, {total}, {percent})')
+        self._events.post_progress(current, total)
 
     def get_cache_stats(self):
         return self._thumbnail_cache.get_cache_size()
@@ -139,6 +159,30 @@ class API:
             self._window.evaluate_js('loadPeople()')
         return stats
     
+    def compact_storage(self, thorough=False):
+        """Remove leftovers of deleted photos and old clusterings; thorough also rewrites the files"""
+        workers = (self._scan_worker, self._reembed_worker, self._cluster_worker)
+        if any(worker is not None and worker.is_alive() for worker in workers):
+            self.update_status("Compacting must wait until the current scan, re-embedding or clustering finishes")
+            return None
+        
+        self.update_status("Compacting storage...")
+        result = self._db.compact_storage(vacuum=thorough, compact_embeddings=thorough)
+        if result is None:
+            self.update_status("ERROR: Compacting storage failed")
+            return None
+        
+        thumbnails = self._thumbnail_cache.remove_orphans(self._db.get_all_face_ids())
+        result['thumbnails_removed'] = thumbnails['file_count']
+        result['reclaimed_bytes'] += thumbnails['size_bytes']
+        result['reclaimed_mb'] = round(result['reclaimed_bytes'] / (1024 * 1024), 2)
+        
+        self.update_status(f"Compacting complete: {result['reclaimed_mb']} MB reclaimed")
+        self.update_status(f"  Removed {result['orphan_faces']} orphaned faces, {result['orphan_embeddings']} orphaned "
+                           f"embeddings, {result['thumbnails_removed']} orphaned thumbnails and "
+                           f"{result['clusterings_removed']} old clusterings")
+        return result
+    
     def scan_complete(self):
         total_faces = self._db.get_total_faces()
         total_photos = self._db.get_total_photos()
@@ -146,6 +190,10 @@ class API:
         
         self.update_status(f"Scan complete: {total_faces} faces in {total_photos} photos")
         
+        filtered_faces = self._db.get_filtered_face_count()
+        if filtered_faces > 0:
+            self.update_status(f"{filtered_faces} low quality faces are filtered out of clustering")
+        
         if pending_count > 0:
             self.update_status(f"Warning: {pending_count} photos had errors and were skipped")
         
@@ -174,6 +222,7 @@ class API:
         self._photos_deleted = deleted
     
     def cluster_complete(self):
+        self._events.flush()
         if self._window:
             self._window.evaluate_js('hideProgress()')
             self._window.evaluate_js('loadPeople()')
@@ -194,6 +243,10 @@ class API:
         if scan_frequency == 'manual':
             return False
         
+        # An interrupted scan resumes from its queue regardless of the schedule
+        if self._db.has_resumable_scan_queue():
+            return True
+        
         if scan_frequency == 'every_restart':
             return True
         
@@ -212,11 +265,82 @@ class API:
         
         return True
     
-    def start_scanning(self):
+    def start_scanning(self, incremental=False):
         if self._scan_worker is None or not self._scan_worker.is_alive():
-            self._scan_worker = ScanWorker(self._db, self)
+            self._scan_worker = ScanWorker(self._db, self, incremental=incremental)
             self._scan_worker.start()
     
+    def start_folder_watcher(self):
+        self.stop_folder_watcher()
+        if not self._settings.get('watch_folders', False):
+            return False
+        
+        watcher = FolderWatcher(self._db, lambda: PathFilter.from_api(self), self._on_watch_batch,
+                                report=self.update_status)
+        if not watcher.start(self.get_include_folders()):
+            return False
+        self._folder_watcher = watcher
+        return True
+    
+    def stop_folder_watcher(self):
+        if self._folder_watcher is not None:
+            self._folder_watcher.stop()
+            self._folder_watcher = None
+    
+    def _on_watch_batch(self, batch):
+        """Runs on the watcher thread after a batch of file changes was applied to the database"""
+        if batch.relocated > 0:
+            self.update_status(f"Folder watcher: {batch.relocated} photos moved or renamed")
+        if batch.removed > 0:
+            self.update_status(f"Folder watcher: removed {batch.removed} deleted photos")
+            self._photos_deleted = True
+        
+        # A running scan, and the recalibration it starts, finish first; new events keep collecting meanwhile
+        if self._scan_worker is not None:
+            self._scan_worker.join()
+        if self._cluster_worker is not None:
+            self._cluster_worker.join()
+        
+        # Watching may have been turned off while waiting; stop_folder_watcher does not wait that long
+        if self._folder_watcher is None or self._folder_watcher.stopped:
+            return
+        
+        if self._db.get_scan_queue_size() > 0:
+            if self._window:
+                self._window.evaluate_js('showProgress()')
+            self.start_scanning(incremental=True)
+        elif batch.removed > 0:
+            if self._window:
+                self._window.evaluate_js('showProgress()')
+            self.start_clustering()
+        elif batch.relocated > 0 and self._window:
+            self._window.evaluate_js('loadPeople()')
+    
+    def start_reembed(self):
+        scan_running = self._scan_worker is not None and self._scan_worker.is_alive()
+        reembed_running = self._reembed_worker is not None and self._reembed_worker.is_alive()
+        if scan_running or reembed_running:
+            self.update_status("Re-embedding must wait until the current scan finishes")
+            return False
+        
+        self._reembed_worker = ReembedWorker(self._db, self)
+        self._reembed_worker.start()
+        return True
+    
+    def reembed_complete(self, updated_count):
+        if updated_count > 0:
+            self.update_status("Embeddings changed, starting automatic recalibration...")
+            self.start_clustering()
+        elif self._window:
+            self._events.flush()
+            self._window.evaluate_js('hideProgress()')
+    
+    def prioritize_scan_folder(self, folder):
+        count = self._db.prioritize_scan_folder(folder)
+        if count > 0:
+            self.update_status(f"Scanning {count} queued photos in {folder} first")
+        return count
+    
     def start_clustering(self):
         if self._cluster_worker is None or not self._cluster_worker.is_alive():
             threshold = self.get_threshold()
@@ -280,9 +404,11 @@ class API:
             if primary_face_id:
                 face_data = self._db.get_face_data(primary_face_id)
                 if face_data:
+                    self._fill_missing_mtimes([face_data])
                     bbox = [face_data['bbox_x1'], face_data['bbox_y1'], 
                         face_data['bbox_x2'], face_data['bbox_y2']]
-                    thumbnail = self.create_thumbnail(face_data['file_path'], size=80, bbox=bbox, face_id=primary_face_id)
+                    thumbnail = self.create_thumbnail(face_data['file_path'], size=80, bbox=bbox, face_id=primary_face_id,
+                                                      source_mtime=face_data['file_mtime'])
             
             result.append({
                 'id': person_id,
@@ -472,6 +598,8 @@ class API:
         view_mode = self._settings.get('view_mode', 'entire_photo')
         grid_size = self._settings.get('grid_size', 180)
         
+        self._fill_missing_mtimes(photo_data)
+        
         for data in photo_data:
             face_id = data['face_id']
             is_hidden = face_id in hidden_photos
@@ -485,7 +613,8 @@ class API:
             if view_mode == 'zoom_to_faces':
                 bbox = [data['bbox_x1'], data['bbox_y1'], data['bbox_x2'], data['bbox_y2']]
             
-            thumbnail = self.create_thumbnail(path, size=grid_size, bbox=bbox, face_id=face_id)
+            thumbnail = self.create_thumbnail(path, size=grid_size, bbox=bbox, face_id=face_id,
+                                              source_mtime=data['file_mtime'])
             if thumbnail:
                 photos.append({
                     'path': path,
@@ -522,9 +651,23 @@ class API:
             print(f"Error creating full size preview: {e}")
             return None
     
-    def create_thumbnail(self, image_path: str, size: int = 150, bbox: Optional[List[float]] = None, face_id: Optional[int] = None) -> Optional[str]:
+    def _fill_missing_mtimes(self, rows: List[dict]):
+        """Store file mtimes for photos scanned before they were recorded, so the stat happens once"""
+        missing = []
+        for row in rows:
+            if row.get('file_mtime') is None:
+                try:
+                    row['file_mtime'] = os.path.getmtime(row['file_path'])
+                    missing.append((row['file_path'], row['file_mtime']))
+                except OSError:
+                    pass
+        if missing:
+            self._db.update_photo_mtimes(missing)
+    
+    def create_thumbnail(self, image_path: str, size: int = 150, bbox: Optional[List[float]] = None, face_id: Optional[int] = None,
+                         source_mtime: Optional[float] = None) -> Optional[str]:
         if face_id:
-            return self._thumbnail_cache.create_thumbnail_with_cache(face_id, image_path, size, bbox)
+            return self._thumbnail_cache.create_thumbnail_with_cache(face_id, image_path, size, bbox, source_mtime)
         
         try:
             img = Image.open(image_path)
@@ -677,6 +820,57 @@ class API:
         else:
             self.update_status("Dynamic resource management disabled - full speed always")
     
+    def get_background_cpu_percent(self):
+        return self._settings.get('background_cpu_percent', 25)
+    
+    def set_background_cpu_percent(self, percent):
+        self._settings.set('background_cpu_percent', percent)
+    
+    def get_watch_folders(self):
+        return self._settings.get('watch_folders', False)
+    
+    def set_watch_folders(self, enabled):
+        self._settings.set('watch_folders', enabled)
+        if not enabled:
+            self.stop_folder_watcher()
+            return False
+        
+        started = self.start_folder_watcher()
+        if not started:
+            self._settings.set('watch_folders', False)
+        return started
+    
+    def get_quality_gate_enabled(self):
+        return self._settings.get('quality_gate_enabled', False)
+    
+    def set_quality_gate_enabled(self, enabled):
+        self._settings.set('quality_gate_enabled', enabled)
+    
+    def get_screening_enabled(self):
+        return self._settings.get('screening_enabled', False)
+    
+    def set_screening_enabled(self, enabled):
+        self._settings.set('screening_enabled', enabled)
+    
+    def get_model_precision(self):
+        return self._settings.get('model_precision', 'fp32')
+    
+    def set_model_precision(self, precision):
+        if precision not in MODEL_PRECISIONS:
+            return False
+        self._settings.set('model_precision', precision)
+        return True
+    
+    def get_det_size(self):
+        return self._settings.get('det_size', 640)
+    
+    def set_det_size(self, size):
+        size = int(size)
+        if size not in DETECTION_SIZES:
+            return False
+        self._settings.set('det_size', size)
+        return True
+    
     def get_show_unmatched(self):
         return self._settings.get('show_unmatched', False)
     
@@ -724,6 +918,8 @@ class API:
     
     def set_include_folders(self, folders):
         self._settings.set('include_folders', folders)
+        if self._folder_watcher is not None:
+            self.start_folder_watcher()
     
     def get_exclude_folders(self):
         return self._settings.get('exclude_folders', [])
@@ -734,6 +930,9 @@ class API:
     def get_wildcard_exclusions(self):
         return self._settings.get('wildcard_exclusions', '')
     
+    def get_scan_settings(self):
+        return self._settings.get_scan_settings()
+    
     def set_wildcard_exclusions(self, wildcards):
         self._settings.set('wildcard_exclusions', wildcards)
     
@@ -836,17 +1035,20 @@ class API:
             
             faces = self._db.get_photo_face_tags(photo_id)
             
-            img = Image.open(photo_path)
-            img = ImageOps.exif_transpose(img)
+            metadata = self._db.get_photo_metadata(photo_id)
+            if metadata['width'] is None or metadata['height'] is None:
+                # Scanned before header metadata was stored: read it once and keep it
+                header = read_photo_header(photo_path)
+                self._db.update_photo_metadata(photo_id, **header)
+                metadata.update(header)
             
-            original_width = img.width
-            original_height = img.height
+            original_width, original_height = oriented_size(
+                metadata['width'], metadata['height'], metadata['orientation']
+            )
             
+            # Same size get_full_size_preview produces, computed without decoding the original
             max_size = 1200
-            img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-            
-            preview_width = img.width
-            preview_height = img.height
+            preview_width, preview_height = thumbnail_size(original_width, original_height, max_size)
             
             scale_x = preview_width / original_width
             scale_y = preview_height / original_height
@@ -877,9 +1079,15 @@ class API:
         self._settings.set('show_face_tags_preview', enabled)
     
     def close(self):
+        self.stop_folder_watcher()
+        if self._scan_worker and self._scan_worker.is_alive():
+            self._scan_worker.stop()
+        if self._reembed_worker and self._reembed_worker.is_alive():
+            self._reembed_worker.stop()
         if self._tray_icon:
             try:
                 self._tray_icon.stop()
             except:
                 pass
+        self._events.close()
         self._db.close()
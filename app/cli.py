@@ -0,0 +1,438 @@
+"""Headless entry point: scan, watch, cluster, stats, export, storage and compact without the pywebview window.
+
+Progress and status are written to stdout as JSON lines, one event per line:
+{"event": "status", "message": ...}, {"event": "progress", "current": ..., "total": ...}
+and a final {"event": "result", ...}. Anything else the app prints goes to stderr.
+
+Exit codes: 0 success, 1 failure, 2 invalid arguments, 130 interrupted (an
+interrupted scan resumes from its queue on the next run).
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from utils import get_appdata_path
+from settings import Settings
+from database import FaceDatabase, EMBEDDING_STORAGES, KEEP_CLUSTERINGS
+from thumbnail_cache import ThumbnailCache
+from embedding_codec import EMBEDDING_FORMATS
+from event_bus import create_file_log
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_INTERRUPTED = 130
+
+
+class HeadlessAPI:
+    """The callback interface ScanWorker and ClusterWorker expect from API, printing JSON lines instead of driving a window"""
+
+    PROGRESS_INTERVAL = 1.0
+
+    def __init__(self, settings: Settings, db: FaceDatabase, out, background: bool = False,
+                 overrides: Optional[dict] = None, verbose: bool = False, log=None):
+        self._settings = settings
+        self._db = db
+        self._out = out
+        self._background = background
+        self._overrides = overrides or {}
+        self._verbose = verbose
+        self._log = log
+        self._lock = threading.Lock()
+        self._last_progress = 0.0
+        self.scan_completed = False
+        self.cluster_completed = False
+        self.reembed_count = None
+        self.new_photos_found = False
+        self.photos_deleted = False
+
+    def emit(self, event: str, **fields):
+        with self._lock:
+            self._out.write(json.dumps({'event': event, 'time': round(time.time(), 3), **fields}) + '\n')
+            self._out.flush()
+
+    def update_status(self, message: str):
+        if self._log:
+            self._log.info(message)
+        self.emit('status', message=message)
+
+    def log_detail(self, message: str):
+        if self._log:
+            self._log.info(message)
+        if self._verbose:
+            self.emit('detail', message=message)
+
+    def update_progress(self, current: int, total: int):
+        now = time.monotonic()
+        if current < total and now - self._last_progress < self.PROGRESS_INTERVAL:
+            return
+        self._last_progress = now
+        self.emit('progress', current=current, total=total)
+
+    def get_scan_settings(self) -> dict:
+        return {**self._settings.get_scan_settings(), **self._overrides}
+
+    def get_include_folders(self):
+        return self._settings.get('include_folders', [])
+
+    def get_exclude_folders(self):
+        return self._settings.get('exclude_folders', [])
+
+    def get_wildcard_exclusions(self):
+        return self._settings.get('wildcard_exclusions', '')
+
+    def get_dynamic_resources(self):
+        return self._background
+
+    def is_window_foreground(self):
+        # No window: with --background the scan always keeps to the background budget
+        return not self._background
+
+    def set_new_photos_found(self, found):
+        self.new_photos_found = found
+
+    def set_photos_deleted(self, deleted):
+        self.photos_deleted = deleted
+
+    def scan_complete(self):
+        self.scan_completed = True
+        self._settings.set('last_scan_time', time.time())
+
+    def cluster_complete(self):
+        self.cluster_completed = True
+
+    def reembed_complete(self, updated_count):
+        self.reembed_count = updated_count
+
+
+def run_worker(worker, api: HeadlessAPI) -> bool:
+    """Run a worker thread to the end; Ctrl+C stops it cleanly. Returns False when interrupted."""
+    worker.start()
+    try:
+        while worker.is_alive():
+            worker.join(timeout=0.5)
+    except KeyboardInterrupt:
+        api.update_status("Interrupted, stopping...")
+        if hasattr(worker, 'stop'):
+            worker.stop()
+        worker.join()
+        return False
+    return True
+
+
+def run_clustering(db: FaceDatabase, api: HeadlessAPI, threshold: float) -> int:
+    from workers import ClusterWorker
+
+    if not run_worker(ClusterWorker(db, threshold, api), api):
+        return EXIT_INTERRUPTED
+    if not api.cluster_completed and db.get_total_faces() > 0:
+        return EXIT_FAILED
+    return EXIT_OK
+
+
+def command_scan(args, settings: Settings, db: FaceDatabase, api: HeadlessAPI) -> int:
+    from workers import ScanWorker
+
+    if args.add_folder:
+        folders = settings.get('include_folders', [])
+        for folder in args.add_folder:
+            folder = os.path.abspath(folder)
+            if not os.path.isdir(folder):
+                api.update_status(f"ERROR: Not a folder: {folder}")
+                return EXIT_FAILED
+            if folder not in folders:
+                folders.append(folder)
+        settings.set('include_folders', folders)
+
+    if not run_worker(ScanWorker(db, api), api):
+        api.emit('result', command='scan', interrupted=True, queued=db.get_scan_queue_size())
+        return EXIT_INTERRUPTED
+    if not api.scan_completed:
+        return EXIT_FAILED
+
+    result = {
+        'total_photos': db.get_total_photos(),
+        'total_faces': db.get_total_faces(),
+        'photos_with_errors': db.get_photos_needing_scan(),
+    }
+
+    needs_clustering = api.new_photos_found or api.photos_deleted or db.get_active_clustering() is None
+    if needs_clustering and not args.no_cluster:
+        api.update_status("Starting automatic recalibration...")
+        exit_code = run_clustering(db, api, settings.get('threshold', 50))
+        if exit_code != EXIT_OK:
+            return exit_code
+        result['clustered'] = True
+
+    api.emit('result', command='scan', **result)
+    return EXIT_OK
+
+
+def command_watch(args, settings: Settings, db: FaceDatabase, api: HeadlessAPI) -> int:
+    from folder_watcher import FolderWatcher
+    from path_filter import PathFilter
+    from workers import ScanWorker
+
+    changes = threading.Event()
+
+    def on_batch(batch):
+        if batch.relocated > 0:
+            api.update_status(f"Folder watcher: {batch.relocated} photos moved or renamed")
+        if batch.removed > 0:
+            api.update_status(f"Folder watcher: removed {batch.removed} deleted photos")
+            api.photos_deleted = True
+        changes.set()
+
+    watcher = FolderWatcher(db, lambda: PathFilter.from_api(api), on_batch, report=api.update_status)
+    if not watcher.start(api.get_include_folders()):
+        api.update_status("ERROR: Nothing to watch, add folders with scan --add-folder")
+        return EXIT_FAILED
+
+    # Photos left in the queue by an interrupted scan are picked up straight away
+    if db.get_scan_queue_size() > 0:
+        changes.set()
+
+    try:
+        while True:
+            if not changes.wait(timeout=1.0):
+                continue
+            changes.clear()
+
+            if db.get_scan_queue_size() > 0:
+                api.scan_completed = False
+                if not run_worker(ScanWorker(db, api, incremental=True), api):
+                    return EXIT_INTERRUPTED
+
+            if (api.new_photos_found or api.photos_deleted) and not args.no_cluster:
+                exit_code = run_clustering(db, api, settings.get('threshold', 50))
+                if exit_code == EXIT_INTERRUPTED:
+                    return exit_code
+            api.new_photos_found = False
+            api.photos_deleted = False
+
+            api.emit('result', command='watch', total_photos=db.get_total_photos(), total_faces=db.get_total_faces())
+    except KeyboardInterrupt:
+        return EXIT_INTERRUPTED
+    finally:
+        watcher.stop()
+
+
+def command_cluster(args, settings: Settings, db: FaceDatabase, api: HeadlessAPI) -> int:
+    threshold = args.threshold if args.threshold is not None else settings.get('threshold', 50)
+    exit_code = run_clustering(db, api, threshold)
+    if exit_code == EXIT_OK:
+        clustering = db.get_active_clustering()
+        persons = db.get_persons_in_clustering(clustering['clustering_id']) if clustering else []
+        api.emit('result', command='cluster', threshold=threshold,
+                 persons=sum(1 for person in persons if person['person_id'] > 0))
+    return exit_code
+
+
+def command_stats(args, settings: Settings, db: FaceDatabase, api: HeadlessAPI) -> int:
+    result = {
+        'total_photos': db.get_total_photos(),
+        'total_faces': db.get_total_faces(),
+        'filtered_faces': db.get_filtered_face_count(),
+        'photos_with_errors': db.get_photos_needing_scan(),
+        'queued_photos': db.get_scan_queue_size(),
+        'include_folders': settings.get('include_folders', []),
+        'last_scan_time': settings.get('last_scan_time'),
+        'embedding_storage': db.get_embedding_storage(),
+        'embedding_format': db.get_embedding_format(),
+        'clustering': None,
+    }
+
+    clustering = db.get_active_clustering()
+    if clustering:
+        persons = db.get_persons_in_clustering(clustering['clustering_id'])
+        result['clustering'] = {
+            'clustering_id': clustering['clustering_id'],
+            'threshold': clustering['threshold'],
+            'persons': sum(1 for person in persons if person['person_id'] > 0),
+            'unmatched_faces': sum(person['face_count'] for person in persons if person['person_id'] == 0),
+            'named_people': len(db.get_all_named_people(clustering['clustering_id'])),
+        }
+
+    api.emit('result', command='stats', **result)
+    return EXIT_OK
+
+
+def command_storage(args, settings: Settings, db: FaceDatabase, api: HeadlessAPI) -> int:
+    moved = 0
+    start = time.perf_counter()
+    if args.to and args.to != db.get_embedding_storage():
+        api.update_status(f"Moving embeddings to {args.to} storage...")
+        moved = db.set_embedding_storage(args.to)
+        settings.set('embedding_storage', args.to)
+
+    converted = 0
+    if args.format and args.format != db.get_embedding_format():
+        api.update_status(f"Storing embeddings as {args.format}...")
+        converted = db.set_embedding_format(args.format)
+        settings.set('embedding_format', args.format)
+
+    api.emit('result', command='storage', embedding_storage=db.get_embedding_storage(),
+             embedding_format=db.get_embedding_format(), moved=moved, converted=converted,
+             seconds=round(time.perf_counter() - start, 3))
+    return EXIT_OK
+
+
+def command_compact(args, settings: Settings, db: FaceDatabase, api: HeadlessAPI) -> int:
+    start = time.perf_counter()
+    api.update_status("Compacting storage...")
+    result = db.compact_storage(keep_clusterings=args.keep_clusterings, vacuum=args.vacuum,
+                                compact_embeddings=args.compact_embeddings)
+    if result is None:
+        api.update_status("ERROR: Compacting storage failed")
+        return EXIT_FAILED
+
+    thumbnails = ThumbnailCache(str(db.db_folder.parent / "thumbnail_cache")).remove_orphans(db.get_all_face_ids())
+    result['thumbnails_removed'] = thumbnails['file_count']
+    result['reclaimed_bytes'] += thumbnails['size_bytes']
+
+    api.emit('result', command='compact', seconds=round(time.perf_counter() - start, 3), **result)
+    return EXIT_OK
+
+
+def command_export(args, settings: Settings, db: FaceDatabase, api: HeadlessAPI) -> int:
+    clustering = db.get_active_clustering()
+    if clustering is None:
+        api.update_status("ERROR: No clustering yet, run the cluster command first")
+        return EXIT_FAILED
+
+    clustering_id = clustering['clustering_id']
+    rows = db.get_face_assignments(clustering_id)
+    hidden_persons = db.get_hidden_persons(clustering_id)
+    hidden_faces = db.get_hidden_photos()
+    person_names = {person_id: db.get_person_name_fast(clustering_id, person_id)
+                    for person_id in {row['person_id'] for row in rows}}
+
+    try:
+        with open(args.output, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['file_path', 'face_id', 'person_id', 'person_name', 'face_tag', 'confidence',
+                             'bbox_x1', 'bbox_y1', 'bbox_x2', 'bbox_y2', 'person_hidden', 'photo_hidden'])
+            for row in rows:
+                writer.writerow([
+                    row['file_path'], row['face_id'], row['person_id'], person_names[row['person_id']],
+                    row['tag_name'] or '', row['confidence_score'],
+                    row['bbox_x1'], row['bbox_y1'], row['bbox_x2'], row['bbox_y2'],
+                    int(row['person_id'] in hidden_persons), int(row['face_id'] in hidden_faces)
+                ])
+    except OSError as e:
+        api.update_status(f"ERROR: Cannot write {args.output}: {e}")
+        return EXIT_FAILED
+
+    api.emit('result', command='export', output=os.path.abspath(args.output), faces=len(rows),
+             persons=sum(1 for person_id in person_names if person_id > 0))
+    return EXIT_OK
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Face Recognition Photo Organizer, headless')
+    parser.add_argument('--data-dir', help='Folder with the database and settings (default: the app data folder)')
+    parser.add_argument('--verbose', action='store_true', help='Also print per-file detail events')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    scan = subparsers.add_parser('scan', help='Scan the configured folders for new photos')
+    scan.add_argument('--add-folder', action='append', metavar='PATH',
+                      help='Add a folder to the folders to scan (saved in the settings)')
+    scan.add_argument('--mode', choices=['threads', 'processes'], help='Scan mode for this run')
+    scan.add_argument('--workers', type=int, help='Worker processes for --mode processes')
+    scan.add_argument('--precision', choices=['fp32', 'int8_recognition', 'int8'],
+                      help='Face model precision for this run (default: from the settings)')
+    scan.add_argument('--det-size', type=int, choices=[320, 480, 640, 800, 960],
+                      help='Face detector input size for this run (default: from the settings)')
+    scan.add_argument('--screening', action='store_true',
+                      help='Check photos for faces with the small detector before the full one')
+    scan.add_argument('--background', action='store_true',
+                      help='Run at low priority within the background CPU budget from the settings')
+    scan.add_argument('--no-cluster', action='store_true', help='Do not recalibrate after the scan')
+
+    watch = subparsers.add_parser('watch', help='Keep running and scan photos as they are added, changed or deleted')
+    watch.add_argument('--background', action='store_true',
+                       help='Run at low priority within the background CPU budget from the settings')
+    watch.add_argument('--no-cluster', action='store_true', help='Do not recalibrate after changes')
+
+    cluster = subparsers.add_parser('cluster', help='Group the scanned faces into persons')
+    cluster.add_argument('--threshold', type=float, help='Similarity threshold in percent (default: from the settings)')
+
+    subparsers.add_parser('stats', help='Print library statistics')
+
+    export = subparsers.add_parser('export', help='Export the faces of the current clustering as CSV')
+    export.add_argument('output', help='CSV file to write')
+
+    storage = subparsers.add_parser('storage', help='Show or change where face embeddings are stored')
+    storage.add_argument('--to', choices=EMBEDDING_STORAGES,
+                         help='Move the stored embeddings to this storage and use it from now on')
+    storage.add_argument('--format', choices=EMBEDDING_FORMATS,
+                         help='Precision embeddings are stored and clustered in (float16 halves, int8 quarters '
+                              'the memory); the matrix storage keeps float32 on disk')
+
+    compact = subparsers.add_parser('compact', help='Remove orphaned data and old clusterings, give back free space')
+    compact.add_argument('--keep-clusterings', type=int, default=KEEP_CLUSTERINGS,
+                         help='Clusterings to keep, the active one included')
+    compact.add_argument('--vacuum', action='store_true', help='Also rebuild the SQLite database file (VACUUM)')
+    compact.add_argument('--compact-embeddings', action='store_true',
+                         help='Also rewrite the embedding store without its free space')
+
+    return parser
+
+
+COMMANDS = {
+    'scan': command_scan,
+    'watch': command_watch,
+    'cluster': command_cluster,
+    'stats': command_stats,
+    'export': command_export,
+    'storage': command_storage,
+    'compact': command_compact,
+}
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+
+    # stdout carries the JSON lines; everything the app prints on the way goes to stderr
+    out = sys.stdout
+    sys.stdout = sys.stderr
+
+    data_path = Path(args.data_dir) if args.data_dir else get_appdata_path()
+    settings = Settings(str(data_path))
+    db = FaceDatabase(str(data_path), settings.get('embedding_storage', 'lmdb'),
+                      settings.get('embedding_format', 'float32'))
+
+    overrides = {}
+    if getattr(args, 'mode', None):
+        overrides['scan_mode'] = args.mode
+    if getattr(args, 'workers', None):
+        overrides['scan_process_workers'] = args.workers
+    if getattr(args, 'precision', None):
+        overrides['model_precision'] = args.precision
+    if getattr(args, 'det_size', None):
+        overrides['det_size'] = args.det_size
+    if getattr(args, 'screening', False):
+        overrides['screening_enabled'] = True
+
+    api = HeadlessAPI(settings, db, out, background=getattr(args, 'background', False), overrides=overrides,
+                      verbose=args.verbose, log=create_file_log(data_path.parent / "logs"))
+    try:
+        return COMMANDS[args.command](args, settings, db, api)
+    except KeyboardInterrupt:
+        return EXIT_INTERRUPTED
+    except Exception as e:
+        api.update_status(f"ERROR: {str(e)}")
+        return EXIT_FAILED
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -1,15 +1,85 @@
+import os
 import sqlite3
-import lmdb
-import pickle
+import json
 import threading
 from pathlib import Path
-from typing import List, Optional, Tuple, Set, Dict
+from typing import Iterator, List, Optional, Tuple, Set, Dict
 from collections import Counter
 import numpy as np
 
+from embedding_store import EmbeddingStore, LmdbEmbeddingStore, SqliteEmbeddingStore
+from embedding_matrix import EmbeddingMatrix
+from embedding_cache import EmbeddingCache
+from embedding_codec import EMBEDDING_FORMATS
+
+
+EMBEDDING_STORAGES = ['lmdb', 'sqlite', 'matrix']
+EMBEDDING_STORE_PATHS = {'lmdb': "encodings.lmdb", 'sqlite': "embeddings.db", 'matrix': "embeddings_matrix"}
+# Faces decoded per step when loading all embeddings, bounding the raw values held at once
+EMBEDDING_CHUNK_ROWS = 65536
+# Clusterings compact_storage keeps, the active one included
+KEEP_CLUSTERINGS = 3
+# A rescanned face inherits the tags of an old face of the same photo whose box overlaps it
+# at least this much (intersection over union), or failing that whose embedding is this similar
+FACE_MATCH_IOU = 0.5
+FACE_MATCH_SIMILARITY = 0.5
+
+
+def _match_faces(old_faces: List[tuple], new_faces: List[tuple]) -> List[Tuple[int, int]]:
+    """(old, new) face id pairs of the same face, from (face_id, bbox, embedding or None) tuples"""
+    pairs = []
+    if not old_faces or not new_faces:
+        return pairs
+    
+    old_boxes = np.array([bbox for _, bbox, _ in old_faces], dtype=np.float64)
+    new_boxes = np.array([bbox for _, bbox, _ in new_faces], dtype=np.float64)
+    width = np.minimum(old_boxes[:, None, 2], new_boxes[None, :, 2]) - np.maximum(old_boxes[:, None, 0], new_boxes[None, :, 0])
+    height = np.minimum(old_boxes[:, None, 3], new_boxes[None, :, 3]) - np.maximum(old_boxes[:, None, 1], new_boxes[None, :, 1])
+    intersection = np.clip(width, 0, None) * np.clip(height, 0, None)
+    old_areas = (old_boxes[:, 2] - old_boxes[:, 0]) * (old_boxes[:, 3] - old_boxes[:, 1])
+    new_areas = (new_boxes[:, 2] - new_boxes[:, 0]) * (new_boxes[:, 3] - new_boxes[:, 1])
+    union = old_areas[:, None] + new_areas[None, :] - intersection
+    iou = np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+    
+    similarity = np.full(iou.shape, -1.0)
+    for i, (_, _, old_embedding) in enumerate(old_faces):
+        for j, (_, _, new_embedding) in enumerate(new_faces):
+            if old_embedding is not None and new_embedding is not None:
+                norms = np.linalg.norm(old_embedding) * np.linalg.norm(new_embedding)
+                if norms > 0:
+                    similarity[i, j] = float(np.dot(old_embedding, new_embedding) / norms)
+    
+    # Greedy, best pairs first: boxes, then embeddings for faces a crop or resize moved
+    matched_old, matched_new = set(), set()
+    for scores, minimum in ((iou, FACE_MATCH_IOU), (similarity, FACE_MATCH_SIMILARITY)):
+        for flat in np.argsort(-scores, axis=None, kind='stable').tolist():
+            i, j = divmod(flat, scores.shape[1])
+            if scores[i, j] < minimum:
+                break
+            if i in matched_old or j in matched_new:
+                continue
+            matched_old.add(i)
+            matched_new.add(j)
+            pairs.append((old_faces[i][0], new_faces[j][0]))
+    return pairs
+
+
+def embedding_store_path(storage: str, db_folder: Path) -> Path:
+    return Path(db_folder) / EMBEDDING_STORE_PATHS[storage]
+
+
+def open_embedding_store(storage: str, db_folder: Path, embedding_format: str = 'float32') -> EmbeddingStore:
+    path = embedding_store_path(storage, db_folder)
+    if storage == 'matrix':
+        return EmbeddingMatrix(path)
+    if storage == 'sqlite':
+        return SqliteEmbeddingStore(path, embedding_format)
+    return LmdbEmbeddingStore(path, embedding_format)
+
 
 class FaceDatabase:
-    def __init__(self, db_folder: str):
+    def __init__(self, db_folder: str, embedding_storage: Optional[str] = None,
+                 embedding_format: Optional[str] = None):
         self.db_folder = Path(db_folder)
         self.db_folder.mkdir(parents=True, exist_ok=True)
         
@@ -19,19 +89,16 @@ class FaceDatabase:
         
         self.conn = self._create_connection()
         
-        self.lmdb_path = self.db_folder / "encodings.lmdb"
-        self.env = lmdb.open(
-            str(self.lmdb_path),
-            map_size=10*1024*1024*1024,
-            max_dbs=1,
-            readahead=True,
-            metasync=False,
-            sync=False,
-            writemap=True
-        )
+        self.store = None
+        self.embedding_cache = EmbeddingCache()
         
         self._init_tables()
         self._temp_table_counter = 0
+        # The format the stored values are in, until set_embedding_format switches it
+        self.embedding_format = self.get_scan_state('embedding_format', 'float32')
+        # None keeps the storage and format the library is in; only an explicit one migrates
+        self.set_embedding_storage(embedding_storage or self.get_scan_state('embedding_storage', 'lmdb'))
+        self.set_embedding_format(embedding_format or self.embedding_format)
         
         self._cache = {
             'active_clustering': None,
@@ -51,6 +118,7 @@ class FaceDatabase:
             PRAGMA temp_store = MEMORY;
             PRAGMA mmap_size = 268435456;
             PRAGMA page_size = 4096;
+            PRAGMA journal_size_limit = 67108864;
         ''')
         conn.commit()
         
@@ -69,6 +137,12 @@ class FaceDatabase:
                 photo_id INTEGER PRIMARY KEY AUTOINCREMENT,
                 file_path TEXT UNIQUE NOT NULL,
                 file_hash TEXT,
+                hash_version INTEGER DEFAULT 1,
+                file_size INTEGER,
+                width INTEGER,
+                height INTEGER,
+                orientation INTEGER,
+                file_mtime REAL,
                 scan_status TEXT DEFAULT 'pending',
                 date_added REAL DEFAULT (julianday('now'))
             )
@@ -82,6 +156,10 @@ class FaceDatabase:
                 bbox_y1 REAL,
                 bbox_x2 REAL,
                 bbox_y2 REAL,
+                landmarks BLOB,
+                det_score REAL,
+                model_version TEXT,
+                is_filtered INTEGER DEFAULT 0,
                 FOREIGN KEY (photo_id) REFERENCES photos(photo_id)
             )
         ''')
@@ -144,6 +222,34 @@ class FaceDatabase:
             )
         ''')
         
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS directory_index (
+                dir_path TEXT PRIMARY KEY,
+                mtime REAL,
+                entry_count INTEGER,
+                subdirs TEXT,
+                image_files TEXT,
+                indexed_at REAL DEFAULT (julianday('now'))
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS scan_queue (
+                file_path TEXT PRIMARY KEY,
+                priority REAL DEFAULT 0,
+                state TEXT DEFAULT 'queued',
+                is_new INTEGER DEFAULT 1,
+                queued_at REAL DEFAULT (julianday('now'))
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS scan_state (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        ''')
+        
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_photos_status ON photos(scan_status)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_photos_path ON photos(file_path)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_photos_hash ON photos(file_hash)')
@@ -155,10 +261,16 @@ class FaceDatabase:
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_face_tags_name ON face_tags(tag_name)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_face_tags_combined ON face_tags(tag_name, face_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_tag_primary_photos ON tag_primary_photos(tag_name)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_scan_queue_priority ON scan_queue(state, priority DESC)')
         
         self.conn.commit()
         
         self._migrate_add_is_manual_column(cursor)
+        self._migrate_add_hash_version_column(cursor)
+        self._migrate_add_file_size_column(cursor)
+        self._migrate_add_photo_metadata_columns(cursor)
+        self._migrate_add_face_detection_columns(cursor)
+        self._migrate_add_is_filtered_column(cursor)
     
     def _migrate_add_is_manual_column(self, cursor):
         try:
@@ -173,6 +285,79 @@ class FaceDatabase:
         except Exception as e:
             print(f"Migration error (non-critical): {e}")
     
+    def _migrate_add_hash_version_column(self, cursor):
+        try:
+            cursor.execute("PRAGMA table_info(photos)")
+            columns = [row[1] for row in cursor.fetchall()]
+            
+            if 'hash_version' not in columns:
+                print("Migrating database: Adding 'hash_version' column to photos...")
+                cursor.execute('ALTER TABLE photos ADD COLUMN hash_version INTEGER DEFAULT 1')
+                self.conn.commit()
+                print("Migration complete: 'hash_version' column added")
+        except Exception as e:
+            print(f"Migration error (non-critical): {e}")
+    
+    def _migrate_add_file_size_column(self, cursor):
+        try:
+            cursor.execute("PRAGMA table_info(photos)")
+            columns = [row[1] for row in cursor.fetchall()]
+            
+            if 'file_size' not in columns:
+                print("Migrating database: Adding 'file_size' column to photos...")
+                cursor.execute('ALTER TABLE photos ADD COLUMN file_size INTEGER')
+                self.conn.commit()
+                print("Migration complete: 'file_size' column added")
+        except Exception as e:
+            print(f"Migration error (non-critical): {e}")
+    
+    def _migrate_add_photo_metadata_columns(self, cursor):
+        try:
+            cursor.execute("PRAGMA table_info(photos)")
+            columns = [row[1] for row in cursor.fetchall()]
+            
+            new_columns = [('width', 'INTEGER'), ('height', 'INTEGER'), ('orientation', 'INTEGER'), ('file_mtime', 'REAL')]
+            missing = [(name, col_type) for name, col_type in new_columns if name not in columns]
+            
+            if missing:
+                print("Migrating database: Adding photo metadata columns to photos...")
+                for name, col_type in missing:
+                    cursor.execute(f'ALTER TABLE photos ADD COLUMN {name} {col_type}')
+                self.conn.commit()
+                print("Migration complete: metadata columns added, existing rows are filled in lazily")
+        except Exception as e:
+            print(f"Migration error (non-critical): {e}")
+    
+    def _migrate_add_face_detection_columns(self, cursor):
+        try:
+            cursor.execute("PRAGMA table_info(faces)")
+            columns = [row[1] for row in cursor.fetchall()]
+            
+            new_columns = [('landmarks', 'BLOB'), ('det_score', 'REAL'), ('model_version', 'TEXT')]
+            missing = [(name, col_type) for name, col_type in new_columns if name not in columns]
+            
+            if missing:
+                print("Migrating database: Adding landmark, detection score and model version columns to faces...")
+                for name, col_type in missing:
+                    cursor.execute(f'ALTER TABLE faces ADD COLUMN {name} {col_type}')
+                self.conn.commit()
+                print("Migration complete: face detection columns added")
+        except Exception as e:
+            print(f"Migration error (non-critical): {e}")
+    
+    def _migrate_add_is_filtered_column(self, cursor):
+        try:
+            cursor.execute("PRAGMA table_info(faces)")
+            columns = [row[1] for row in cursor.fetchall()]
+            
+            if 'is_filtered' not in columns:
+                print("Migrating database: Adding 'is_filtered' column to faces...")
+                cursor.execute('ALTER TABLE faces ADD COLUMN is_filtered INTEGER DEFAULT 0')
+                self.conn.commit()
+                print("Migration complete: 'is_filtered' column added")
+        except Exception as e:
+            print(f"Migration error (non-critical): {e}")
+    
     def _get_temp_table_name(self) -> str:
         self._temp_table_counter += 1
         return f"temp_ids_{self._temp_table_counter}"
@@ -228,13 +413,14 @@ class FaceDatabase:
             except Exception as e:
                 print(f"Warning: Failed to drop temp table {temp_table}: {e}")
     
-    def add_photo(self, file_path: str, file_hash: str) -> Optional[int]:
+    def add_photo(self, file_path: str, file_hash: str, hash_version: int = 1,
+                  file_size: Optional[int] = None) -> Optional[int]:
         cursor = self.conn.cursor()
         try:
             cursor.execute('''
-                INSERT OR IGNORE INTO photos (file_path, file_hash)
-                VALUES (?, ?)
-            ''', (file_path, file_hash))
+                INSERT OR IGNORE INTO photos (file_path, file_hash, hash_version, file_size)
+                VALUES (?, ?, ?, ?)
+            ''', (file_path, file_hash, hash_version, file_size))
             self.conn.commit()
             
             if cursor.lastrowid:
@@ -246,6 +432,45 @@ class FaceDatabase:
             self.conn.rollback()
             return None
     
+    def get_photo_metadata(self, photo_id: int) -> Optional[dict]:
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT photo_id, file_path, file_size, width, height, orientation, file_mtime
+            FROM photos WHERE photo_id = ?
+        ''', (photo_id,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+    
+    def update_photo_metadata(self, photo_id: int, width: Optional[int] = None, height: Optional[int] = None,
+                              orientation: Optional[int] = None, file_mtime: Optional[float] = None,
+                              file_size: Optional[int] = None):
+        """Fill in metadata of rows scanned before it was captured; None leaves a column unchanged"""
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute('''
+                UPDATE photos SET
+                    width = COALESCE(?, width),
+                    height = COALESCE(?, height),
+                    orientation = COALESCE(?, orientation),
+                    file_mtime = COALESCE(?, file_mtime),
+                    file_size = COALESCE(?, file_size)
+                WHERE photo_id = ?
+            ''', (width, height, orientation, file_mtime, file_size, photo_id))
+            self.conn.commit()
+        except Exception as e:
+            print(f"Database error in update_photo_metadata: {e}")
+            self.conn.rollback()
+    
+    def update_photo_mtimes(self, mtimes: List[Tuple[str, float]]):
+        cursor = self.conn.cursor()
+        try:
+            cursor.executemany('UPDATE photos SET file_mtime = ? WHERE file_path = ?',
+                               [(mtime, file_path) for file_path, mtime in mtimes])
+            self.conn.commit()
+        except Exception as e:
+            print(f"Database error in update_photo_mtimes: {e}")
+            self.conn.rollback()
+    
     def get_photo_id(self, file_path: str) -> Optional[int]:
         cursor = self.conn.cursor()
         cursor.execute('SELECT photo_id FROM photos WHERE file_path = ?', (file_path,))
@@ -265,6 +490,209 @@ class FaceDatabase:
         ''')
         return [row[0] for row in cursor.fetchall()]
     
+    def get_all_photo_paths(self) -> Set[str]:
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT file_path FROM photos')
+        return {row[0] for row in cursor.fetchall()}
+    
+    def get_missing_photos(self, existing_paths: Set[str]) -> List[dict]:
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT photo_id, file_path, file_hash, hash_version, file_size FROM photos')
+        return [dict(row) for row in cursor.fetchall() if row['file_path'] not in existing_paths]
+    
+    def get_photos_without_size(self) -> List[Tuple[int, str]]:
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT photo_id, file_path FROM photos WHERE file_size IS NULL')
+        return [(row[0], row[1]) for row in cursor.fetchall()]
+    
+    def set_photo_sizes(self, sizes: List[Tuple[int, int]]) -> int:
+        if not sizes:
+            return 0
+        
+        cursor = self.conn.cursor()
+        try:
+            cursor.executemany('UPDATE photos SET file_size = ? WHERE photo_id = ?',
+                               [(file_size, photo_id) for photo_id, file_size in sizes])
+            self.conn.commit()
+            return len(sizes)
+        except Exception as e:
+            print(f"Database error in set_photo_sizes: {e}")
+            self.conn.rollback()
+            return 0
+    
+    def relocate_photos(self, moves: List[Tuple[int, str, Optional[int]]]) -> int:
+        if not moves:
+            return 0
+        
+        # Also called by the folder watcher thread, so it must not share the writer's transaction
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.executemany('''
+                UPDATE photos SET file_path = ?, file_size = COALESCE(?, file_size), file_mtime = NULL
+                WHERE photo_id = ?
+            ''', [(new_path, file_size, photo_id) for photo_id, new_path, file_size in moves])
+            conn.commit()
+            return len(moves)
+        except Exception as e:
+            print(f"Database error in relocate_photos: {e}")
+            conn.rollback()
+            return 0
+    
+    def get_directory_index(self) -> Dict[str, dict]:
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT dir_path, mtime, entry_count, subdirs, image_files FROM directory_index')
+        
+        index = {}
+        for row in cursor.fetchall():
+            try:
+                index[row[0]] = {
+                    'mtime': row[1],
+                    'entry_count': row[2],
+                    'subdirs': json.loads(row[3]) if row[3] else [],
+                    'image_files': json.loads(row[4]) if row[4] else []
+                }
+            except ValueError:
+                continue
+        return index
+    
+    def save_directory_index(self, entries: List[dict], visited_dirs: Set[str]):
+        cursor = self.conn.cursor()
+        try:
+            cursor.executemany('''
+                INSERT OR REPLACE INTO directory_index (dir_path, mtime, entry_count, subdirs, image_files)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(e['dir_path'], e['mtime'], e['entry_count'],
+                   json.dumps(e['subdirs']), json.dumps(e['image_files'])) for e in entries])
+            
+            cursor.execute('SELECT dir_path FROM directory_index')
+            stale = [(row[0],) for row in cursor.fetchall() if row[0] not in visited_dirs]
+            if stale:
+                cursor.executemany('DELETE FROM directory_index WHERE dir_path = ?', stale)
+            
+            self.conn.commit()
+        except Exception as e:
+            print(f"Database error in save_directory_index: {e}")
+            self.conn.rollback()
+    
+    def get_scan_state(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT value FROM scan_state WHERE key = ?', (key,))
+        row = cursor.fetchone()
+        return row[0] if row else default
+    
+    def set_scan_state(self, key: str, value: Optional[str]):
+        cursor = self.conn.cursor()
+        if value is None:
+            cursor.execute('DELETE FROM scan_state WHERE key = ?', (key,))
+        else:
+            cursor.execute('INSERT OR REPLACE INTO scan_state (key, value) VALUES (?, ?)', (key, value))
+        self.conn.commit()
+    
+    def replace_scan_queue(self, entries: List[Tuple[str, float, bool]]):
+        """Replace the queue with (file_path, priority, is_new) entries and record that discovery finished"""
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute('DELETE FROM scan_queue')
+            cursor.executemany('''
+                INSERT OR REPLACE INTO scan_queue (file_path, priority, is_new)
+                VALUES (?, ?, ?)
+            ''', [(path, priority, 1 if is_new else 0) for path, priority, is_new in entries])
+            cursor.execute('''
+                INSERT OR REPLACE INTO scan_state (key, value) VALUES ('queue_discovery_complete', '1')
+            ''')
+            self.conn.commit()
+        except Exception as e:
+            print(f"Database error in replace_scan_queue: {e}")
+            self.conn.rollback()
+    
+    def add_to_scan_queue(self, entries: List[Tuple[str, float, bool]]) -> int:
+        """Add (file_path, priority, is_new) entries found without a discovery walk, e.g. by the folder watcher"""
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.executemany('''
+                INSERT OR IGNORE INTO scan_queue (file_path, priority, is_new)
+                VALUES (?, ?, ?)
+            ''', [(path, priority, 1 if is_new else 0) for path, priority, is_new in entries])
+            added = cursor.rowcount
+            # queue_discovery_complete is left to discovery: a queue of only these entries must not
+            # let the next start resume it in place of a full scan
+            conn.commit()
+            return added
+        except Exception as e:
+            print(f"Database error in add_to_scan_queue: {e}")
+            conn.rollback()
+            return 0
+    
+    def has_resumable_scan_queue(self) -> bool:
+        return self.get_scan_state('queue_discovery_complete') == '1' and self.get_scan_queue_size() > 0
+    
+    def get_scan_queue_size(self) -> int:
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM scan_queue')
+        return cursor.fetchone()[0]
+    
+    def get_scan_queue_paths(self) -> List[str]:
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT file_path FROM scan_queue')
+        return [row[0] for row in cursor.fetchall()]
+    
+    def get_scan_queue_new_count(self) -> int:
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM scan_queue WHERE is_new = 1')
+        return cursor.fetchone()[0]
+    
+    def release_claimed_scan_queue(self) -> int:
+        """Put entries claimed by an interrupted scan back in the queue"""
+        cursor = self.conn.cursor()
+        cursor.execute("UPDATE scan_queue SET state = 'queued' WHERE state = 'claimed'")
+        self.conn.commit()
+        return cursor.rowcount
+    
+    def claim_scan_queue_batch(self, limit: int) -> Optional[List[Tuple[str, bool]]]:
+        """Claim the highest priority queued paths, None if that failed; safe to call from a pipeline thread"""
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+                SELECT file_path, is_new FROM scan_queue
+                WHERE state = 'queued'
+                ORDER BY priority DESC
+                LIMIT ?
+            ''', (limit,))
+            rows = [(row[0], bool(row[1])) for row in cursor.fetchall()]
+            cursor.executemany("UPDATE scan_queue SET state = 'claimed' WHERE file_path = ?",
+                               [(path,) for path, _ in rows])
+            conn.commit()
+            return rows
+        except Exception as e:
+            print(f"Database error in claim_scan_queue_batch: {e}")
+            conn.rollback()
+            return None
+    
+    def remove_from_scan_queue(self, file_paths: List[str]):
+        cursor = self.conn.cursor()
+        cursor.executemany('DELETE FROM scan_queue WHERE file_path = ?', [(path,) for path in file_paths])
+        self.conn.commit()
+    
+    def finish_scan_queue(self):
+        """Forget the finished discovery once nothing is left to scan"""
+        if self.get_scan_queue_size() == 0:
+            self.set_scan_state('queue_discovery_complete', None)
+    
+    def prioritize_scan_folder(self, folder: str, boost: float = 1e12) -> int:
+        """Move queued photos under a folder ahead of the rest (regular priorities are file mtimes)"""
+        folder_prefix = os.path.join(os.path.normpath(folder), '')
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE scan_queue SET priority = priority + ?
+            WHERE state = 'queued' AND priority < ? AND substr(file_path, 1, ?) = ?
+        ''', (boost, boost, len(folder_prefix), folder_prefix))
+        conn.commit()
+        return cursor.rowcount
+    
     def remove_deleted_photos(self, existing_paths: Set[str]) -> int:
         cursor = self.conn.cursor()
         cursor.execute('SELECT photo_id, file_path FROM photos')
@@ -277,30 +705,134 @@ class FaceDatabase:
                 deleted_photo_ids.append(photo_id)
                 deleted_count += 1
         
+        deleted_face_ids = self._delete_photos(cursor, deleted_photo_ids)
+        self.conn.commit()
+        self._delete_embeddings(deleted_face_ids)
+        return deleted_count
+    
+    def get_photo_states(self, file_paths: List[str]) -> Dict[str, dict]:
+        """photo_id, scan_status, file hash, size and mtime of the given paths that are in the database"""
+        cursor = self._get_connection().cursor()
+        states = {}
+        for i in range(0, len(file_paths), 900):
+            batch = file_paths[i:i + 900]
+            cursor.execute(f'''
+                SELECT photo_id, file_path, scan_status, file_hash, hash_version, file_size, file_mtime
+                FROM photos WHERE file_path IN ({','.join('?' * len(batch))})
+            ''', batch)
+            for row in cursor.fetchall():
+                states[row['file_path']] = dict(row)
+        return states
+    
+    def update_photo_stats(self, stats: List[Tuple[int, int, float]]):
+        """Record the (photo_id, file_size, file_mtime) of photos whose content did not change"""
+        conn = self._get_connection()
+        try:
+            conn.executemany('UPDATE photos SET file_size = ?, file_mtime = ? WHERE photo_id = ?',
+                             [(file_size, file_mtime, photo_id) for photo_id, file_size, file_mtime in stats])
+            conn.commit()
+        except Exception as e:
+            print(f"Database error in update_photo_stats: {e}")
+            conn.rollback()
+    
+    def mark_photos_for_rescan(self, file_paths: List[str]):
+        """Let ingest_batch rescan completed photos; their faces stay until the rescan replaces them"""
+        conn = self._get_connection()
+        try:
+            conn.executemany("UPDATE photos SET scan_status = 'pending' WHERE file_path = ?",
+                             [(path,) for path in file_paths])
+            conn.commit()
+        except Exception as e:
+            print(f"Database error in mark_photos_for_rescan: {e}")
+            conn.rollback()
+    
+    def remove_photos(self, file_paths: List[str]) -> int:
+        """Delete photos by path, with their faces and tags, and drop them from the scan queue"""
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        try:
+            photo_ids = [state['photo_id'] for state in self.get_photo_states(file_paths).values()]
+            deleted_face_ids = self._delete_photos(cursor, photo_ids)
+            cursor.executemany('DELETE FROM scan_queue WHERE file_path = ?', [(path,) for path in file_paths])
+            conn.commit()
+            self._delete_embeddings(deleted_face_ids)
+            return len(photo_ids)
+        except Exception as e:
+            print(f"Database error in remove_photos: {e}")
+            conn.rollback()
+            return 0
+    
+    def remove_photos_under(self, folder: str) -> int:
+        folder_prefix = os.path.join(os.path.normpath(folder), '')
+        cursor = self._get_connection().cursor()
+        cursor.execute('SELECT file_path FROM photos WHERE substr(file_path, 1, ?) = ?',
+                       (len(folder_prefix), folder_prefix))
+        file_paths = [row[0] for row in cursor.fetchall()]
+        cursor.execute('SELECT file_path FROM scan_queue WHERE substr(file_path, 1, ?) = ?',
+                       (len(folder_prefix), folder_prefix))
+        file_paths.extend(row[0] for row in cursor.fetchall())
+        return self.remove_photos(file_paths)
+    
+    def relocate_folder(self, old_folder: str, new_folder: str) -> int:
+        """Point every photo under a moved or renamed folder at its new path"""
+        old_prefix = os.path.join(os.path.normpath(old_folder), '')
+        new_prefix = os.path.join(os.path.normpath(new_folder), '')
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+                UPDATE photos SET file_path = ? || substr(file_path, ?)
+                WHERE substr(file_path, 1, ?) = ?
+            ''', (new_prefix, len(old_prefix) + 1, len(old_prefix), old_prefix))
+            moved = cursor.rowcount
+            cursor.execute('''
+                UPDATE OR REPLACE scan_queue SET file_path = ? || substr(file_path, ?)
+                WHERE substr(file_path, 1, ?) = ?
+            ''', (new_prefix, len(old_prefix) + 1, len(old_prefix), old_prefix))
+            conn.commit()
+            return moved
+        except Exception as e:
+            print(f"Database error in relocate_folder: {e}")
+            conn.rollback()
+            return 0
+    
+    def _delete_photos(self, cursor, deleted_photo_ids: List[int]) -> List[int]:
+        """Delete photo and face rows; returns the face ids, whose embeddings the caller deletes after commit"""
+        deleted_face_ids = []
         if deleted_photo_ids:
             cursor.execute(f'SELECT face_id FROM faces WHERE photo_id IN ({",".join("?" * len(deleted_photo_ids))})', deleted_photo_ids)
             deleted_face_ids = [row[0] for row in cursor.fetchall()]
             
-            if deleted_face_ids:
-                self._execute_with_temp_table(
-                    cursor, deleted_face_ids,
-                    'DELETE FROM face_tags WHERE face_id IN (SELECT id FROM {temp_table})'
-                )
-                self._execute_with_temp_table(
-                    cursor, deleted_face_ids,
-                    'DELETE FROM tag_primary_photos WHERE face_id IN (SELECT id FROM {temp_table})'
-                )
-                self._execute_with_temp_table(
-                    cursor, deleted_face_ids,
-                    'DELETE FROM hidden_photos WHERE face_id IN (SELECT id FROM {temp_table})'
-                )
+            self._delete_faces(cursor, deleted_face_ids)
             
             placeholders = ','.join('?' * len(deleted_photo_ids))
-            cursor.execute(f'DELETE FROM faces WHERE photo_id IN ({placeholders})', deleted_photo_ids)
             cursor.execute(f'DELETE FROM photos WHERE photo_id IN ({placeholders})', deleted_photo_ids)
-        
-        self.conn.commit()
-        return deleted_count
+        return deleted_face_ids
+    
+    def _delete_faces(self, cursor, face_ids: List[int]):
+        """Delete face rows with their tags; the caller deletes the embeddings after commit"""
+        if not face_ids:
+            return
+        for table in ('face_tags', 'tag_primary_photos', 'hidden_photos', 'faces'):
+            self._execute_with_temp_table(
+                cursor, face_ids,
+                f'DELETE FROM {table} WHERE face_id IN (SELECT id FROM {{temp_table}})'
+            )
+        self._bump_write_generation(cursor)
+    
+    def _replace_faces(self, cursor, old_faces: List[tuple], new_faces: List[tuple]) -> List[int]:
+        """Move the tags of a rescanned photo's old faces onto the matching new ones, then delete the old faces"""
+        old_ids = [face_id for face_id, _, _ in old_faces]
+        found_ids, embeddings = self.store.get_many(old_ids)
+        old_embeddings = dict(zip(found_ids, embeddings))
+        old_faces = [(face_id, bbox, old_embeddings.get(face_id)) for face_id, bbox, _ in old_faces]
+        
+        for old_id, new_id in _match_faces(old_faces, new_faces):
+            for table in ('face_tags', 'tag_primary_photos', 'hidden_photos'):
+                cursor.execute(f'UPDATE {table} SET face_id = ? WHERE face_id = ?', (new_id, old_id))
+        
+        self._delete_faces(cursor, old_ids)
+        return old_ids
     
     def get_photos_needing_scan(self) -> int:
         cursor = self.conn.cursor()
@@ -310,47 +842,256 @@ class FaceDatabase:
         ''')
         return cursor.fetchone()[0]
     
+    def set_embedding_storage(self, storage: str) -> int:
+        """Switch the embedding store ('lmdb', 'sqlite' or 'matrix'), moving the stored embeddings over"""
+        if storage not in EMBEDDING_STORAGES:
+            storage = 'lmdb'
+        current = self.get_scan_state('embedding_storage', 'lmdb')
+        if self.store is None:
+            self.store = open_embedding_store(current, self.db_folder, self.embedding_format)
+        
+        moved = 0
+        if current != storage:
+            target = open_embedding_store(storage, self.db_folder, self.embedding_format)
+            moved = self._migrate_embeddings(self.store, target)
+            self.set_scan_state('embedding_storage', storage)
+            # The source is only removed once everything is in the target
+            self.store.remove()
+            self.store = target
+        return moved
+    
+    def get_embedding_storage(self) -> str:
+        return self.store.name
+    
+    def set_embedding_format(self, embedding_format: str) -> int:
+        """Re-encode the stored embeddings as 'float32', 'float16' or 'int8' (the matrix store keeps float32)"""
+        if embedding_format not in EMBEDDING_FORMATS:
+            embedding_format = 'float32'
+        current = self.get_scan_state('embedding_format', 'float32')
+        self.embedding_format = embedding_format
+        
+        converted = 0
+        if current != embedding_format:
+            print(f"Storing embeddings as {embedding_format}...")
+            converted = self.store.reencode(embedding_format)
+            self.set_scan_state('embedding_format', embedding_format)
+            self.embedding_cache.clear()
+            print(f"Stored {converted} embeddings as {embedding_format}")
+        return converted
+    
+    def get_embedding_format(self) -> str:
+        return self.embedding_format
+    
+    def _migrate_embeddings(self, source: EmbeddingStore, target: EmbeddingStore) -> int:
+        print(f"Moving embeddings to {target.name} storage...")
+        # Left over from an interrupted move
+        target.clear()
+        moved = 0
+        for face_ids, embeddings in source.iter_all():
+            moved += target.put_many(face_ids.tolist(), embeddings)
+        print(f"Moved {moved} embeddings to {target.name} storage")
+        return moved
+    
+    def _put_embeddings(self, embeddings: List[Tuple[int, np.ndarray]]):
+        if not embeddings:
+            return
+        self.store.put_many([face_id for face_id, _ in embeddings], np.vstack([e for _, e in embeddings]))
+    
+    def _delete_embeddings(self, face_ids: List[int]):
+        if not face_ids:
+            return
+        try:
+            self.store.delete_many(face_ids)
+        except Exception as e:
+            print(f"Warning: Failed to delete embeddings: {e}")
+    
     def add_face(self, photo_id: int, embedding: np.ndarray, bbox: List[float]) -> int:
         cursor = self.conn.cursor()
         cursor.execute('''
             INSERT INTO faces (photo_id, bbox_x1, bbox_y1, bbox_x2, bbox_y2) 
             VALUES (?, ?, ?, ?, ?)
         ''', (photo_id, bbox[0], bbox[1], bbox[2], bbox[3]))
-        self.conn.commit()
         face_id = cursor.lastrowid
+        self._bump_write_generation(cursor)
+        self.conn.commit()
         
-        with self.env.begin(write=True) as txn:
-            key = str(face_id).encode()
-            value = pickle.dumps(embedding)
-            txn.put(key, value)
+        self._put_embeddings([(face_id, embedding)])
         
         return face_id
     
-    def get_face_embedding(self, face_id: int) -> Optional[np.ndarray]:
-        with self.env.begin() as txn:
-            key = str(face_id).encode()
-            value = txn.get(key)
-            if value:
-                return pickle.loads(value)
-        return None
+    def ingest_batch(self, photos: List[dict]) -> Optional[List[int]]:
+        """Write scanned photos with their faces and embeddings, all or nothing; returns the photo ids written"""
+        cursor = self.conn.cursor()
+        written_photo_ids = []
+        embeddings = []
+        replaced_face_ids = []
+        embeddings_committed = False
+        
+        try:
+            for photo in photos:
+                cursor.execute('''
+                    INSERT OR IGNORE INTO photos (file_path, file_hash, hash_version, file_size)
+                    VALUES (?, ?, ?, ?)
+                ''', (photo['file_path'], photo.get('file_hash'), photo.get('hash_version'), photo.get('file_size')))
+                
+                cursor.execute('SELECT photo_id, scan_status FROM photos WHERE file_path = ?', (photo['file_path'],))
+                row = cursor.fetchone()
+                if row is None or row['scan_status'] == 'completed':
+                    continue
+                photo_id = row['photo_id']
+                
+                # A photo that could not be read keeps its hash and faces, and is retried as an error
+                if not photo.get('file_hash'):
+                    cursor.execute("UPDATE photos SET scan_status = 'error' WHERE photo_id = ?", (photo_id,))
+                    written_photo_ids.append(photo_id)
+                    continue
+                
+                # A photo edited in place is rescanned: its new faces replace the old ones
+                cursor.execute('''
+                    SELECT face_id, bbox_x1, bbox_y1, bbox_x2, bbox_y2 FROM faces WHERE photo_id = ?
+                ''', (photo_id,))
+                old_faces = [(row[0], tuple(row[1:5]), None) for row in cursor.fetchall()]
+                new_faces = []
+                
+                for face in photo['faces']:
+                    bbox = face['bbox']
+                    landmarks = face.get('kps')
+                    # Faces rejected by the quality gate are kept as filtered rows without an embedding
+                    is_filtered = face['embedding'] is None
+                    cursor.execute('''
+                        INSERT INTO faces (photo_id, bbox_x1, bbox_y1, bbox_x2, bbox_y2, landmarks, det_score,
+                                           model_version, is_filtered)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', (photo_id, bbox[0], bbox[1], bbox[2], bbox[3],
+                          np.asarray(landmarks, dtype=np.float32).tobytes() if landmarks is not None else None,
+                          face.get('det_score'), None if is_filtered else photo.get('model_version'),
+                          1 if is_filtered else 0))
+                    new_faces.append((cursor.lastrowid, tuple(bbox[:4]), face['embedding']))
+                    if not is_filtered:
+                        embeddings.append((cursor.lastrowid, face['embedding']))
+                
+                if old_faces:
+                    replaced_face_ids.extend(self._replace_faces(cursor, old_faces, new_faces))
+                
+                cursor.execute('''
+                    UPDATE photos SET scan_status = ?, file_hash = ?, hash_version = ?, file_size = ?,
+                        width = ?, height = ?, orientation = ?, file_mtime = ?
+                    WHERE photo_id = ?
+                ''', (photo['status'], photo['file_hash'], photo['hash_version'], photo['file_size'],
+                      photo.get('width'), photo.get('height'), photo.get('orientation'), photo.get('file_mtime'),
+                      photo_id))
+                written_photo_ids.append(photo_id)
+            
+            # Dequeue in the same transaction, so a crash can neither lose nor repeat a photo
+            cursor.executemany('DELETE FROM scan_queue WHERE file_path = ?', [(photo['file_path'],) for photo in photos])
+            
+            # The SQLite rows gave the face ids; the embedding store is written before SQLite
+            # commits, and its new entries are deleted again if that commit fails
+            if embeddings:
+                self._bump_write_generation(cursor)
+                self._put_embeddings(embeddings)
+                embeddings_committed = True
+            
+            self.conn.commit()
+            self._delete_embeddings(replaced_face_ids)
+            return written_photo_ids
+        except Exception as e:
+            print(f"Database error in ingest_batch: {e}")
+            self.conn.rollback()
+            
+            if embeddings_committed:
+                self._delete_embeddings([face_id for face_id, _ in embeddings])
+            return None
     
-    def get_all_embeddings(self) -> Tuple[List[int], np.ndarray]:
+    def get_reembed_candidates(self, model_version: str) -> Tuple[Dict[str, List[Tuple[int, np.ndarray]]], int]:
+        """Faces embedded by another model by photo path, and how many of them lack landmarks"""
         cursor = self.conn.cursor()
-        cursor.execute('SELECT face_id FROM faces ORDER BY face_id')
-        face_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute('''
+            SELECT f.face_id, f.landmarks, p.file_path
+            FROM faces f
+            JOIN photos p ON f.photo_id = p.photo_id
+            WHERE (f.model_version IS NULL OR f.model_version != ?) AND f.is_filtered = 0
+            ORDER BY p.file_path, f.face_id
+        ''', (model_version,))
+        
+        faces_by_path = {}
+        without_landmarks = 0
+        for face_id, landmarks, file_path in cursor.fetchall():
+            if landmarks is None:
+                without_landmarks += 1
+                continue
+            kps = np.frombuffer(landmarks, dtype=np.float32).reshape(-1, 2)
+            faces_by_path.setdefault(file_path, []).append((face_id, kps))
+        return faces_by_path, without_landmarks
+    
+    def update_face_embeddings(self, embeddings: List[Tuple[int, np.ndarray]], model_version: str) -> bool:
+        """Replace embeddings in the embedding store and their model version tag in SQLite"""
+        if not embeddings:
+            return True
         
-        embeddings = []
-        valid_face_ids = []
-        for face_id in face_ids:
-            embedding = self.get_face_embedding(face_id)
-            if embedding is not None:
-                embeddings.append(embedding)
-                valid_face_ids.append(face_id)
-        
-        if embeddings:
-            return valid_face_ids, np.array(embeddings)
+        cursor = self.conn.cursor()
+        try:
+            cursor.executemany('UPDATE faces SET model_version = ? WHERE face_id = ?',
+                               [(model_version, face_id) for face_id, _ in embeddings])
+            self._bump_write_generation(cursor)
+            self._put_embeddings(embeddings)
+            self.conn.commit()
+            return True
+        except Exception as e:
+            print(f"Database error in update_face_embeddings: {e}")
+            self.conn.rollback()
+            return False
+    
+    def get_face_embedding(self, face_id: int) -> Optional[np.ndarray]:
+        face_ids, embeddings = self.store.get_many([face_id])
+        return embeddings[0] if face_ids else None
+    
+    def get_all_embeddings(self) -> Tuple[List[int], np.ndarray]:
+        face_ids, embeddings = self.store.load_all(self._get_embedded_face_ids())
+        if face_ids:
+            return face_ids, embeddings
         return [], np.array([])
     
+    def iter_embedding_chunks(self, chunk_size: int = EMBEDDING_CHUNK_ROWS) -> Iterator[Tuple[List[int], np.ndarray]]:
+        """All embeddings as (face_ids, float32 block) of at most chunk_size faces"""
+        face_ids = self._get_embedded_face_ids()
+        for stored_ids, block in self.store.iter_all(chunk_size):
+            keep = np.isin(stored_ids, face_ids)
+            if keep.all():
+                yield stored_ids.tolist(), block
+            elif keep.any():
+                yield stored_ids[keep].tolist(), block[keep]
+    
+    def _get_embedded_face_ids(self) -> np.ndarray:
+        cursor = self.conn.cursor()
+        # Plain tuples: building an sqlite3.Row per face costs more than the whole matrix load
+        cursor.row_factory = None
+        cursor.execute('SELECT face_id FROM faces WHERE is_filtered = 0 ORDER BY face_id')
+        return np.fromiter((row[0] for row in cursor), dtype=np.int64)
+    
+    def get_write_generation(self) -> int:
+        return int(self.get_scan_state('write_generation', '0'))
+    
+    def _bump_write_generation(self, cursor):
+        # In scan_state, so writes by another process (the headless CLI) count as well
+        cursor.execute("INSERT OR IGNORE INTO scan_state (key, value) VALUES ('write_generation', '0')")
+        cursor.execute("UPDATE scan_state SET value = CAST(value AS INTEGER) + 1 WHERE key = 'write_generation'")
+        # Nothing cached before this write can be used again
+        self.embedding_cache.clear()
+    
+    def get_embedding_cache_key(self) -> tuple:
+        """Identifies the embeddings get_all_embeddings would load now"""
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT COUNT(*), SUM(face_id), MAX(face_id) FROM faces WHERE is_filtered = 0')
+        count, total, maximum = cursor.fetchone()
+        return self.get_write_generation(), count, total, maximum, self.embedding_format
+    
+    def count_embeddings(self) -> int:
+        """Upper bound for the faces iter_embedding_chunks yields, to size a buffer before loading"""
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM faces WHERE is_filtered = 0')
+        return cursor.fetchone()[0]
+    
     def create_clustering(self, threshold: float) -> int:
         cursor = self.conn.cursor()
         
@@ -410,6 +1151,21 @@ class FaceDatabase:
         ''', (clustering_id,))
         return [dict(row) for row in cursor.fetchall()]
     
+    def get_face_assignments(self, clustering_id: int) -> List[dict]:
+        """Every clustered face with its photo, box and own tag, ordered by person"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT ca.face_id, ca.person_id, ca.confidence_score, p.file_path,
+                   f.bbox_x1, f.bbox_y1, f.bbox_x2, f.bbox_y2, ft.tag_name
+            FROM cluster_assignments ca
+            JOIN faces f ON ca.face_id = f.face_id
+            JOIN photos p ON f.photo_id = p.photo_id
+            LEFT JOIN face_tags ft ON ca.face_id = ft.face_id
+            WHERE ca.clustering_id = ?
+            ORDER BY ca.person_id, p.file_path, ca.face_id
+        ''', (clustering_id,))
+        return [dict(row) for row in cursor.fetchall()]
+    
     def get_face_ids_for_person(self, clustering_id: int, person_id: int, limit: int = None) -> List[int]:
         cursor = self.conn.cursor()
         
@@ -505,7 +1261,7 @@ class FaceDatabase:
         total_count = self.get_person_photo_count_fast(clustering_id, person_id)
         
         cursor.execute('''
-            SELECT DISTINCT p.file_path, f.face_id, f.bbox_x1, f.bbox_y1, f.bbox_x2, f.bbox_y2
+            SELECT DISTINCT p.file_path, p.file_mtime, f.face_id, f.bbox_x1, f.bbox_y1, f.bbox_x2, f.bbox_y2
             FROM photos p
             JOIN faces f ON p.photo_id = f.photo_id
             JOIN cluster_assignments ca ON f.face_id = ca.face_id
@@ -526,7 +1282,7 @@ class FaceDatabase:
             
             if remaining_limit > 0:
                 cursor.execute('''
-                    SELECT DISTINCT p.file_path, f.face_id, f.bbox_x1, f.bbox_y1, f.bbox_x2, f.bbox_y2
+                    SELECT DISTINCT p.file_path, p.file_mtime, f.face_id, f.bbox_x1, f.bbox_y1, f.bbox_x2, f.bbox_y2
                     FROM photos p
                     JOIN faces f ON p.photo_id = f.photo_id
                     JOIN face_tags ft ON f.face_id = ft.face_id
@@ -575,7 +1331,7 @@ class FaceDatabase:
     def get_face_data(self, face_id: int) -> Optional[dict]:
         cursor = self.conn.cursor()
         cursor.execute('''
-            SELECT f.face_id, f.photo_id, f.bbox_x1, f.bbox_y1, f.bbox_x2, f.bbox_y2, p.file_path
+            SELECT f.face_id, f.photo_id, f.bbox_x1, f.bbox_y1, f.bbox_x2, f.bbox_y2, p.file_path, p.file_mtime
             FROM faces f
             JOIN photos p ON f.photo_id = p.photo_id
             WHERE f.face_id = ?
@@ -807,9 +1563,119 @@ class FaceDatabase:
         
         self.conn.commit()
     
+    def get_all_face_ids(self) -> Set[int]:
+        cursor = self.conn.cursor()
+        cursor.row_factory = None
+        cursor.execute('SELECT face_id FROM faces')
+        return {row[0] for row in cursor}
+    
+    def get_storage_size(self) -> int:
+        """Bytes of the SQLite database with its WAL and of the embedding store"""
+        paths = [self.sqlite_path, Path(f"{self.sqlite_path}-wal"), Path(f"{self.sqlite_path}-shm")]
+        size = sum(path.stat().st_size for path in paths if path.exists())
+        return size + self.store.disk_size()
+    
+    def checkpoint_wal(self, mode: str = 'TRUNCATE') -> int:
+        """Copy the WAL into the database file; TRUNCATE also empties it. Returns the bytes freed."""
+        wal_path = Path(f"{self.sqlite_path}-wal")
+        size_before = wal_path.stat().st_size if wal_path.exists() else 0
+        try:
+            self.conn.execute(f'PRAGMA wal_checkpoint({mode})')
+        except Exception as e:
+            print(f"Database error in checkpoint_wal: {e}")
+        size_after = wal_path.stat().st_size if wal_path.exists() else 0
+        return max(0, size_before - size_after)
+    
+    def compact_storage(self, keep_clusterings: int = KEEP_CLUSTERINGS, vacuum: bool = False,
+                        compact_embeddings: bool = False) -> Optional[Dict[str, int]]:
+        """Remove orphaned rows and old clusterings and give back free space; None on failure"""
+        size_before = self.get_storage_size()
+        result = {}
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute('SELECT face_id FROM faces WHERE photo_id NOT IN (SELECT photo_id FROM photos)')
+            orphan_face_ids = [row[0] for row in cursor.fetchall()]
+            if orphan_face_ids:
+                self._execute_with_temp_table(
+                    cursor, orphan_face_ids,
+                    'DELETE FROM faces WHERE face_id IN (SELECT id FROM {temp_table})'
+                )
+                self._bump_write_generation(cursor)
+            result['orphan_faces'] = len(orphan_face_ids)
+            
+            orphan_rows = 0
+            for table in ('face_tags', 'tag_primary_photos', 'hidden_photos', 'cluster_assignments'):
+                cursor.execute(f'DELETE FROM {table} WHERE face_id NOT IN (SELECT face_id FROM faces)')
+                orphan_rows += cursor.rowcount
+            result['orphan_rows'] = orphan_rows
+            
+            # The active clustering is always kept, on top of the newest inactive ones
+            cursor.execute('''
+                SELECT clustering_id FROM clusterings WHERE is_active = 0
+                ORDER BY clustering_id DESC LIMIT -1 OFFSET ?
+            ''', (max(0, keep_clusterings - 1),))
+            old_clustering_ids = [row[0] for row in cursor.fetchall()]
+            if old_clustering_ids:
+                placeholders = ','.join('?' * len(old_clustering_ids))
+                cursor.execute(f'DELETE FROM clusterings WHERE clustering_id IN ({placeholders})', old_clustering_ids)
+            result['clusterings_removed'] = len(old_clustering_ids)
+            
+            cursor.execute('DELETE FROM cluster_assignments WHERE clustering_id NOT IN (SELECT clustering_id FROM clusterings)')
+            result['assignments_removed'] = cursor.rowcount
+            cursor.execute('DELETE FROM hidden_persons WHERE clustering_id NOT IN (SELECT clustering_id FROM clusterings)')
+            
+            self.conn.commit()
+            self.invalidate_cache()
+        except Exception as e:
+            print(f"Database error in compact_storage: {e}")
+            self.conn.rollback()
+            return None
+        
+        result['orphan_embeddings'] = self._remove_orphan_embeddings()
+        
+        self.checkpoint_wal('TRUNCATE')
+        # vacuum and compact_embeddings rewrite whole files: slow on a large library
+        if vacuum:
+            try:
+                self.conn.execute('VACUUM')
+            except Exception as e:
+                print(f"Database error in compact_storage: {e}")
+            self.checkpoint_wal('TRUNCATE')
+        
+        self._remove_inactive_stores()
+        # Dropping the matrix tombstones only copies the live rows, so it is always done
+        if compact_embeddings or isinstance(self.store, EmbeddingMatrix):
+            self.store.compact()
+        
+        result['reclaimed_bytes'] = max(0, size_before - self.get_storage_size())
+        return result
+    
+    def _remove_orphan_embeddings(self) -> int:
+        # Left behind by versions that did not delete embeddings with their photos
+        stored_ids = self.store.face_ids()
+        orphan_ids = stored_ids[~np.isin(stored_ids, np.fromiter(self.get_all_face_ids(), dtype=np.int64))].tolist()
+        self._delete_embeddings(orphan_ids)
+        return len(orphan_ids)
+    
+    def _remove_inactive_stores(self):
+        # Such as the LMDB file earlier versions kept at full size after a move to the matrix
+        for storage in EMBEDDING_STORAGES:
+            if storage == self.store.name or not embedding_store_path(storage, self.db_folder).exists():
+                continue
+            store = open_embedding_store(storage, self.db_folder, self.embedding_format)
+            if store.count() == 0:
+                store.remove()
+            else:
+                store.close()
+    
     def get_total_faces(self) -> int:
         cursor = self.conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM faces')
+        cursor.execute('SELECT COUNT(*) FROM faces WHERE is_filtered = 0')
+        return cursor.fetchone()[0]
+    
+    def get_filtered_face_count(self) -> int:
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM faces WHERE is_filtered = 1')
         return cursor.fetchone()[0]
     
     def get_total_photos(self) -> int:
@@ -834,6 +1700,9 @@ class FaceDatabase:
         self.conn.commit()
     
     def close(self):
+        if hasattr(self, 'embedding_cache'):
+            self.embedding_cache.clear()
+        
         if hasattr(self, 'conn') and self.conn:
             self.conn.close()
         
@@ -841,8 +1710,8 @@ class FaceDatabase:
             if self._local.conn:
                 self._local.conn.close()
         
-        if hasattr(self, 'env') and self.env:
-            self.env.close()
+        if hasattr(self, 'store') and self.store:
+            self.store.close()
 
     def get_photo_face_tags(self, photo_id: int) -> List[Dict]:
         """Get all faces in a photo with their tags and bboxes"""
@@ -852,7 +1721,7 @@ class FaceDatabase:
                 ft.tag_name
             FROM faces f
             LEFT JOIN face_tags ft ON f.face_id = ft.face_id
-            WHERE f.photo_id = ?
+            WHERE f.photo_id = ? AND f.is_filtered = 0
         ''', (photo_id,))
         
         results = []
@@ -0,0 +1,134 @@
+import os
+import time
+import threading
+from typing import Callable, Dict, List, Optional, Set
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.gif', '.heic', '.heif'}
+
+# Directory mtimes closer than this to the listing time are not trusted, because
+# coarse filesystem timestamps (FAT, SMB) could hide a change made in the same tick
+MTIME_SETTLE_SECONDS = 2.0
+
+
+def collapse_include_folders(include_folders: List[str]) -> List[str]:
+    """Drop include folders that are nested inside (or equal to) another one"""
+    # Returned as configured, not normalised, so discovered paths keep the form stored in photos
+    roots = []
+    normalized_roots = []
+    for folder in sorted(include_folders, key=lambda f: len(os.path.normpath(f))):
+        normalized = os.path.normpath(folder)
+        nested = False
+        for root in normalized_roots:
+            root_prefix = root if root.endswith(os.sep) else root + os.sep
+            if normalized == root or normalized.startswith(root_prefix):
+                nested = True
+                break
+        if not nested:
+            roots.append(folder)
+            normalized_roots.append(normalized)
+    return roots
+
+
+class PhotoDiscovery:
+    """Walks the include folders, re-listing only directories whose mtime changed"""
+
+    def __init__(self, db, should_exclude: Callable[[str], bool],
+                 stop_event: Optional[threading.Event] = None):
+        self.db = db
+        self.should_exclude = should_exclude
+        self.stop_event = stop_event or threading.Event()
+        self.dirs_listed = 0
+        self.dirs_reused = 0
+
+    def discover(self, include_folders: List[str], status_callback: Callable[[str], None]) -> Optional[Set[str]]:
+        index = self.db.get_directory_index()
+        updated_entries = []
+        visited_dirs = set()
+        image_files = set()
+
+        for root in collapse_include_folders(include_folders):
+            try:
+                root_mtime = os.stat(root).st_mtime
+            except OSError:
+                status_callback(f"WARNING: Folder does not exist: {root}")
+                continue
+
+            status_callback(f"Scanning folder: {root}")
+
+            stack = [(root, root_mtime)]
+            while stack:
+                if self.stop_event.is_set():
+                    return None
+
+                dir_path, dir_mtime = stack.pop()
+
+                if self.should_exclude(dir_path):
+                    continue
+
+                if dir_mtime is None:
+                    try:
+                        dir_mtime = os.stat(dir_path).st_mtime
+                    except OSError:
+                        continue
+
+                visited_dirs.add(dir_path)
+                cached = index.get(dir_path)
+
+                # Adding, removing or renaming an entry changes the mtime of its directory, but not
+                # of the directories above it: every directory is stat'ed, only changed ones listed
+                if cached is not None and cached['mtime'] is not None and cached['mtime'] == dir_mtime:
+                    self.dirs_reused += 1
+                    subdirs = [(name, None) for name in cached['subdirs']]
+                    file_names = cached['image_files']
+                else:
+                    listing = self._list_directory(dir_path, dir_mtime)
+                    if listing is None:
+                        continue
+                    self.dirs_listed += 1
+                    subdirs, file_names, entry = listing
+                    updated_entries.append(entry)
+
+                for name in file_names:
+                    file_path = os.path.join(dir_path, name)
+                    if not self.should_exclude(file_path):
+                        image_files.add(file_path)
+
+                for name, mtime in subdirs:
+                    stack.append((os.path.join(dir_path, name), mtime))
+
+        self.db.save_directory_index(updated_entries, visited_dirs)
+        return image_files
+
+    def _list_directory(self, dir_path: str, dir_mtime: float):
+        subdirs = []
+        file_names = []
+        entry_count = 0
+
+        try:
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    entry_count += 1
+                    try:
+                        if entry.is_dir():
+                            # Match os.walk(followlinks=False): never descend into symlinked dirs
+                            if not entry.is_symlink():
+                                subdirs.append((entry.name, entry.stat().st_mtime))
+                        elif os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS:
+                            file_names.append(entry.name)
+                    except OSError:
+                        continue
+        except OSError:
+            return None
+
+        stored_mtime = dir_mtime
+        if time.time() - dir_mtime < MTIME_SETTLE_SECONDS:
+            stored_mtime = None
+
+        entry = {
+            'dir_path': dir_path,
+            'mtime': stored_mtime,
+            'entry_count': entry_count,
+            'subdirs': [name for name, _ in subdirs],
+            'image_files': file_names
+        }
+        return subdirs, file_names, entry
@@ -0,0 +1,69 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+
+class EmbeddingCache:
+    """Embedding matrices kept in memory between clusterings, least recently used evicted first"""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    # Keys are FaceDatabase.get_embedding_cache_key(), which changes with every write, so a stale
+    # matrix is never found again
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, nbytes: int) -> bool:
+        """Keep value under key; returns False when it does not fit under the cap"""
+        with self._lock:
+            self._evict(key)
+            if nbytes > self.max_bytes:
+                return False
+            self._entries[key] = (value, nbytes)
+            self._nbytes += nbytes
+            self._shrink(self.max_bytes)
+            return True
+
+    def evict(self, key: Hashable) -> bool:
+        with self._lock:
+            return self._evict(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def set_max_bytes(self, max_bytes: int):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._shrink(max_bytes)
+
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _evict(self, key: Hashable) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self._nbytes -= entry[1]
+        return True
+
+    def _shrink(self, max_bytes: int):
+        while self._entries and self._nbytes > max_bytes:
+            _, (_, nbytes) = self._entries.popitem(last=False)
+            self._nbytes -= nbytes
@@ -0,0 +1,119 @@
+import pickle
+from typing import Dict, Tuple
+import numpy as np
+
+EMBEDDING_DIM = 512
+EMBEDDING_FORMATS = ['float32', 'float16', 'int8']
+
+# float32 embeddings stay pickled numpy arrays, which begin with the pickle PROTO
+# opcode 0x80. The compact formats begin with a tag byte that a pickle never starts with:
+#   float16: b'h' + dim float16 values                          (1025 bytes at 512-d)
+#   int8:    b'q' + float32 scale + dim int8 values, x = q * scale  (517 bytes at 512-d)
+FLOAT16_TAG = ord('h')
+INT8_TAG = ord('q')
+
+_FLOAT16_DTYPE = np.dtype([('tag', 'u1'), ('values', '<f2', (EMBEDDING_DIM,))])
+_INT8_DTYPE = np.dtype([('tag', 'u1'), ('scale', '<f4'), ('values', 'i1', (EMBEDDING_DIM,))])
+
+
+def quantize_int8(embeddings: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-vector symmetric int8: each row gets the scale that maps its largest component to 127"""
+    embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, embeddings.shape[-1])
+    scales = np.abs(embeddings).max(axis=1) / 127
+    scales[scales == 0] = 1
+    codes = np.clip(np.rint(embeddings / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def dequantize_int8(codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    return codes.astype(np.float32) * scales[:, None]
+
+
+def encode_embedding(embedding: np.ndarray, embedding_format: str = 'float32') -> bytes:
+    if embedding_format == 'float16':
+        return bytes([FLOAT16_TAG]) + np.asarray(embedding, dtype='<f2').tobytes()
+    if embedding_format == 'int8':
+        codes, scales = quantize_int8(np.asarray(embedding, dtype=np.float32).reshape(1, -1))
+        return bytes([INT8_TAG]) + scales.astype('<f4').tobytes() + codes.tobytes()
+    return pickle.dumps(np.asarray(embedding, dtype=np.float32))
+
+
+def decode_embedding(value) -> np.ndarray:
+    tag = value[0]
+    if tag == FLOAT16_TAG:
+        return np.frombuffer(value, dtype='<f2', offset=1).astype(np.float32)
+    if tag == INT8_TAG:
+        scale = np.frombuffer(value, dtype='<f4', count=1, offset=1)
+        return np.frombuffer(value, dtype=np.int8, offset=5).astype(np.float32) * scale[0]
+    return pickle.loads(value)
+
+
+def _pickle_layouts(dim: int = EMBEDDING_DIM) -> Dict[int, Tuple[int, bytes, bytes]]:
+    """Where the raw floats sit in a pickled float32 vector, per pickle length"""
+    # Pickles of same-shape float32 arrays differ only in those bytes, so a value matching a
+    # reference pickle around them can be read without unpickling it
+    reference = np.arange(dim, dtype=np.float32)
+    data = reference.tobytes()
+    layouts = {}
+    for protocol in range(3, pickle.HIGHEST_PROTOCOL + 1):
+        pickled = pickle.dumps(reference, protocol=protocol)
+        offset = pickled.find(data)
+        if offset >= 0:
+            layouts[len(pickled)] = (offset, pickled[:offset], pickled[offset + len(data):])
+    return layouts
+
+
+_PICKLE_LAYOUTS = _pickle_layouts()
+
+
+def _decode_same_length(raw: np.ndarray, out: np.ndarray) -> np.ndarray:
+    """Decode the same-length values in the rows of raw into out; returns which rows were decoded"""
+    length = raw.shape[1]
+    if length == _FLOAT16_DTYPE.itemsize and out.shape[1] == EMBEDDING_DIM:
+        records = raw.reshape(-1).view(_FLOAT16_DTYPE)
+        decoded = records['tag'] == FLOAT16_TAG
+        out[decoded] = records['values'][decoded]
+        return decoded
+
+    if length == _INT8_DTYPE.itemsize and out.shape[1] == EMBEDDING_DIM:
+        records = raw.reshape(-1).view(_INT8_DTYPE)
+        decoded = records['tag'] == INT8_TAG
+        out[decoded] = dequantize_int8(records['values'][decoded], records['scale'][decoded].astype(np.float32))
+        return decoded
+
+    layout = _PICKLE_LAYOUTS.get(length)
+    if layout is None:
+        return np.zeros(len(raw), dtype=bool)
+    offset, prefix, suffix = layout
+    end = offset + out.shape[1] * out.itemsize
+    decoded = (raw[:, :offset] == np.frombuffer(prefix, dtype=np.uint8)).all(axis=1) & \
+        (raw[:, end:] == np.frombuffer(suffix, dtype=np.uint8)).all(axis=1)
+    out_bytes = out.view(np.uint8)
+    if decoded.all():
+        out_bytes[:] = raw[:, offset:end]
+    else:
+        out_bytes[decoded] = raw[decoded, offset:end]
+    return decoded
+
+
+def decode_embeddings_into(values: list, out: np.ndarray):
+    """Write stored embeddings, in any format, into the float32 rows of out"""
+    # One vectorised step per length; only unexpected values are decoded one by one
+    if len(values) == 1:
+        out[0] = decode_embedding(values[0])
+        return
+    lengths = np.fromiter(map(len, values), dtype=np.int64, count=len(values))
+    decoded = np.zeros(len(values), dtype=bool)
+    for length in np.unique(lengths).tolist():
+        rows = np.flatnonzero(lengths == length)
+        same_length = values if len(rows) == len(values) else [values[row] for row in rows.tolist()]
+        raw = np.frombuffer(b''.join(same_length), dtype=np.uint8).reshape(len(rows), length)
+        if len(rows) == len(values):
+            decoded = _decode_same_length(raw, out[:len(values)])
+            break
+        block = np.empty((len(rows), out.shape[1]), dtype=np.float32)
+        block_decoded = _decode_same_length(raw, block)
+        out[rows[block_decoded]] = block[block_decoded]
+        decoded[rows[block_decoded]] = True
+    for row in np.flatnonzero(~decoded).tolist():
+        out[row] = decode_embedding(values[row])
@@ -0,0 +1,272 @@
+import os
+import json
+import shutil
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+
+from embedding_store import EmbeddingStore
+
+TOMBSTONE = -1
+
+
+class EmbeddingMatrix(EmbeddingStore):
+    """Append-only float32 matrix of face embeddings on disk, one row per face"""
+
+    name = 'matrix'
+    COMPACT_RATIO = 0.25
+    COMPACT_MIN_ROWS = 1024
+    CHUNK_ROWS = 65536
+
+    def __init__(self, folder: Path, dim: int = 512):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.meta_path = self.folder / "meta.json"
+        self._lock = threading.RLock()
+
+        meta = self._read_meta()
+        self.dim = int(meta.get('dim', dim))
+        self.generation = int(meta.get('generation', 0))
+        self._open_generation()
+        if not meta:
+            self._write_meta()
+        self._remove_old_generations()
+
+    def _read_meta(self) -> dict:
+        try:
+            with open(self.meta_path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            print(f"Error reading embedding matrix metadata: {e}")
+            return {}
+
+    # meta.json names the current generation: files a reader may still have mapped (which Windows
+    # does not allow to be replaced) are never rewritten, only removed once nothing uses them
+    def _write_meta(self):
+        temp_path = self.meta_path.with_suffix('.tmp')
+        with open(temp_path, 'w') as f:
+            json.dump({'dim': self.dim, 'generation': self.generation}, f)
+        os.replace(temp_path, self.meta_path)
+
+    # The rows, and the face_id of every row in the same order
+    def _matrix_path(self, generation: Optional[int] = None) -> Path:
+        return self.folder / f"matrix_{self.generation if generation is None else generation}.f32"
+
+    def _ids_path(self, generation: Optional[int] = None) -> Path:
+        return self.folder / f"ids_{self.generation if generation is None else generation}.i64"
+
+    def _open_generation(self):
+        matrix_path, ids_path = self._matrix_path(), self._ids_path()
+        for path in (matrix_path, ids_path):
+            if not path.exists():
+                path.touch()
+
+        row_bytes = self.dim * 4
+        matrix_size = matrix_path.stat().st_size
+        ids_size = ids_path.stat().st_size
+        rows = min(matrix_size // row_bytes, ids_size // 8)
+
+        # A crash between the two appends leaves a row in only one of the files
+        if matrix_size != rows * row_bytes:
+            os.truncate(matrix_path, rows * row_bytes)
+        if ids_size != rows * 8:
+            os.truncate(ids_path, rows * 8)
+
+        ids = np.fromfile(ids_path, dtype=np.int64) if rows else np.zeros(0, dtype=np.int64)
+        # ids grows by doubling, so appending a batch does not copy the whole array
+        self._ids = np.zeros(max(1024, rows * 2), dtype=np.int64)
+        self._ids[:rows] = ids
+        self._rows = rows
+        self._tombstones = int(np.count_nonzero(ids == TOMBSTONE))
+        self._index = None
+
+    def _remove_old_generations(self):
+        current = {self._matrix_path().name, self._ids_path().name}
+        for path in self.folder.iterdir():
+            if path.suffix in ('.f32', '.i64') and path.name not in current:
+                try:
+                    path.unlink()
+                except OSError:
+                    # Still mapped by a reader; removed on a later open
+                    pass
+
+    def _get_index(self) -> Dict[int, int]:
+        if self._index is None:
+            ids = self._ids[:self._rows]
+            self._index = {face_id: row for row, face_id in enumerate(ids.tolist()) if face_id != TOMBSTONE}
+        return self._index
+
+    def count(self) -> int:
+        return self._rows - self._tombstones
+
+    def face_ids(self) -> np.ndarray:
+        with self._lock:
+            ids = self._ids[:self._rows]
+            return ids[ids != TOMBSTONE]
+
+    def disk_size(self) -> int:
+        return sum(path.stat().st_size for path in self.folder.iterdir() if path.is_file())
+
+    def put_many(self, face_ids: List[int], embeddings) -> int:
+        """Store embeddings (n, dim); faces already stored are overwritten in their row"""
+        if len(face_ids) == 0:
+            return 0
+        embeddings = np.ascontiguousarray(np.asarray(embeddings, dtype=np.float32).reshape(len(face_ids), self.dim))
+
+        with self._lock:
+            index = self._get_index()
+            overwrite = []
+            append = {}
+            for position, face_id in enumerate(face_ids):
+                face_id = int(face_id)
+                if face_id in index:
+                    overwrite.append((index[face_id], position))
+                else:
+                    append[face_id] = position
+
+            if overwrite:
+                with open(self._matrix_path(), 'r+b') as f:
+                    for row, position in overwrite:
+                        f.seek(row * self.dim * 4)
+                        f.write(embeddings[position].tobytes())
+
+            if append:
+                new_ids = np.fromiter(append.keys(), dtype=np.int64, count=len(append))
+                positions = np.fromiter(append.values(), dtype=np.int64, count=len(append))
+                # Rows before ids: a crash in between leaves a row without id, which the next open drops
+                with open(self._matrix_path(), 'ab') as f:
+                    f.write(embeddings[positions].tobytes())
+                with open(self._ids_path(), 'ab') as f:
+                    f.write(new_ids.tobytes())
+
+                start = self._rows
+                end = start + len(new_ids)
+                if end > len(self._ids):
+                    grown = np.zeros(max(end, len(self._ids) * 2), dtype=np.int64)
+                    grown[:start] = self._ids[:start]
+                    self._ids = grown
+                self._ids[start:end] = new_ids
+                self._rows = end
+                for row, face_id in enumerate(new_ids.tolist(), start):
+                    index[face_id] = row
+
+            return len(face_ids)
+
+    def delete_many(self, face_ids: List[int]) -> int:
+        """Set the ids of the faces' rows to TOMBSTONE; compacts once enough of the matrix is dead"""
+        with self._lock:
+            index = self._get_index()
+            rows = sorted({row for row in (index.pop(int(face_id), None) for face_id in face_ids) if row is not None})
+            if not rows:
+                return 0
+
+            tombstone = np.array([TOMBSTONE], dtype=np.int64).tobytes()
+            with open(self._ids_path(), 'r+b') as f:
+                for row in rows:
+                    f.seek(row * 8)
+                    f.write(tombstone)
+            self._ids[rows] = TOMBSTONE
+            self._tombstones += len(rows)
+
+            if self._tombstones >= max(self.COMPACT_MIN_ROWS, self._rows * self.COMPACT_RATIO):
+                self.compact()
+            return len(rows)
+
+    def get_many(self, face_ids: List[int]) -> Tuple[List[int], np.ndarray]:
+        with self._lock:
+            index = self._get_index()
+            found = [(face_id, index[int(face_id)]) for face_id in face_ids if int(face_id) in index]
+            if not found:
+                return [], np.zeros((0, self.dim), dtype=np.float32)
+            if len(found) == 1:
+                # Mapping the file costs more than reading one row
+                return [found[0][0]], self.get(found[0][0]).reshape(1, self.dim)
+            matrix = np.memmap(self._matrix_path(), dtype=np.float32, mode='r', shape=(self._rows, self.dim))
+            embeddings = np.array(matrix[[row for _, row in found]])
+            del matrix
+            return [face_id for face_id, _ in found], embeddings
+
+    def get(self, face_id: int) -> Optional[np.ndarray]:
+        with self._lock:
+            row = self._get_index().get(int(face_id))
+            if row is None:
+                return None
+            return np.fromfile(self._matrix_path(), dtype=np.float32, count=self.dim, offset=row * self.dim * 4)
+
+    def all(self) -> Tuple[np.ndarray, np.ndarray]:
+        """face_ids and embeddings of all live rows; a read-only memmap unless there are tombstones"""
+        with self._lock:
+            if self.count() == 0:
+                return np.zeros(0, dtype=np.int64), np.zeros((0, self.dim), dtype=np.float32)
+
+            ids = self._ids[:self._rows].copy()
+            matrix = np.memmap(self._matrix_path(), dtype=np.float32, mode='r', shape=(self._rows, self.dim))
+            if self._tombstones == 0:
+                return ids, matrix
+
+            live = ids != TOMBSTONE
+            return ids[live], np.asarray(matrix[live])
+
+    def load_all(self, face_ids: np.ndarray) -> Tuple[List[int], np.ndarray]:
+        """Embeddings of the sorted face_ids in row order"""
+        stored_ids, embeddings = self.all()
+        # Usually the matrix holds exactly these faces, and its memmap is returned without a copy
+        if len(stored_ids) != len(face_ids) or not np.array_equal(np.sort(stored_ids), face_ids):
+            keep = np.isin(stored_ids, face_ids)
+            stored_ids, embeddings = stored_ids[keep], np.asarray(embeddings[keep])
+        return stored_ids.tolist(), embeddings
+
+    def iter_all(self, chunk_rows: int = CHUNK_ROWS) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Live (face_ids, embeddings) in blocks of chunk_rows rows, zero-copy memmap slices without tombstones"""
+        ids, matrix = self.all()
+        for start in range(0, len(ids), chunk_rows):
+            yield ids[start:start + chunk_rows], matrix[start:start + chunk_rows]
+
+    def compact(self) -> int:
+        """Copy the live rows into a new generation without tombstones; returns the bytes freed"""
+        with self._lock:
+            if self._tombstones == 0:
+                return 0
+
+            size_before = self.disk_size()
+            old_matrix_path = self._matrix_path()
+            ids = self._ids[:self._rows]
+            live_rows = np.flatnonzero(ids != TOMBSTONE)
+            generation = self.generation + 1
+
+            old_matrix = np.memmap(old_matrix_path, dtype=np.float32, mode='r', shape=(self._rows, self.dim)) \
+                if self._rows else None
+            with open(self._matrix_path(generation), 'wb') as f:
+                for start in range(0, len(live_rows), self.CHUNK_ROWS):
+                    f.write(np.ascontiguousarray(old_matrix[live_rows[start:start + self.CHUNK_ROWS]]).tobytes())
+            ids[live_rows].tofile(str(self._ids_path(generation)))
+            del old_matrix
+
+            # The switch happens with the metadata write; a crash before it keeps the old generation
+            self.generation = generation
+            self._write_meta()
+            self._open_generation()
+            self._remove_old_generations()
+            return max(0, size_before - self.disk_size())
+
+    def reencode(self, embedding_format: str) -> int:
+        return 0
+
+    def close(self):
+        with self._lock:
+            self._index = None
+
+    def remove(self):
+        self.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def clear(self):
+        """Drop every row by starting an empty generation"""
+        with self._lock:
+            self.generation += 1
+            self._open_generation()
+            self._write_meta()
+            self._remove_old_generations()
@@ -0,0 +1,317 @@
+import os
+import shutil
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Iterator, List, Tuple
+import lmdb
+import numpy as np
+
+from embedding_codec import EMBEDDING_DIM, encode_embedding, decode_embeddings_into
+
+# Faces decoded per step when reading all embeddings, bounding the raw values held at once
+CHUNK_ROWS = 65536
+
+
+class EmbeddingStore:
+    """Where FaceDatabase keeps one float32 embedding per face_id, whatever the encoding on disk"""
+
+    name = ''
+    dim = EMBEDDING_DIM
+
+    def put_many(self, face_ids: List[int], embeddings) -> int:
+        """Store embeddings (n, dim); faces already stored are overwritten"""
+        raise NotImplementedError
+
+    def get_many(self, face_ids: List[int]) -> Tuple[List[int], np.ndarray]:
+        """The faces found among face_ids, in that order, and their embeddings"""
+        raise NotImplementedError
+
+    def iter_all(self, chunk_rows: int = CHUNK_ROWS) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Every stored (face_ids, embeddings) in blocks of at most chunk_rows rows"""
+        raise NotImplementedError
+
+    def delete_many(self, face_ids: List[int]) -> int:
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def face_ids(self) -> np.ndarray:
+        raise NotImplementedError
+
+    def disk_size(self) -> int:
+        raise NotImplementedError
+
+    def compact(self) -> int:
+        """Give free space back to the file system; returns the bytes freed"""
+        return 0
+
+    def clear(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def remove(self):
+        """Close the store and delete its files"""
+        raise NotImplementedError
+
+    def load_all(self, face_ids: np.ndarray) -> Tuple[List[int], np.ndarray]:
+        """The stored embeddings of face_ids as one float32 matrix, in store order"""
+        embeddings = np.empty((len(face_ids), self.dim), dtype=np.float32)
+        loaded_ids = []
+        for stored_ids, block in self.iter_all():
+            keep = np.isin(stored_ids, face_ids)
+            if not keep.all():
+                stored_ids, block = stored_ids[keep], block[keep]
+            embeddings[len(loaded_ids):len(loaded_ids) + len(stored_ids)] = block
+            loaded_ids.extend(stored_ids.tolist())
+        return loaded_ids, embeddings[:len(loaded_ids)]
+
+    def reencode(self, embedding_format: str) -> int:
+        """Rewrite every stored embedding in embedding_format; returns how many were rewritten"""
+        self.embedding_format = embedding_format
+        face_ids = self.face_ids()
+        rewritten = 0
+        for start in range(0, len(face_ids), CHUNK_ROWS):
+            found_ids, embeddings = self.get_many(face_ids[start:start + CHUNK_ROWS].tolist())
+            rewritten += self.put_many(found_ids, embeddings)
+        return rewritten
+
+
+class LmdbEmbeddingStore(EmbeddingStore):
+    """Encoded embeddings in LMDB under the key str(face_id)"""
+
+    name = 'lmdb'
+    MAP_SIZE = 10 * 1024 * 1024 * 1024
+
+    def __init__(self, path: Path, embedding_format: str = 'float32'):
+        self.path = Path(path)
+        self.embedding_format = embedding_format
+        self.env = self._open()
+
+    def _open(self):
+        return lmdb.open(
+            str(self.path),
+            map_size=self.MAP_SIZE,
+            max_dbs=1,
+            readahead=True,
+            metasync=False,
+            sync=False,
+            writemap=True
+        )
+
+    def put_many(self, face_ids: List[int], embeddings) -> int:
+        with self.env.begin(write=True) as txn:
+            for face_id, embedding in zip(face_ids, embeddings):
+                txn.put(str(face_id).encode(), encode_embedding(embedding, self.embedding_format))
+        return len(face_ids)
+
+    def get_many(self, face_ids: List[int]) -> Tuple[List[int], np.ndarray]:
+        found_ids, values = [], []
+        # The values are views into the memory map, valid until the transaction ends
+        with self.env.begin(buffers=True) as txn:
+            for face_id in face_ids:
+                value = txn.get(str(face_id).encode())
+                if value is not None:
+                    found_ids.append(face_id)
+                    values.append(value)
+            embeddings = np.empty((len(values), self.dim), dtype=np.float32)
+            if values:
+                decode_embeddings_into(values, embeddings)
+        return found_ids, embeddings
+
+    def iter_all(self, chunk_rows: int = CHUNK_ROWS) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """One cursor pass in a single read transaction, decoding a block of values at a time"""
+        keys, values = [], []
+
+        def flush():
+            block = np.empty((len(values), self.dim), dtype=np.float32)
+            decode_embeddings_into(values, block)
+            return np.array([int(key) for key in keys], dtype=np.int64), block
+
+        with self.env.begin(buffers=True) as txn:
+            for key, value in txn.cursor().iternext():
+                keys.append(bytes(key))
+                values.append(value)
+                if len(values) == chunk_rows:
+                    yield flush()
+                    keys, values = [], []
+            if values:
+                yield flush()
+
+    def delete_many(self, face_ids: List[int]) -> int:
+        deleted = 0
+        with self.env.begin(write=True) as txn:
+            for face_id in face_ids:
+                deleted += txn.delete(str(face_id).encode())
+        return deleted
+
+    def count(self) -> int:
+        return self.env.stat()['entries']
+
+    def face_ids(self) -> np.ndarray:
+        with self.env.begin() as txn:
+            return np.fromiter((int(key) for key in txn.cursor().iternext(values=False)), dtype=np.int64)
+
+    def disk_size(self) -> int:
+        # The file is mapped at the full map size and never shrinks by itself: count the pages in use
+        return (self.env.info()['last_pgno'] + 1) * self.env.stat()['psize']
+
+    def compact(self) -> int:
+        """Rewrite the file without free pages, like mdb_copy -c"""
+        size_before = self.disk_size()
+        compact_path = self.path.with_name(self.path.name + ".compact")
+        try:
+            shutil.rmtree(compact_path, ignore_errors=True)
+            compact_path.mkdir()
+            self.env.copy(str(compact_path), compact=True)
+            self.env.close()
+            os.replace(compact_path / "data.mdb", self.path / "data.mdb")
+        except Exception as e:
+            print(f"Error compacting embeddings: {e}")
+        finally:
+            shutil.rmtree(compact_path, ignore_errors=True)
+            # Closed by now unless copying failed, in which case it is still the original
+            try:
+                self.env.stat()
+            except lmdb.Error:
+                self.env = self._open()
+        return max(0, size_before - self.disk_size())
+
+    def clear(self):
+        with self.env.begin(write=True) as txn:
+            txn.drop(self.env.open_db(), delete=False)
+
+    def close(self):
+        self.env.close()
+
+    def remove(self):
+        self.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+class SqliteEmbeddingStore(EmbeddingStore):
+    """Encoded embeddings as BLOBs in a SQLite table of their own file, keyed by face_id"""
+
+    name = 'sqlite'
+    # Stays below SQLite's limit of bound parameters per statement
+    QUERY_IDS = 500
+    # A float32 value takes 2 KB: at the default 4 KB pages each would fill a page of its own
+    PAGE_SIZE = 16384
+
+    def __init__(self, path: Path, embedding_format: str = 'float32'):
+        self.path = Path(path)
+        self.embedding_format = embedding_format
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        # Only takes effect while the file is still empty
+        self.conn.execute(f'PRAGMA page_size = {self.PAGE_SIZE}')
+        self.conn.executescript('''
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            PRAGMA journal_size_limit = 67108864;
+            CREATE TABLE IF NOT EXISTS embeddings (
+                face_id INTEGER PRIMARY KEY,
+                value BLOB NOT NULL
+            );
+        ''')
+        self.conn.commit()
+
+    def put_many(self, face_ids: List[int], embeddings) -> int:
+        with self._lock:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO embeddings (face_id, value) VALUES (?, ?)',
+                ((int(face_id), encode_embedding(embedding, self.embedding_format))
+                 for face_id, embedding in zip(face_ids, embeddings))
+            )
+            self.conn.commit()
+        return len(face_ids)
+
+    def get_many(self, face_ids: List[int]) -> Tuple[List[int], np.ndarray]:
+        values_by_id = {}
+        with self._lock:
+            for start in range(0, len(face_ids), self.QUERY_IDS):
+                chunk = [int(face_id) for face_id in face_ids[start:start + self.QUERY_IDS]]
+                cursor = self.conn.execute(
+                    f'SELECT face_id, value FROM embeddings WHERE face_id IN ({",".join("?" * len(chunk))})', chunk
+                )
+                values_by_id.update(cursor.fetchall())
+
+        found_ids = [face_id for face_id in face_ids if face_id in values_by_id]
+        embeddings = np.empty((len(found_ids), self.dim), dtype=np.float32)
+        if found_ids:
+            decode_embeddings_into([values_by_id[face_id] for face_id in found_ids], embeddings)
+        return found_ids, embeddings
+
+    def iter_all(self, chunk_rows: int = CHUNK_ROWS) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        # Keyset pages: no statement stays open between blocks, so writers are never held up
+        last_id = None
+        while True:
+            with self._lock:
+                if last_id is None:
+                    cursor = self.conn.execute(
+                        'SELECT face_id, value FROM embeddings ORDER BY face_id LIMIT ?', (chunk_rows,)
+                    )
+                else:
+                    cursor = self.conn.execute(
+                        'SELECT face_id, value FROM embeddings WHERE face_id > ? ORDER BY face_id LIMIT ?',
+                        (last_id, chunk_rows)
+                    )
+                rows = cursor.fetchall()
+            if not rows:
+                return
+
+            face_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+            block = np.empty((len(rows), self.dim), dtype=np.float32)
+            decode_embeddings_into([row[1] for row in rows], block)
+            last_id = int(face_ids[-1])
+            yield face_ids, block
+
+    def delete_many(self, face_ids: List[int]) -> int:
+        with self._lock:
+            before = self.conn.total_changes
+            self.conn.executemany('DELETE FROM embeddings WHERE face_id = ?', ((int(face_id),) for face_id in face_ids))
+            self.conn.commit()
+            return self.conn.total_changes - before
+
+    def count(self) -> int:
+        with self._lock:
+            return self.conn.execute('SELECT COUNT(*) FROM embeddings').fetchone()[0]
+
+    def face_ids(self) -> np.ndarray:
+        with self._lock:
+            cursor = self.conn.execute('SELECT face_id FROM embeddings')
+            return np.fromiter((row[0] for row in cursor), dtype=np.int64)
+
+    def _paths(self) -> List[Path]:
+        return [self.path, Path(f"{self.path}-wal"), Path(f"{self.path}-shm")]
+
+    def disk_size(self) -> int:
+        return sum(path.stat().st_size for path in self._paths() if path.exists())
+
+    def compact(self) -> int:
+        size_before = self.disk_size()
+        with self._lock:
+            try:
+                self.conn.execute('VACUUM')
+                self.conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            except Exception as e:
+                print(f"Error compacting embeddings: {e}")
+        return max(0, size_before - self.disk_size())
+
+    def clear(self):
+        with self._lock:
+            self.conn.execute('DELETE FROM embeddings')
+            self.conn.commit()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def remove(self):
+        self.close()
+        for path in self._paths():
+            if path.exists():
+                path.unlink()
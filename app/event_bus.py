@@ -0,0 +1,93 @@
+import json
+import logging
+import threading
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+
+def create_file_log(log_dir: Path, name: str = 'face_recognition') -> logging.Logger:
+    """Rotating log file for scan details that are too many for the UI log"""
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    if not logger.handlers:
+        try:
+            log_dir.mkdir(parents=True, exist_ok=True)
+            handler = RotatingFileHandler(
+                log_dir / f"{name}.log", maxBytes=5 * 1024 * 1024, backupCount=3, encoding='utf-8'
+            )
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            logger.addHandler(handler)
+            print(f"Log file location: {log_dir / f'{name}.log'}")
+        except OSError as e:
+            print(f"Cannot open log file: {e}")
+            logger.addHandler(logging.NullHandler())
+    return logger
+
+
+class EventBus:
+    """Buffers status messages and progress from any thread and sends them to the UI in batches"""
+
+    def __init__(self, evaluate_js: Callable[[str], None], rate: float = 10.0, max_messages: int = 200):
+        self.evaluate_js = evaluate_js
+        self.interval = 1.0 / rate
+        self.max_messages = max_messages
+        self._lock = threading.Lock()
+        self._messages: List[str] = []
+        self._dropped = 0
+        self._progress: Optional[Tuple[int, int]] = None
+        self._closed = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def close(self):
+        self._closed.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+        self.flush()
+
+    def post_status(self, message: str):
+        with self._lock:
+            self._messages.append(message)
+            if len(self._messages) > self.max_messages:
+                del self._messages[0]
+                self._dropped += 1
+
+    def post_progress(self, current: int, total: int):
+        with self._lock:
+            self._progress = (current, total)
+
+    def flush(self):
+        # One evaluate_js call: every message in order, then only the latest progress
+        with self._lock:
+            messages, self._messages = self._messages, []
+            dropped, self._dropped = self._dropped, 0
+            progress, self._progress = self._progress, None
+
+        if not messages and progress is None:
+            return
+
+        if dropped:
+            messages.insert(0, f"... {dropped} more messages, see the log file")
+
+        script = []
+        if messages:
+            script.append(f"updateStatusMessages({json.dumps(messages)});")
+        if progress is not None:
+            current, total = progress
+            percent = (current / total) * 100 if total > 0 else 0
+            script.append(f"updateProgress({current}, {total}, {percent});")
+
+        try:
+            self.evaluate_js(''.join(script))
+        except Exception as e:
+            print(f"Error sending status to UI: {e}")
+
+    def _run(self):
+        while not self._closed.wait(self.interval):
+            self.flush()
@@ -0,0 +1,333 @@
+import os
+import time
+import tempfile
+from pathlib import Path
+from typing import List, Optional, Tuple
+import numpy as np
+import cv2
+import onnxruntime
+from insightface.app import FaceAnalysis
+from insightface.app.common import Face
+from insightface.model_zoo.scrfd import distance2bbox, distance2kps
+from insightface.utils import face_align
+
+from utils import get_insightface_root, get_appdata_path
+
+# Only detection (boxes + 5-point landmarks) and recognition are used by the app;
+# the landmark_3d_68, landmark_2d_106 and genderage models would run per face for nothing
+FACE_APP_MODULES = ['detection', 'recognition']
+
+
+DEFAULT_MODEL_NAME = 'buffalo_l'
+# Pack with the small SCRFD detector (det_500m) used to screen photos for faces
+SCREENING_MODEL_NAME = 'buffalo_s'
+
+# Which models run as dynamically quantized INT8 copies for each precision setting.
+# Detection is quantized separately since it costs more accuracy for small faces.
+MODEL_PRECISIONS = {
+    'fp32': (),
+    'int8_recognition': ('recognition',),
+    'int8': ('detection', 'recognition')
+}
+
+# SCRFD input sizes must be multiples of 32
+DETECTION_SIZES = [320, 480, 640, 800, 960]
+
+
+def get_model_version(face_app: FaceAnalysis, model_name: str = DEFAULT_MODEL_NAME) -> str:
+    """Tag stored with every embedding, so faces from another recognition model can be found later"""
+    rec_model = face_app.models['recognition']
+    return f"{model_name}/{os.path.basename(rec_model.model_file)}"
+
+
+def create_session_options(intra_op_threads: int = 0, inter_op_threads: int = 0) -> onnxruntime.SessionOptions:
+    options = onnxruntime.SessionOptions()
+    if intra_op_threads > 0:
+        options.intra_op_num_threads = intra_op_threads
+    if inter_op_threads > 0:
+        options.inter_op_num_threads = inter_op_threads
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_PARALLEL
+    return options
+
+
+def get_quantized_model_path(model_file: str, model_name: str = DEFAULT_MODEL_NAME) -> Path:
+    # The bundled model folder of the EXE is read-only, so quantized copies live in the app data folder
+    stem = os.path.splitext(os.path.basename(model_file))[0]
+    return get_appdata_path() / 'models' / model_name / f"{stem}_int8.onnx"
+
+
+def quantize_model(model_file: str, output_path: Path) -> Path:
+    """Write a dynamically quantized INT8 copy of an ONNX model; needs no calibration photos"""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    # Written next to the target and renamed, so worker processes starting together never load half a file
+    handle, temp_path = tempfile.mkstemp(suffix='.onnx', dir=str(output_path.parent))
+    os.close(handle)
+    try:
+        # uint8 weights: onnxruntime's CPU ConvInteger kernel has no int8 weight variant
+        quantize_dynamic(model_file, temp_path, weight_type=QuantType.QUInt8)
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return output_path
+
+
+def ensure_quantized_models(face_app: FaceAnalysis, precision: str, model_name: str = DEFAULT_MODEL_NAME,
+                            report=print) -> dict:
+    """Quantized model file per task for the precision, created on first use"""
+    model_files = {}
+    for task in MODEL_PRECISIONS.get(precision, ()):
+        model = face_app.models.get(task)
+        if model is None:
+            continue
+        output_path = get_quantized_model_path(model.model_file, model_name)
+        if not output_path.exists():
+            report(f"Quantizing the {task} model to INT8, this is done once...")
+            quantize_model(model.model_file, output_path)
+        model_files[task] = str(output_path)
+    return model_files
+
+
+def create_face_app(model_name: str = DEFAULT_MODEL_NAME, det_size: int = 640,
+                    intra_op_threads: int = 0, inter_op_threads: int = 0,
+                    precision: str = 'fp32', report=print) -> FaceAnalysis:
+    providers = ['CPUExecutionProvider']
+
+    face_app = FaceAnalysis(
+        name=model_name,
+        root=get_insightface_root(),
+        allowed_modules=FACE_APP_MODULES,
+        providers=providers
+    )
+
+    # The quantized graphs keep the input and output names and shapes of the originals,
+    # so only the file behind each model is swapped; model_file also tags the embeddings
+    quantized = ensure_quantized_models(face_app, precision, model_name, report)
+    for task, model_file in quantized.items():
+        face_app.models[task].model_file = model_file
+
+    # insightface does not forward session options to onnxruntime, so rebuild the
+    # sessions with the configured thread counts. Input/output names are unchanged.
+    if quantized or intra_op_threads > 0 or inter_op_threads > 0:
+        set_session_threads(face_app, intra_op_threads, inter_op_threads)
+
+    face_app.prepare(ctx_id=-1, det_size=(det_size, det_size))
+    return face_app
+
+
+def create_screening_app(det_size: int = 320, det_thresh: float = 0.3,
+                         intra_op_threads: int = 0, inter_op_threads: int = 0) -> FaceAnalysis:
+    """Small detector that only decides whether a photo may contain a face"""
+    # det_thresh is below the full detector's, so faces it would miss still reach the full detector
+    screen_app = FaceAnalysis(
+        name=SCREENING_MODEL_NAME,
+        root=get_insightface_root(),
+        allowed_modules=['detection'],
+        providers=['CPUExecutionProvider']
+    )
+
+    if intra_op_threads > 0 or inter_op_threads > 0:
+        set_session_threads(screen_app, intra_op_threads, inter_op_threads)
+
+    screen_app.prepare(ctx_id=-1, det_thresh=det_thresh, det_size=(det_size, det_size))
+    return screen_app
+
+
+def screening_app_from_settings(settings: dict, intra_op_threads: int = 0,
+                                inter_op_threads: int = 0) -> Optional[FaceAnalysis]:
+    if not settings.get('screening_enabled', False):
+        return None
+    return create_screening_app(
+        det_size=settings.get('screening_det_size', 320),
+        det_thresh=settings.get('screening_min_score', 0.3),
+        intra_op_threads=intra_op_threads,
+        inter_op_threads=inter_op_threads
+    )
+
+
+def set_session_threads(face_app: FaceAnalysis, intra_op_threads: int = 0, inter_op_threads: int = 0):
+    """Rebuild the model sessions with other thread counts; running inference finishes on the old session"""
+    options = create_session_options(intra_op_threads, inter_op_threads)
+    for model in face_app.models.values():
+        model.session = onnxruntime.InferenceSession(
+            model.model_file, sess_options=options, providers=['CPUExecutionProvider']
+        )
+
+
+class BatchedFaceAnalyzer:
+    """Runs detection and recognition over several decoded photos at once, matching FaceAnalysis.get"""
+
+    def __init__(self, face_app: FaceAnalysis, batch_size: int = 8, screen_app: Optional[FaceAnalysis] = None):
+        self.det_model = face_app.det_model
+        self.rec_model = face_app.models['recognition']
+        self.batch_size = max(1, int(batch_size))
+        self.detector = BatchedDetector(self.det_model, self.batch_size)
+        self.batched_detection = self.detector.batched
+        self.screener = BatchedDetector(screen_app.det_model, self.batch_size) if screen_app is not None else None
+
+    def analyze(self, images: List[np.ndarray], quality_gate=None, stats=None,
+                scales: Optional[List[Tuple[float, float]]] = None) -> List[List[Face]]:
+        """Detect and embed faces; faces the quality gate rejects get face.filtered and no embedding"""
+        detections = self.detect(images, stats)
+        # (scale_x, scale_y) per image from decode_for_detection, so the gate measures faces in original pixels
+        scales = scales or [(1.0, 1.0)] * len(images)
+
+        faces_per_image = []
+        embedded_faces = []
+        crops = []
+        for image, (dets, kpss), (scale_x, scale_y) in zip(images, detections, scales):
+            faces = []
+            for i in range(dets.shape[0]):
+                face = Face(bbox=dets[i, 0:4], kps=kpss[i] if kpss is not None else None, det_score=dets[i, 4])
+                if face.kps is None:
+                    continue
+                faces.append(face)
+
+                reason = quality_gate.check_detection(face, scale_x, scale_y) if quality_gate else None
+                crop = None
+                if reason is None:
+                    crop = self.align(image, face.kps)
+                    reason = quality_gate.check_crop(crop) if quality_gate else None
+
+                if reason is not None:
+                    face.filtered = reason
+                    continue
+                crops.append(crop)
+                embedded_faces.append(face)
+            faces_per_image.append(faces)
+
+        embeddings = self.embed(crops)
+        for face, embedding in zip(embedded_faces, embeddings):
+            face.embedding = embedding
+
+        return faces_per_image
+
+    def align(self, image: np.ndarray, kps: np.ndarray) -> np.ndarray:
+        return face_align.norm_crop(image, landmark=kps, image_size=self.rec_model.input_size[0])
+
+    def embed(self, crops: List[np.ndarray]) -> np.ndarray:
+        if not crops:
+            return np.zeros((0, 512), dtype=np.float32)
+
+        # Recognition crops are tiny (112x112), so batch them more aggressively than photos
+        chunk_size = self.batch_size * 8
+        chunks = [self.rec_model.get_feat(crops[i:i + chunk_size]) for i in range(0, len(crops), chunk_size)]
+        return np.vstack(chunks)
+
+    def detect(self, images: List[np.ndarray], stats=None) -> List[Tuple[np.ndarray, Optional[np.ndarray]]]:
+        if self.screener is None:
+            return self.detector.detect(images)
+
+        start = time.perf_counter()
+        candidates = [dets.shape[0] > 0 for dets, _ in self.screener.detect(images)]
+        screen_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        detected = iter(self.detector.detect([image for image, candidate in zip(images, candidates) if candidate]))
+        detect_seconds = time.perf_counter() - start
+
+        if stats is not None:
+            stats.add('screened_photos', len(images))
+            stats.add('screen_hits', sum(candidates))
+            stats.add('screen_seconds', screen_seconds)
+            stats.add('full_detect_seconds', detect_seconds)
+
+        no_faces = (np.zeros((0, 5), dtype=np.float32), None)
+        return [next(detected) if candidate else no_faces for candidate in candidates]
+
+
+class BatchedDetector:
+    """Runs an SCRFD detector over several decoded photos at once, letterboxed like SCRFD.detect"""
+
+    def __init__(self, det_model, batch_size: int = 8):
+        self.det_model = det_model
+        self.batch_size = max(1, int(batch_size))
+        self.input_size = tuple(self.det_model.input_size)
+
+        batch_dim = self.det_model.session.get_inputs()[0].shape[0]
+        self.batched = bool(self.det_model.batched) and not isinstance(batch_dim, int)
+
+    def detect(self, images: List[np.ndarray]) -> List[Tuple[np.ndarray, Optional[np.ndarray]]]:
+        if not self.batched or len(images) == 1:
+            return [self.det_model.detect(image, max_num=0, metric='default') for image in images]
+
+        results = []
+        for start in range(0, len(images), self.batch_size):
+            chunk = images[start:start + self.batch_size]
+            letterboxed, det_scales = zip(*(self._letterbox(image) for image in chunk))
+
+            det = self.det_model
+            blob = cv2.dnn.blobFromImages(
+                list(letterboxed), 1.0 / det.input_std, self.input_size,
+                (det.input_mean, det.input_mean, det.input_mean), swapRB=True
+            )
+            net_outs = det.session.run(det.output_names, {det.input_name: blob})
+
+            for batch_index, det_scale in enumerate(det_scales):
+                results.append(self._decode(net_outs, batch_index, det_scale, blob.shape[2], blob.shape[3]))
+
+        return results
+
+    def _letterbox(self, image: np.ndarray) -> Tuple[np.ndarray, float]:
+        input_width, input_height = self.input_size
+        im_ratio = float(image.shape[0]) / image.shape[1]
+        model_ratio = float(input_height) / input_width
+
+        if im_ratio > model_ratio:
+            new_height = input_height
+            new_width = int(new_height / im_ratio)
+        else:
+            new_width = input_width
+            new_height = int(new_width * im_ratio)
+
+        det_scale = float(new_height) / image.shape[0]
+        det_img = np.zeros((input_height, input_width, 3), dtype=np.uint8)
+        det_img[:new_height, :new_width, :] = cv2.resize(image, (new_width, new_height))
+        return det_img, det_scale
+
+    def _decode(self, net_outs, batch_index: int, det_scale: float, input_height: int, input_width: int):
+        """Per-image post-processing of a batched SCRFD run (mirrors SCRFD.forward and SCRFD.detect)"""
+        det = self.det_model
+        fmc = det.fmc
+        scores_list, bboxes_list, kpss_list = [], [], []
+
+        for idx, stride in enumerate(det._feat_stride_fpn):
+            scores = net_outs[idx][batch_index]
+            bbox_preds = net_outs[idx + fmc][batch_index] * stride
+
+            height = input_height // stride
+            width = input_width // stride
+            key = (height, width, stride)
+            anchor_centers = det.center_cache.get(key)
+            if anchor_centers is None:
+                anchor_centers = np.stack(np.mgrid[:height, :width][::-1], axis=-1).astype(np.float32)
+                anchor_centers = (anchor_centers * stride).reshape((-1, 2))
+                if det._num_anchors > 1:
+                    anchor_centers = np.stack([anchor_centers] * det._num_anchors, axis=1).reshape((-1, 2))
+                if len(det.center_cache) < 100:
+                    det.center_cache[key] = anchor_centers
+
+            pos_inds = np.where(scores >= det.det_thresh)[0]
+            scores_list.append(scores[pos_inds])
+            bboxes_list.append(distance2bbox(anchor_centers, bbox_preds)[pos_inds])
+
+            if det.use_kps:
+                kps_preds = net_outs[idx + fmc * 2][batch_index] * stride
+                kpss = distance2kps(anchor_centers, kps_preds)
+                kpss_list.append(kpss.reshape((kpss.shape[0], -1, 2))[pos_inds])
+
+        scores = np.vstack(scores_list)
+        order = scores.ravel().argsort()[::-1]
+        bboxes = np.vstack(bboxes_list) / det_scale
+
+        pre_det = np.hstack((bboxes, scores)).astype(np.float32, copy=False)[order, :]
+        keep = det.nms(pre_det)
+        dets = pre_det[keep, :]
+
+        kpss = None
+        if det.use_kps:
+            kpss = (np.vstack(kpss_list) / det_scale)[order, :, :][keep, :, :]
+
+        return dets, kpss
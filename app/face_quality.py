@@ -0,0 +1,45 @@
+from typing import Optional
+import numpy as np
+import cv2
+
+
+class QualityGate:
+    """Rejects faces that are too small, too uncertain or too blurred to cluster usefully"""
+
+    # The face size is in pixels of the original photo, the blur score measured on the aligned
+    # 112x112 crop the recognition model sees; a threshold of 0 disables its check
+    def __init__(self, min_face_size: int = 0, min_det_score: float = 0.0, min_blur_score: float = 0.0):
+        self.min_face_size = min_face_size
+        self.min_det_score = min_det_score
+        self.min_blur_score = min_blur_score
+
+    @classmethod
+    def from_settings(cls, settings: dict) -> Optional['QualityGate']:
+        if not settings.get('quality_gate_enabled'):
+            return None
+        return cls(
+            settings.get('quality_min_face_size', 0) or 0,
+            settings.get('quality_min_det_score', 0.0) or 0.0,
+            settings.get('quality_min_blur_score', 0.0) or 0.0
+        )
+
+    def check_detection(self, face, scale_x: float = 1.0, scale_y: float = 1.0) -> Optional[str]:
+        """Reason to reject a face from its detection alone, or None; the scales map a reduced decode's bbox back"""
+        if self.min_face_size > 0:
+            x1, y1, x2, y2 = face.bbox[:4]
+            if min((x2 - x1) * scale_x, (y2 - y1) * scale_y) < self.min_face_size:
+                return 'small'
+        if self.min_det_score > 0 and face.det_score < self.min_det_score:
+            return 'low_score'
+        return None
+
+    def check_crop(self, crop: np.ndarray) -> Optional[str]:
+        if self.min_blur_score > 0 and blur_score(crop) < self.min_blur_score:
+            return 'blurred'
+        return None
+
+
+def blur_score(image: np.ndarray) -> float:
+    """Variance of the Laplacian: low for blurred images, which lack sharp edges"""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
@@ -1,4 +1,5 @@
 import argparse
+import multiprocessing
 import torch
 import webview
 
@@ -58,4 +59,6 @@ def main():
 
 
 if __name__ == "__main__":
+    # Scan worker processes are spawned; a frozen EXE must hand them off here
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,247 @@
+import os
+import time
+import threading
+from typing import Callable, List, Optional
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+    WATCHDOG_AVAILABLE = True
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+    WATCHDOG_AVAILABLE = False
+
+from discovery import IMAGE_EXTENSIONS
+from path_filter import PathFilter
+from photo_io import HASH_VERSION_MD5, compute_file_hash
+
+
+def is_image_path(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS
+
+
+class WatchBatch:
+    """What one debounced batch of file system events changed in the database"""
+
+    def __init__(self):
+        self.queued = 0
+        self.removed = 0
+        self.relocated = 0
+
+    def __bool__(self):
+        return bool(self.queued or self.removed or self.relocated)
+
+
+class _EventCollector(FileSystemEventHandler):
+    def __init__(self, watcher: 'FolderWatcher'):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_created(self, event):
+        self.watcher.add_event('created', event.src_path, event.is_directory)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.watcher.add_event('modified', event.src_path, False)
+
+    def on_deleted(self, event):
+        self.watcher.add_event('deleted', event.src_path, event.is_directory)
+
+    def on_moved(self, event):
+        self.watcher.add_event('moved', event.src_path, event.is_directory, event.dest_path)
+
+
+class FolderWatcher:
+    """Feeds file system notifications from the include folders into the scan queue"""
+
+    def __init__(self, db, get_path_filter: Callable[[], PathFilter], on_batch: Callable[[WatchBatch], None],
+                 report: Optional[Callable[[str], None]] = None, debounce: float = 2.0, max_delay: float = 10.0):
+        self.db = db
+        self.get_path_filter = get_path_filter
+        self.on_batch = on_batch
+        self.report = report or (lambda message: None)
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.folders = []
+
+        self._observer = None
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._events = []
+        self._first_event = None
+        self._last_event = None
+
+    def start(self, folders: List[str]) -> bool:
+        if not WATCHDOG_AVAILABLE:
+            self.report("Watching folders needs the watchdog package (pip install watchdog)")
+            return False
+
+        self.folders = [folder for folder in folders if os.path.isdir(folder)]
+        if not self.folders:
+            return False
+
+        self._observer = Observer()
+        handler = _EventCollector(self)
+        for folder in self.folders:
+            try:
+                self._observer.schedule(handler, folder, recursive=True)
+            except OSError as e:
+                self.report(f"ERROR: Cannot watch {folder}: {str(e)}")
+        self._observer.start()
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self.report(f"Watching {len(self.folders)} folder(s) for new, changed and deleted photos")
+        return True
+
+    def stop(self):
+        self._stop_event.set()
+        if self._observer is not None:
+            try:
+                self._observer.stop()
+                self._observer.join(timeout=2)
+            except Exception as e:
+                print(f"Error stopping folder watcher: {e}")
+            self._observer = None
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def stopped(self) -> bool:
+        return self._stop_event.is_set()
+
+    def add_event(self, kind: str, path: str, is_directory: bool, dest_path: Optional[str] = None):
+        now = time.monotonic()
+        with self._lock:
+            self._events.append((kind, os.path.normpath(path), is_directory,
+                                 os.path.normpath(dest_path) if dest_path else None))
+            if self._first_event is None:
+                self._first_event = now
+            self._last_event = now
+
+    def _take_ready_events(self) -> list:
+        # Once the folders were quiet for debounce seconds, or after max_delay while files keep arriving
+        with self._lock:
+            if not self._events:
+                return []
+            now = time.monotonic()
+            quiet = now - self._last_event >= self.debounce
+            overdue = now - self._first_event >= self.max_delay
+            if not (quiet or overdue):
+                return []
+            events, self._events = self._events, []
+            self._first_event = None
+            return events
+
+    def _run(self):
+        while not self._stop_event.wait(0.5):
+            events = self._take_ready_events()
+            if not events:
+                continue
+
+            try:
+                batch = self.apply(events)
+                if batch:
+                    self.on_batch(batch)
+            except Exception as e:
+                self.report(f"ERROR: Folder watcher failed to apply changes: {str(e)}")
+
+    def apply(self, events) -> WatchBatch:
+        """Apply a batch of (kind, path, is_directory, dest_path) events to the database"""
+        path_filter = self.get_path_filter()
+        batch = WatchBatch()
+        changed = set()
+        removed = set()
+
+        def watched(path):
+            return is_image_path(path) and not path_filter.excludes(path)
+
+        for kind, path, is_directory, dest_path in events:
+            if kind == 'moved':
+                if is_directory:
+                    batch.relocated += self.db.relocate_folder(path, dest_path)
+                    changed.update(self._list_images(dest_path))
+                    continue
+
+                removed.add(path)
+                if watched(dest_path):
+                    state = self.db.get_photo_states([path]).get(path)
+                    if state is not None and self.db.get_photo_id(dest_path) is None:
+                        batch.relocated += self.db.relocate_photos([(state['photo_id'], dest_path, None)])
+                        removed.discard(path)
+                    changed.add(dest_path)
+            elif kind == 'deleted':
+                if is_directory:
+                    batch.removed += self.db.remove_photos_under(path)
+                else:
+                    removed.add(path)
+            elif is_directory:
+                # A folder copied or moved in from outside: only its own files are listed
+                changed.update(self._list_images(path))
+            else:
+                changed.add(path)
+
+        # Photos that still exist but are now excluded, e.g. moved into an excluded folder, are removed too
+        gone = [path for path in removed if not os.path.exists(path)]
+        gone.extend(path for path in changed if is_image_path(path) and path_filter.excludes(path))
+        if gone:
+            batch.removed += self.db.remove_photos(gone)
+
+        batch.queued += self._queue_changed([path for path in changed if watched(path)])
+        return batch
+
+    def _list_images(self, folder: str) -> List[str]:
+        images = []
+        for root, _, files in os.walk(folder):
+            images.extend(os.path.join(root, name) for name in files if is_image_path(name))
+        return images
+
+    def _queue_changed(self, paths: List[str]) -> int:
+        entries = []
+        states = self.db.get_photo_states(paths)
+        edited = []
+        unchanged = []
+
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if not os.path.isfile(path):
+                continue
+
+            state = states.get(path)
+            if state is None:
+                entries.append((path, stat.st_mtime, True))
+            elif state['scan_status'] != 'completed':
+                entries.append((path, stat.st_mtime, False))
+            elif state['file_size'] is not None and state['file_size'] != stat.st_size or \
+                    state['file_mtime'] is not None and state['file_mtime'] != stat.st_mtime:
+                # A touch or a backup tool only changes the mtime: rescan only when the content changed
+                if self._content_unchanged(path, state):
+                    unchanged.append((state['photo_id'], stat.st_size, stat.st_mtime))
+                    continue
+                # Edited in place: the rescan replaces its faces, carrying their tags over
+                edited.append(path)
+                entries.append((path, stat.st_mtime, True))
+
+        if unchanged:
+            self.db.update_photo_stats(unchanged)
+        if edited:
+            self.db.mark_photos_for_rescan(edited)
+        return self.db.add_to_scan_queue(entries) if entries else 0
+
+    def _content_unchanged(self, path: str, state: dict) -> bool:
+        if not state['file_hash']:
+            return False
+        try:
+            return compute_file_hash(path, state['hash_version'] or HASH_VERSION_MD5) == state['file_hash']
+        except OSError:
+            return False
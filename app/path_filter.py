@@ -0,0 +1,95 @@
+import os
+import re
+import fnmatch
+from typing import List, Optional
+
+
+class _PrefixTrie:
+    """Answers `path.startswith(folder)` for many folders in one walk over the path"""
+
+    def __init__(self, folders: List[str]):
+        self.root = ({}, [])
+        self.empty = True
+        for folder in folders:
+            self.add(folder)
+
+    def add(self, normalized_folder: str):
+        # The last folder component only has to prefix a path component, like startswith
+        # ("C:\\Photos" matches "C:\\Photos2"), so it is a terminal on its parent, not an edge
+        parts = normalized_folder.split(os.sep)
+        node = self.root
+        for part in parts[:-1]:
+            children = node[0]
+            if part not in children:
+                children[part] = ({}, [])
+            node = children[part]
+        if parts[-1] not in node[1]:
+            node[1].append(parts[-1])
+        self.empty = False
+
+    def matches(self, path_parts: List[str]) -> bool:
+        node = self.root
+        for part in path_parts:
+            for terminal in node[1]:
+                if part.startswith(terminal):
+                    return True
+            node = node[0].get(part)
+            if node is None:
+                return False
+        return False
+
+
+class PathFilter:
+    """Include/exclude/wildcard rules compiled once and reused for every path in a scan"""
+
+    def __init__(self, include_folders: List[str], exclude_folders: List[str], wildcard_text: str):
+        self.has_includes = bool(include_folders)
+        self.include_trie = _PrefixTrie([os.path.normpath(f) for f in include_folders])
+
+        exclude_prefixes = [os.path.normpath(f) for f in exclude_folders]
+        component_patterns = []
+
+        if wildcard_text:
+            for wildcard in (w.strip() for w in wildcard_text.split(',')):
+                if not wildcard:
+                    continue
+                wildcard_normalized = os.path.normpath(wildcard)
+                if os.path.isabs(wildcard_normalized):
+                    exclude_prefixes.append(wildcard_normalized)
+                else:
+                    # fnmatch.fnmatch applies normcase to both sides; do the same once here
+                    component_patterns.append(fnmatch.translate(os.path.normcase(wildcard)))
+
+        self.exclude_trie = _PrefixTrie(exclude_prefixes)
+        self.wildcard_regex: Optional[re.Pattern] = (
+            re.compile('|'.join(component_patterns)) if component_patterns else None
+        )
+
+    @classmethod
+    def from_api(cls, api) -> 'PathFilter':
+        return cls(
+            api.get_include_folders(),
+            api.get_exclude_folders(),
+            api.get_wildcard_exclusions()
+        )
+
+    def excludes(self, path: str) -> bool:
+        if not self.has_includes:
+            return False
+
+        path_normalized = os.path.normpath(path)
+        parts = path_normalized.split(os.sep)
+
+        if not self.include_trie.matches(parts):
+            return True
+
+        if not self.exclude_trie.empty and self.exclude_trie.matches(parts):
+            return True
+
+        if self.wildcard_regex is not None:
+            match = self.wildcard_regex.match
+            for part in os.path.normcase(path_normalized).split(os.sep):
+                if match(part):
+                    return True
+
+        return False
@@ -0,0 +1,116 @@
+import hashlib
+import math
+from io import BytesIO
+from typing import Optional, Tuple, Union
+import numpy as np
+import cv2
+from PIL import Image, ImageOps
+
+# Version of the content hash stored in photos.file_hash / photos.hash_version.
+# 1 = md5 of the whole file (legacy rows), 2 = 128-bit blake2b.
+HASH_VERSION_MD5 = 1
+HASH_VERSION_BLAKE2B = 2
+HASH_VERSION = HASH_VERSION_BLAKE2B
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _new_hasher(hash_version: int):
+    if hash_version == HASH_VERSION_MD5:
+        return hashlib.md5()
+    if hash_version == HASH_VERSION_BLAKE2B:
+        return hashlib.blake2b(digest_size=16)
+    raise ValueError(f"Unknown hash version: {hash_version}")
+
+
+def read_photo_bytes(file_path: str) -> bytes:
+    """Read a photo once so the same buffer can be hashed and decoded"""
+    with open(file_path, 'rb') as f:
+        return f.read()
+
+
+def hash_bytes(data, hash_version: int = HASH_VERSION) -> str:
+    hasher = _new_hasher(hash_version)
+    hasher.update(memoryview(data))
+    return hasher.hexdigest()
+
+
+def compute_file_hash(file_path: str, hash_version: int = HASH_VERSION) -> str:
+    """Stream a file through the hasher without holding it in memory"""
+    hasher = _new_hasher(hash_version)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+# EXIF orientations that swap width and height when applied
+TRANSPOSING_ORIENTATIONS = {5, 6, 7, 8}
+
+
+def decode_for_detection(data, max_side: int = 0) -> Tuple[np.ndarray, float, float]:
+    """EXIF-oriented BGR image at most max_side wide and high (0: full size), and the x/y scale back"""
+    pil_image = Image.open(BytesIO(data))
+    original_width, original_height = pil_image.size
+    longest_side = max(original_width, original_height)
+
+    if max_side and longest_side > max_side:
+        ratio = max_side / longest_side
+        requested = (max(1, int(original_width * ratio)), max(1, int(original_height * ratio)))
+
+        # JPEGs are downscaled in the DCT domain, other formats reduced right after decoding
+        if pil_image.format == 'JPEG':
+            pil_image.draft('RGB', requested)
+
+        factor = max(pil_image.size) // max_side
+        if factor >= 2:
+            pil_image = pil_image.reduce(factor)
+
+        # draft and reduce only get within a factor of two of max_side
+        if max(pil_image.size) > max_side:
+            pil_image = pil_image.resize(thumbnail_size(*pil_image.size, max_side), Image.Resampling.BILINEAR)
+
+    decoded_width, decoded_height = pil_image.size
+    scale_x = original_width / decoded_width
+    scale_y = original_height / decoded_height
+
+    orientation = pil_image.getexif().get(0x0112, 1)
+    pil_image = ImageOps.exif_transpose(pil_image)
+    if orientation in TRANSPOSING_ORIENTATIONS:
+        scale_x, scale_y = scale_y, scale_x
+
+    if pil_image.mode != 'RGB':
+        pil_image = pil_image.convert('RGB')
+
+    image_bgr = cv2.cvtColor(np.asarray(pil_image), cv2.COLOR_RGB2BGR)
+    return image_bgr, scale_x, scale_y
+
+
+def read_photo_header(source: Union[str, bytes]) -> dict:
+    """Stored (not oriented) width, height and EXIF orientation, from the headers only"""
+    with Image.open(BytesIO(source) if isinstance(source, (bytes, bytearray, memoryview)) else source) as pil_image:
+        width, height = pil_image.size
+        orientation = pil_image.getexif().get(0x0112, 1)
+    return {'width': width, 'height': height, 'orientation': orientation}
+
+
+def oriented_size(width: int, height: int, orientation: Optional[int]) -> Tuple[int, int]:
+    if orientation in TRANSPOSING_ORIENTATIONS:
+        return height, width
+    return width, height
+
+
+def thumbnail_size(width: int, height: int, max_size: int) -> Tuple[int, int]:
+    """The size Image.thumbnail((max_size, max_size)) would produce, without an image"""
+    if width <= max_size and height <= max_size:
+        return width, height
+
+    def round_aspect(number, key):
+        return max(min(math.floor(number), math.ceil(number), key=key), 1)
+
+    aspect = width / height
+    if aspect <= 1:
+        new_width = round_aspect(max_size * aspect, key=lambda n: abs(aspect - n / max_size))
+        return new_width, max_size
+    new_height = round_aspect(max_size / aspect, key=lambda n: 0 if n == 0 else abs(aspect - max_size / n))
+    return max_size, new_height
@@ -0,0 +1,193 @@
+import threading
+import queue
+import time
+from typing import Callable, Iterable, List, Optional
+
+
+_END_OF_STREAM = object()
+
+
+class PipelineStage:
+    """A pool of worker threads applying one function to every item, or to lists of up to batch_size"""
+
+    def __init__(self, name: str, func: Callable, workers: int = 1, queue_size: int = 8,
+                 batch_size: int = 1, batch_wait: float = 0.05):
+        self.name = name
+        self.func = func
+        self.workers = max(1, int(workers))
+        self.batch_size = max(1, int(batch_size))
+        self.batch_wait = batch_wait
+        self.queue_size = max(1, int(queue_size), self.batch_size)
+        self.items_processed = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, elapsed: float, count: int = 1):
+        with self._lock:
+            self.items_processed += count
+            self.busy_seconds += elapsed
+
+    def next_batch(self, in_queue: queue.Queue):
+        """Collect up to batch_size items; returns (items, reached_end_of_stream)"""
+        items = []
+        item = in_queue.get()
+        if item is _END_OF_STREAM:
+            return items, True
+        items.append(item)
+
+        while len(items) < self.batch_size:
+            try:
+                item = in_queue.get(timeout=self.batch_wait)
+            except queue.Empty:
+                break
+            if item is _END_OF_STREAM:
+                return items, True
+            items.append(item)
+
+        return items, False
+
+
+class ScanStats:
+    """Thread-safe counters collected by the pipeline stages during a scan"""
+
+    def __init__(self):
+        self._counters = {}
+        self._lock = threading.Lock()
+        self.started_at = time.perf_counter()
+
+    def add(self, name: str, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def get(self, name: str, default=0):
+        with self._lock:
+            return self._counters.get(name, default)
+
+    def counters(self) -> dict:
+        with self._lock:
+            return dict(self._counters)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+
+class ScanPipeline:
+    """Runs items through stages connected by bounded queues; the sink runs on the calling thread"""
+
+    def __init__(self, stages: List[PipelineStage], stop_event: Optional[threading.Event] = None):
+        self.stages = stages
+        self.stop_event = stop_event or threading.Event()
+        self.errors = []
+        self._threads = []
+
+    def run(self, source: Iterable, sink: Callable):
+        # Bounded, so a slow stage stalls the ones before it instead of letting decoded images pile up
+        queues = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        queues.append(queue.Queue(maxsize=self.stages[-1].queue_size if self.stages else 8))
+
+        consumers = [stage.workers for stage in self.stages] + [1]
+        remaining = [stage.workers for stage in self.stages]
+        remaining_lock = threading.Lock()
+
+        def feed():
+            try:
+                for item in source:
+                    if self.stop_event.is_set():
+                        break
+                    queues[0].put(item)
+            except Exception as e:
+                self.errors.append(e)
+                self.stop_event.set()
+            finally:
+                for _ in range(consumers[0]):
+                    queues[0].put(_END_OF_STREAM)
+
+        def work(index: int):
+            stage = self.stages[index]
+            in_queue = queues[index]
+            out_queue = queues[index + 1]
+
+            reached_end = False
+            while not reached_end:
+                if stage.batch_size > 1:
+                    items, reached_end = stage.next_batch(in_queue)
+                else:
+                    item = in_queue.get()
+                    reached_end = item is _END_OF_STREAM
+                    items = [] if reached_end else [item]
+
+                # Keep draining after a stop so upstream puts never block forever
+                if not items or self.stop_event.is_set():
+                    continue
+
+                start = time.perf_counter()
+                try:
+                    if stage.batch_size > 1:
+                        results = stage.func(items)
+                    else:
+                        results = [stage.func(items[0])]
+                except Exception as e:
+                    self.errors.append(e)
+                    self.stop_event.set()
+                    continue
+                stage.record(time.perf_counter() - start, len(items))
+
+                for result in results:
+                    if result is not None:
+                        out_queue.put(result)
+
+            with remaining_lock:
+                remaining[index] -= 1
+                last_worker = remaining[index] == 0
+
+            if last_worker:
+                for _ in range(consumers[index + 1]):
+                    out_queue.put(_END_OF_STREAM)
+
+        self._threads = [threading.Thread(target=feed, daemon=True, name="ScanPipeline-source")]
+        for index, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                self._threads.append(threading.Thread(
+                    target=work,
+                    args=(index,),
+                    daemon=True,
+                    name=f"ScanPipeline-{stage.name}-{n}"
+                ))
+
+        for thread in self._threads:
+            thread.start()
+
+        sink_queue = queues[-1]
+        sink_error = None
+
+        while True:
+            result = sink_queue.get()
+            if result is _END_OF_STREAM:
+                break
+
+            if self.stop_event.is_set():
+                continue
+
+            try:
+                sink(result)
+            except Exception as e:
+                sink_error = e
+                self.stop_event.set()
+
+        for thread in self._threads:
+            thread.join()
+
+        if sink_error is not None:
+            raise sink_error
+
+    def stop(self):
+        self.stop_event.set()
+
+    def get_stage_summary(self) -> List[str]:
+        lines = []
+        for stage in self.stages:
+            lines.append(
+                f"  {stage.name}: {stage.items_processed} items, "
+                f"{stage.busy_seconds:.1f}s busy across {stage.workers} worker(s)"
+            )
+        return lines
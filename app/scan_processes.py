@@ -0,0 +1,246 @@
+import os
+import time
+import threading
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Iterable, List, Optional
+import numpy as np
+
+from photo_io import HASH_VERSION, read_photo_bytes, hash_bytes, decode_for_detection, read_photo_header
+from scan_pipeline import ScanStats
+
+# Per-process state, set once by init_scan_process when the pool starts a worker
+_analyzer = None
+_quality_gate = None
+_model_version = None
+_detection_max_side = 0
+
+
+def default_process_workers(onnx_threads: int) -> int:
+    return max(1, (os.cpu_count() or 2) // max(1, onnx_threads))
+
+
+def init_scan_process(inference_batch_size: int, onnx_threads: int, detection_max_side: int,
+                      quality_settings: Optional[dict] = None, low_priority: bool = False,
+                      det_size: int = 640, precision: str = 'fp32', screening_settings: Optional[dict] = None):
+    """Load the face model once per worker process"""
+    global _analyzer, _quality_gate, _model_version, _detection_max_side
+
+    if low_priority:
+        from scheduler import lower_priority
+        lower_priority(process_wide=True)
+
+    from face_models import create_face_app, get_model_version, screening_app_from_settings, BatchedFaceAnalyzer
+    from face_quality import QualityGate
+
+    face_app = create_face_app(det_size=det_size, intra_op_threads=onnx_threads, precision=precision)
+    screen_app = screening_app_from_settings(screening_settings or {}, intra_op_threads=onnx_threads)
+    _analyzer = BatchedFaceAnalyzer(face_app, inference_batch_size, screen_app)
+    _quality_gate = QualityGate.from_settings(quality_settings or {})
+    _model_version = get_model_version(face_app)
+    _detection_max_side = detection_max_side
+
+
+def scan_photos(file_paths: List[str]) -> List[dict]:
+    """Read, hash, decode and analyse a chunk of photos inside a worker process"""
+    # Only what the parent writes goes back, faces as compact float32 matrices; never decoded images
+    results = []
+    images = []
+    pending = []
+
+    for file_path in file_paths:
+        result = {'file_path': file_path, 'status': 'error', 'messages': [], 'details': [], 'stats': {}}
+        results.append(result)
+        name = os.path.basename(file_path)
+
+        try:
+            start = time.perf_counter()
+            result['file_mtime'] = os.stat(file_path).st_mtime
+            data = read_photo_bytes(file_path)
+            result['file_hash'] = hash_bytes(data)
+            result['hash_version'] = HASH_VERSION
+            result['file_size'] = len(data)
+            result['status'] = 'pending'
+            result['stats'] = {'read_seconds': time.perf_counter() - start, 'bytes_read': len(data), 'photos_read': 1}
+        except FileNotFoundError:
+            result['messages'].append(f"ERROR: File not found - {name}")
+            continue
+        except Exception as e:
+            result['messages'].append(f"ERROR: Exception reading {name}: {str(e)}")
+            continue
+
+        try:
+            result.update(read_photo_header(data))
+        except Exception:
+            pass
+
+        try:
+            start = time.perf_counter()
+            image, scale_x, scale_y = decode_for_detection(data, _detection_max_side)
+            result['stats']['decode_seconds'] = time.perf_counter() - start
+        except Exception as e:
+            result['messages'].append(f"ERROR: Cannot read image - {name}: {str(e)}")
+            result['status'] = 'error'
+            continue
+
+        result['scale'] = np.array([scale_x, scale_y] * 2, dtype=np.float32)
+        images.append(image)
+        pending.append(result)
+
+    if not pending:
+        return results
+
+    start = time.perf_counter()
+    batch_stats = ScanStats()
+    scales = [tuple(result['scale'][:2].tolist()) for result in pending]
+    try:
+        faces_per_photo = _analyzer.analyze(images, _quality_gate, batch_stats, scales)
+    except Exception:
+        faces_per_photo = []
+        batch_stats = ScanStats()
+        for result, image, scale in zip(pending, images, scales):
+            try:
+                faces_per_photo.append(_analyzer.analyze([image], _quality_gate, batch_stats, [scale])[0])
+            except Exception as e:
+                result['messages'].append(f"ERROR: Exception processing {os.path.basename(result['file_path'])}: {str(e)}")
+                faces_per_photo.append(None)
+    detect_seconds = (time.perf_counter() - start) / len(pending)
+    # Counted per chunk; the parent only sums the stats of all results
+    pending[0]['stats'].update(batch_stats.counters())
+
+    for result, faces in zip(pending, faces_per_photo):
+        scale = result.pop('scale')
+        result['stats']['detect_seconds'] = detect_seconds
+        if faces is None:
+            result['status'] = 'error'
+            continue
+
+        if len(faces) == 0:
+            result['details'].append(f"INFO: No faces detected - {result['file_path']}")
+        else:
+            result['details'].append(f"INFO: Found {len(faces)} face(s) - {result['file_path']}")
+
+        embeddings = np.zeros((len(faces), 512), dtype=np.float32)
+        bboxes = np.zeros((len(faces), 4), dtype=np.float32)
+        landmarks = np.zeros((len(faces), 5, 2), dtype=np.float32)
+        det_scores = np.zeros(len(faces), dtype=np.float32)
+        filtered = [face.filtered for face in faces]
+        for i, face in enumerate(faces):
+            if not face.filtered:
+                embeddings[i] = face.embedding / np.linalg.norm(face.embedding)
+            bboxes[i] = face.bbox * scale
+            landmarks[i] = face.kps * scale[:2]
+            det_scores[i] = face.det_score
+
+        result['stats']['faces_detected'] = len(faces)
+        for reason in filtered:
+            if reason:
+                result['stats']['faces_filtered'] = result['stats'].get('faces_filtered', 0) + 1
+                key = f'faces_filtered_{reason}'
+                result['stats'][key] = result['stats'].get(key, 0) + 1
+
+        result['embeddings'] = embeddings
+        result['bboxes'] = bboxes
+        result['landmarks'] = landmarks
+        result['det_scores'] = det_scores
+        result['filtered'] = filtered
+        result['model_version'] = _model_version
+        result['status'] = 'completed'
+
+    return results
+
+
+def expand_faces(result: dict) -> dict:
+    """Turn the compact matrices of a worker result into the per-face dicts the writer expects"""
+    embeddings = result.pop('embeddings', None)
+    bboxes = result.pop('bboxes', None)
+    landmarks = result.pop('landmarks', None)
+    det_scores = result.pop('det_scores', None)
+    filtered = result.pop('filtered', None)
+    result['faces'] = [] if embeddings is None else [
+        {'embedding': None if filtered[i] else embeddings[i], 'bbox': bboxes[i].tolist(), 'kps': landmarks[i],
+         'det_score': float(det_scores[i])}
+        for i in range(len(embeddings))
+    ]
+    return result
+
+
+class ProcessScanPool:
+    """Scans photos in worker processes, since insightface holds the GIL for much of every photo"""
+
+    def __init__(self, workers: int, onnx_threads: int, inference_batch_size: int,
+                 detection_max_side: int, quality_settings: Optional[dict] = None,
+                 stop_event: Optional[threading.Event] = None, low_priority: bool = False, scheduler=None,
+                 det_size: int = 640, precision: str = 'fp32', screening_settings: Optional[dict] = None):
+        self.onnx_threads = max(1, int(onnx_threads))
+        self.workers = int(workers) if workers and workers > 0 else default_process_workers(self.onnx_threads)
+        self.chunk_size = max(1, int(inference_batch_size))
+        self.detection_max_side = detection_max_side
+        self.quality_settings = quality_settings or {}
+        self.stop_event = stop_event or threading.Event()
+        self.low_priority = low_priority
+        self.scheduler = scheduler
+        self.det_size = det_size
+        self.precision = precision
+        self.screening_settings = screening_settings or {}
+        self.errors = []
+
+    def max_in_flight(self) -> int:
+        if self.scheduler is None or self.scheduler.concurrency >= self.workers:
+            return self.workers * 2
+        return self.scheduler.concurrency
+
+    def run(self, file_paths: Iterable[str], sink: Callable[[dict], None]):
+        # Chunks are cut lazily, so a source that claims work from the scan queue is only drained as fast as it is scanned
+        paths = iter(file_paths)
+        source_exhausted = False
+
+        # spawn instead of fork: onnxruntime and torch thread pools do not survive a fork
+        context = multiprocessing.get_context('spawn')
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=init_scan_process,
+            initargs=(self.chunk_size, self.onnx_threads, self.detection_max_side, self.quality_settings,
+                      self.low_priority, self.det_size, self.precision, self.screening_settings)
+        )
+
+        in_flight = {}
+        try:
+            while True:
+                while not self.stop_event.is_set() and not source_exhausted and len(in_flight) < self.max_in_flight():
+                    chunk = list(itertools.islice(paths, self.chunk_size))
+                    if not chunk:
+                        source_exhausted = True
+                        break
+                    future = executor.submit(scan_photos, chunk)
+                    in_flight[future] = chunk
+
+                if not in_flight:
+                    break
+
+                done, _ = wait(list(in_flight), timeout=0.5, return_when=FIRST_COMPLETED)
+                for future in done:
+                    chunk = in_flight.pop(future)
+                    if future.cancelled() or self.stop_event.is_set():
+                        continue
+                    try:
+                        results = future.result()
+                    except Exception as e:
+                        # A crashed or broken worker takes the whole pool down with it
+                        self.errors.append(e)
+                        self.stop_event.set()
+                        results = [{'file_path': path, 'status': 'error', 'messages': [], 'stats': {}} for path in chunk]
+
+                    for result in results:
+                        sink(expand_faces(result))
+
+                if self.stop_event.is_set():
+                    for future in in_flight:
+                        future.cancel()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def stop(self):
+        self.stop_event.set()
@@ -0,0 +1,240 @@
+import os
+import sys
+import time
+import threading
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+BACKGROUND_NICE = 10
+
+
+def lower_priority(process_wide: bool = False) -> bool:
+    """Lower the CPU and I/O priority of the calling thread and of what it starts afterwards"""
+    # Elsewhere than Linux priority is per process and would slow the UI down too, so it is only
+    # changed with process_wide (scan worker processes). It cannot be raised again without privileges.
+    try:
+        if sys.platform.startswith('linux'):
+            thread_id = threading.get_native_id()
+            current = os.getpriority(os.PRIO_PROCESS, thread_id)
+            os.setpriority(os.PRIO_PROCESS, thread_id, max(current, BACKGROUND_NICE))
+            if psutil is not None:
+                psutil.Process(thread_id).ionice(psutil.IOPRIO_CLASS_BE, 7)
+            return True
+
+        if not process_wide:
+            return False
+
+        if sys.platform == 'win32':
+            if psutil is None:
+                return False
+            process = psutil.Process()
+            process.nice(psutil.BELOW_NORMAL_PRIORITY_CLASS)
+            process.ionice(psutil.IOPRIO_LOW)
+        else:
+            os.nice(BACKGROUND_NICE)
+        return True
+    except Exception as e:
+        print(f"Could not lower scan priority: {e}")
+        return False
+
+
+def process_cpu_seconds(include_children: bool = False) -> Optional[float]:
+    """CPU time used by this process, and its worker processes when asked; None when that cannot be measured"""
+    if psutil is None:
+        # Without psutil the CPU time of running child processes is not visible
+        return None if include_children else time.process_time()
+
+    process = psutil.Process()
+    times = process.cpu_times()
+    total = times.user + times.system
+    if include_children:
+        for child in process.children(recursive=True):
+            try:
+                child_times = child.cpu_times()
+                total += child_times.user + child_times.system
+            except psutil.Error:
+                pass
+    return total
+
+
+class ResourceScheduler:
+    """Keeps a scan within a CPU or photos-per-second budget while it runs in the background"""
+
+    CONTROL_INTERVAL = 1.0
+    REPORT_INTERVAL = 30.0
+    MAX_PAUSE = 4.0
+    # Rebuilding the ONNX sessions takes a moment, so a quick switch between windows does not trigger it
+    ONNX_SWITCH_DELAY = 10.0
+
+    def __init__(self, is_background: Callable[[], bool], max_concurrency: int, mode: str = 'cpu',
+                 cpu_percent: float = 25, photos_per_second: float = 2.0, include_children: bool = False,
+                 threads_per_slot: int = 1, report: Optional[Callable[[str], None]] = None,
+                 stop_event: Optional[threading.Event] = None):
+        self.is_background = is_background
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.mode = mode if mode in ('cpu', 'photos') else 'cpu'
+        self.cpu_percent = min(100.0, max(1.0, float(cpu_percent)))
+        self.photos_per_second = max(0.01, float(photos_per_second))
+        self.include_children = include_children
+        self.threads_per_slot = max(1, int(threads_per_slot))
+        self.report = report or (lambda message: None)
+        self.stop_event = stop_event or threading.Event()
+        self.cpu_count = os.cpu_count() or 1
+
+        self.background = False
+        self.concurrency = self.max_concurrency
+        self.pause = 0.0
+        self.paused_seconds = 0.0
+        self.on_onnx_threads_change = None
+        self.onnx_threads = None
+
+        self._condition = threading.Condition()
+        self._running = 0
+        self._paused_until = 0.0
+        self._photos = 0
+        self._window_start = time.monotonic()
+        self._window_cpu = process_cpu_seconds(include_children)
+        self._last_report = 0.0
+        self._background_since = None
+        self._measurable = self.mode == 'photos' or self._window_cpu is not None
+
+    @classmethod
+    def from_settings(cls, settings: dict, is_background: Callable[[], bool], max_concurrency: int,
+                      **kwargs) -> 'ResourceScheduler':
+        return cls(
+            is_background, max_concurrency,
+            mode=settings.get('background_budget_mode', 'cpu'),
+            cpu_percent=settings.get('background_cpu_percent', 25),
+            photos_per_second=settings.get('background_photos_per_second', 2.0),
+            **kwargs
+        )
+
+    def background_onnx_threads(self) -> int:
+        if self.mode == 'photos':
+            return 1
+        return max(1, int(self.cpu_count * self.cpu_percent / 100))
+
+    def static_concurrency(self) -> int:
+        """Workers that fit in the CPU budget, for when CPU use cannot be measured"""
+        budget_cores = self.cpu_count * self.cpu_percent / 100
+        return max(1, min(self.max_concurrency, int(budget_cores / self.threads_per_slot)))
+
+    @contextmanager
+    def slot(self):
+        """Held by a worker around CPU heavy work, so at most `concurrency` workers run at once"""
+        with self._condition:
+            while not self.stop_event.is_set():
+                wait = self._paused_until - time.monotonic()
+                if wait <= 0 and self._running < self.concurrency:
+                    break
+                self._condition.wait(min(0.5, wait) if wait > 0 else 0.5)
+            self._running += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._running -= 1
+                self._condition.notify_all()
+
+    def throttle(self, photos: int = 1):
+        # Called by the writer after every photo; measures and adjusts once per control interval
+        self._photos += photos
+        now = time.monotonic()
+        if now - self._window_start < self.CONTROL_INTERVAL:
+            return
+
+        self._update_background(now)
+        if self.background:
+            self._adjust(now)
+        self._start_window(now)
+
+        if self.background and self.pause > 0:
+            with self._condition:
+                self._paused_until = time.monotonic() + self.pause
+            self.paused_seconds += self.pause
+            # The pause stays inside the next measuring window, so it counts towards the budget
+            self.stop_event.wait(self.pause)
+
+    def _start_window(self, now: float):
+        self._photos = 0
+        self._window_start = now
+        self._window_cpu = process_cpu_seconds(self.include_children)
+
+    def _update_background(self, now: float):
+        background = bool(self.is_background())
+
+        if background != self.background:
+            self.background = background
+            self._background_since = now
+            with self._condition:
+                if background:
+                    self.concurrency = self.max_concurrency if self._measurable else self.static_concurrency()
+                else:
+                    self.concurrency = self.max_concurrency
+                    self.pause = 0.0
+                    self._paused_until = 0.0
+                self._condition.notify_all()
+
+            if background:
+                budget = (f"{self.cpu_percent:.0f}% CPU" if self.mode == 'cpu'
+                          else f"{self.photos_per_second:g} photos/s")
+                self.report(f"Scanning in the background, budget {budget}")
+                if not self._measurable:
+                    self.report(
+                        f"CPU use of worker processes cannot be measured without psutil, "
+                        f"using {self.concurrency} of {self.max_concurrency} workers"
+                    )
+            else:
+                self.report("Window in foreground: scanning at full speed")
+
+        # Thread counts are only switched once the window state has settled
+        target = self.background_onnx_threads() if self.background else None
+        settled = self._background_since is None or now - self._background_since >= self.ONNX_SWITCH_DELAY
+        if target != self.onnx_threads and self.on_onnx_threads_change is not None and (settled or not self.background):
+            self.onnx_threads = target
+            self.on_onnx_threads_change(target)
+
+    def _adjust(self, now: float):
+        elapsed = now - self._window_start
+
+        if self.mode == 'photos':
+            usage = self._photos / elapsed
+            budget = self.photos_per_second
+        else:
+            cpu_seconds = process_cpu_seconds(self.include_children)
+            if cpu_seconds is None or self._window_cpu is None:
+                return
+            # Clamped, since the CPU time of a worker process disappears when it exits
+            usage = max(0.0, cpu_seconds - self._window_cpu) / elapsed / self.cpu_count * 100
+            budget = self.cpu_percent
+
+        previous = (self.concurrency, self.pause)
+        with self._condition:
+            if usage > budget:
+                if self.concurrency > 1:
+                    self.concurrency -= 1
+                else:
+                    self.pause = min(self.MAX_PAUSE, max(0.25, self.pause * 1.5))
+            elif usage < budget * 0.8:
+                if self.pause > 0:
+                    self.pause = self.pause / 1.5 if self.pause > 0.25 else 0.0
+                elif self.concurrency < self.max_concurrency:
+                    self.concurrency += 1
+            self._condition.notify_all()
+
+        if (self.concurrency, self.pause) != previous and now - self._last_report >= self.REPORT_INTERVAL:
+            self._last_report = now
+            if self.mode == 'photos':
+                measured = f"{usage:.1f} photos/s (budget {budget:g})"
+            else:
+                measured = f"CPU {usage:.0f}% (budget {budget:.0f}%)"
+            paused = self.pause / (self.pause + self.CONTROL_INTERVAL) * 100
+            self.report(
+                f"Background throttle: {measured}, {self.concurrency} of {self.max_concurrency} workers, "
+                f"paused {paused:.0f}% of the time"
+            )
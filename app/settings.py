@@ -1,6 +1,17 @@
 import json
 from pathlib import Path
 
+# Settings read by the scan workers, through the GUI API or the headless CLI
+SCAN_SETTING_KEYS = [
+    'scan_batch_size', 'scan_read_workers', 'scan_decode_workers',
+    'scan_detect_workers', 'scan_queue_size', 'detection_max_side',
+    'inference_batch_size', 'onnx_intra_op_threads', 'onnx_inter_op_threads',
+    'scan_mode', 'scan_process_workers', 'scan_process_onnx_threads',
+    'quality_gate_enabled', 'quality_min_face_size', 'quality_min_det_score', 'quality_min_blur_score',
+    'background_budget_mode', 'background_cpu_percent', 'background_photos_per_second',
+    'model_precision', 'det_size', 'screening_enabled', 'screening_det_size', 'screening_min_score'
+]
+
 
 class Settings:
     def __init__(self, settings_path: str):
@@ -29,7 +40,35 @@ class Settings:
             'hide_unnamed_persons': False,
             'scan_frequency': 'restart_1_day',
             'last_scan_time': None,
-            'show_face_tags_preview': True
+            'show_face_tags_preview': True,
+            'scan_batch_size': 25,
+            'scan_read_workers': 4,
+            'scan_decode_workers': 2,
+            'scan_detect_workers': 1,
+            'scan_queue_size': 4,
+            'detection_max_side': 1280,
+            'inference_batch_size': 8,
+            'onnx_intra_op_threads': 0,
+            'onnx_inter_op_threads': 0,
+            'scan_mode': 'threads',
+            'scan_process_workers': 0,
+            'scan_process_onnx_threads': 2,
+            'quality_gate_enabled': False,
+            'quality_min_face_size': 40,
+            'quality_min_det_score': 0.6,
+            'quality_min_blur_score': 25.0,
+            'background_budget_mode': 'cpu',
+            'background_cpu_percent': 25,
+            'background_photos_per_second': 2.0,
+            'watch_folders': False,
+            'model_precision': 'fp32',
+            'det_size': 640,
+            'screening_enabled': False,
+            'screening_det_size': 320,
+            'screening_min_score': 0.3,
+            'embedding_storage': 'lmdb',
+            'embedding_format': 'float32',
+            'embedding_cache_mb': 1024
         }
         
         self.settings = self.load()
@@ -62,3 +101,6 @@ class Settings:
     def update(self, updates: dict):
         self.settings.update(updates)
         self.save()
+    
+    def get_scan_settings(self) -> dict:
+        return {key: self.settings.get(key, self.defaults.get(key)) for key in SCAN_SETTING_KEYS}
@@ -1,7 +1,7 @@
 import os
 import base64
 from pathlib import Path
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Set
 from PIL import Image, ImageOps
 from io import BytesIO
 
@@ -19,14 +19,18 @@ class ThumbnailCache:
         return self.cache_folder / cache_key
     
     def get_cached_thumbnail(self, face_id: int, image_path: str, 
-                           bbox: Optional[List[float]], size: int) -> Optional[str]:
+                           bbox: Optional[List[float]], size: int,
+                           source_mtime: Optional[float] = None) -> Optional[str]:
         cache_key = self._get_cache_key(face_id, bbox, size)
         cache_path = self._get_cache_path(cache_key)
         
         if cache_path.exists():
             try:
-                source_mtime = os.path.getmtime(image_path)
                 cache_mtime = cache_path.stat().st_mtime
+                # The mtime recorded at scan time spots a stale entry without a stat of the original, but
+                # an edit made while the folder watcher was off is only seen on the file itself
+                if source_mtime is None or source_mtime <= cache_mtime:
+                    source_mtime = os.path.getmtime(image_path)
                 
                 if source_mtime > cache_mtime:
                     cache_path.unlink()
@@ -58,8 +62,9 @@ class ThumbnailCache:
             return False
     
     def create_thumbnail_with_cache(self, face_id: int, image_path: str, 
-                                   size: int = 150, bbox: Optional[List[float]] = None) -> Optional[str]:
-        cached = self.get_cached_thumbnail(face_id, image_path, bbox, size)
+                                   size: int = 150, bbox: Optional[List[float]] = None,
+                                   source_mtime: Optional[float] = None) -> Optional[str]:
+        cached = self.get_cached_thumbnail(face_id, image_path, bbox, size, source_mtime)
         if cached:
             return cached
         
@@ -125,6 +130,29 @@ class ThumbnailCache:
             'avg_size_kb': round((total_size / file_count / 1024) if file_count > 0 else 0, 2)
         }
     
+    def remove_orphans(self, face_ids: Set[int]) -> Dict[str, any]:
+        """Delete the thumbnails of faces that are no longer in the database"""
+        total_size = 0
+        file_count = 0
+        
+        for file_path in self.cache_folder.glob("face_*.jpg"):
+            face_id = file_path.name.split('_')[1]
+            if face_id.isdigit() and int(face_id) in face_ids:
+                continue
+            try:
+                size = file_path.stat().st_size
+                file_path.unlink()
+                total_size += size
+                file_count += 1
+            except Exception as e:
+                print(f"Error deleting {file_path}: {e}")
+        
+        return {
+            'size_bytes': total_size,
+            'size_mb': round(total_size / (1024 * 1024), 2),
+            'file_count': file_count
+        }
+    
     def clear_cache(self) -> Dict[str, any]:
         stats = self.get_cache_size()
         
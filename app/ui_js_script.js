@@ -299,6 +299,32 @@ let people = [];
             }
         }
 
+        async function compactStorage() {
+            const confirmCompact = confirm('Remove data left behind by deleted photos and old clusterings and compact the database? This can take a few minutes on a large library.');
+            
+            if (confirmCompact) {
+                const compactBtn = document.getElementById('compactStorageBtn');
+                compactBtn.disabled = true;
+                compactBtn.textContent = 'Compacting...';
+                
+                try {
+                    const result = await pywebview.api.compact_storage(true);
+                    if (result) {
+                        updateCacheSize();
+                        alert(`Compacting complete: ${result.reclaimed_mb} MB reclaimed`);
+                    } else {
+                        alert('Compacting is not possible while scanning or clustering. Please try again when it has finished.');
+                    }
+                } catch (error) {
+                    addLogEntry(`Error compacting storage: ${error}`);
+                    alert('Error compacting storage. Please try again.');
+                } finally {
+                    compactBtn.disabled = false;
+                    compactBtn.textContent = 'Compact';
+                }
+            }
+        }
+
         async function loadPeople() {
             try {
                 people = await pywebview.api.get_people();
@@ -1051,11 +1077,34 @@ let people = [];
             addLogEntry(message);
         }
 
+        function updateStatusMessages(messages) {
+            if (messages.length === 0) {
+                return;
+            }
+            document.getElementById('progressText').textContent = messages[messages.length - 1];
+            
+            const logViewer = document.getElementById('logViewer');
+            const timestamp = new Date().toLocaleString();
+            const fragment = document.createDocumentFragment();
+            for (const message of messages) {
+                const entry = document.createElement('div');
+                entry.className = 'log-entry';
+                entry.textContent = `[${timestamp}] ${message}`;
+                fragment.appendChild(entry);
+            }
+            logViewer.appendChild(fragment);
+            logViewer.scrollTop = logViewer.scrollHeight;
+        }
+
         function updateProgress(current, total, percent) {
             document.getElementById('progressFill').style.width = percent + '%';
             document.getElementById('progressText').textContent = `Scanning: ${current}/${total}`;
         }
 
+        function showProgress() {
+            document.getElementById('progressSection').style.display = 'flex';
+        }
+
         function hideProgress() {
             document.getElementById('progressSection').style.display = 'none';
             updateFaceCount();
@@ -1098,6 +1147,25 @@ let people = [];
                 const dynamicResources = await pywebview.api.get_dynamic_resources();
                 document.getElementById('dynamicResourcesToggle').checked = dynamicResources;
                 
+                const backgroundCpuPercent = await pywebview.api.get_background_cpu_percent();
+                document.getElementById('backgroundCpuInput').value = backgroundCpuPercent;
+                document.getElementById('backgroundCpuInput').disabled = !dynamicResources;
+                
+                const watchFolders = await pywebview.api.get_watch_folders();
+                document.getElementById('watchFoldersToggle').checked = watchFolders;
+                
+                const qualityGateEnabled = await pywebview.api.get_quality_gate_enabled();
+                document.getElementById('qualityGateToggle').checked = qualityGateEnabled;
+                
+                const screeningEnabled = await pywebview.api.get_screening_enabled();
+                document.getElementById('screeningToggle').checked = screeningEnabled;
+                
+                const modelPrecision = await pywebview.api.get_model_precision();
+                document.getElementById('modelPrecisionDropdown').value = modelPrecision;
+                
+                const detSize = await pywebview.api.get_det_size();
+                document.getElementById('detSizeDropdown').value = String(detSize);
+                
                 const showUnmatchedSetting = await pywebview.api.get_show_unmatched();
                 showUnmatched = showUnmatchedSetting;
                 document.getElementById('showUnmatchedToggle').checked = showUnmatchedSetting;
@@ -1329,6 +1397,14 @@ let people = [];
             }
         });
 
+        document.getElementById('backgroundCpuInput').addEventListener('change', async (e) => {
+            const value = parseInt(e.target.value);
+            if (value >= 5 && value <= 100) {
+                await pywebview.api.set_background_cpu_percent(value);
+                addLogEntry(`Background scanning limited to ${value}% CPU (applies to the next scan)`);
+            }
+        });
+
         document.getElementById('filterBtn').addEventListener('click', () => {
             closeAllMenus();
             
@@ -1601,8 +1677,57 @@ let people = [];
             }
         });
 
+        document.getElementById('watchFoldersToggle').addEventListener('change', async (e) => {
+            const watching = await pywebview.api.set_watch_folders(e.target.checked);
+            e.target.checked = watching;
+            if (watching) {
+                addLogEntry('Watching folders for new photos');
+            } else {
+                addLogEntry('Stopped watching folders');
+            }
+        });
+
+        document.getElementById('qualityGateToggle').addEventListener('change', (e) => {
+            pywebview.api.set_quality_gate_enabled(e.target.checked);
+            if (e.target.checked) {
+                addLogEntry('Low quality faces will be skipped on the next scan');
+            } else {
+                addLogEntry('All detected faces will be grouped on the next scan');
+            }
+        });
+
+        document.getElementById('screeningToggle').addEventListener('change', (e) => {
+            pywebview.api.set_screening_enabled(e.target.checked);
+            if (e.target.checked) {
+                addLogEntry('Photos will be checked for faces with a fast detector first on the next scan');
+            } else {
+                addLogEntry('All photos will go through full face detection on the next scan');
+            }
+        });
+
+        document.getElementById('modelPrecisionDropdown').addEventListener('change', async (e) => {
+            try {
+                await pywebview.api.set_model_precision(e.target.value);
+                addLogEntry('Face model precision changed to: ' + e.target.options[e.target.selectedIndex].text + ' - applies to the next scan');
+            } catch (error) {
+                console.error('Error setting model precision:', error);
+                addLogEntry('ERROR: Failed to set model precision - ' + error);
+            }
+        });
+
+        document.getElementById('detSizeDropdown').addEventListener('change', async (e) => {
+            try {
+                await pywebview.api.set_det_size(parseInt(e.target.value));
+                addLogEntry('Face detection size changed to: ' + e.target.value + ' - applies to the next scan');
+            } catch (error) {
+                console.error('Error setting detection size:', error);
+                addLogEntry('ERROR: Failed to set detection size - ' + error);
+            }
+        });
+
         document.getElementById('dynamicResourcesToggle').addEventListener('change', (e) => {
             pywebview.api.set_dynamic_resources(e.target.checked);
+            document.getElementById('backgroundCpuInput').disabled = !e.target.checked;
             if (e.target.checked) {
                 addLogEntry('Dynamic resource management enabled - will throttle CPU to 5% when in background');
             } else {
@@ -1774,6 +1899,24 @@ let people = [];
             }
         });
 
+        document.getElementById('reembedBtn').addEventListener('click', async () => {
+            updateStatusMessage('Starting re-embedding...');
+            document.getElementById('progressSection').style.display = 'flex';
+            closeSettings();
+            
+            try {
+                const started = await pywebview.api.start_reembed();
+                if (started) {
+                    addLogEntry('Re-embedding initiated');
+                } else {
+                    hideProgress();
+                }
+            } catch (error) {
+                console.error('Error starting re-embedding:', error);
+                addLogEntry('Error starting re-embedding: ' + error);
+            }
+        });
+
 
 
         async function handleConflictProceed() {
@@ -1,109 +1,99 @@
 import os
-import hashlib
 import time
 import threading
-import fnmatch
 import random
-from pathlib import Path
-from typing import Optional, Tuple, List
+from typing import Iterable, Optional, Tuple, List
 import numpy as np
 import cv2
-from PIL import Image, ImageOps
-from insightface.app import FaceAnalysis
 import networkx as nx
 import torch
 
-from utils import get_insightface_root
+from face_models import (create_face_app, get_model_version, set_session_threads, screening_app_from_settings,
+                         BatchedFaceAnalyzer, MODEL_PRECISIONS)
+from face_quality import QualityGate
+from embedding_codec import EMBEDDING_DIM, quantize_int8
+from discovery import PhotoDiscovery
+from path_filter import PathFilter
+from scan_pipeline import ScanPipeline, PipelineStage, ScanStats
+from scan_processes import ProcessScanPool
+from scheduler import ResourceScheduler, lower_priority
+from photo_io import (
+    HASH_VERSION, HASH_VERSION_MD5, read_photo_bytes, hash_bytes, compute_file_hash, decode_for_detection,
+    read_photo_header
+)
 
 GPU_AVAILABLE = torch.cuda.is_available()
 DEVICE = torch.device('cuda' if GPU_AVAILABLE else 'cpu')
 
 
 class ScanWorker(threading.Thread):
-    def __init__(self, db, api):
+    # Long scans checkpoint and truncate the SQLite WAL this often, so it does not keep growing
+    WAL_CHECKPOINT_SECONDS = 120
+    # Most new files hashed to find moved photos that were stored without a size
+    UNKNOWN_SIZE_HASH_LIMIT = 200
+    # A failed queue claim (usually SQLITE_BUSY from another writer) is retried this often
+    CLAIM_RETRIES = 5
+    CLAIM_RETRY_SECONDS = 1.0
+    
+    def __init__(self, db, api, incremental: bool = False):
         super().__init__()
         self.db = db
         self.api = api
+        self.incremental = incremental
         self.face_app = None
+        self.screen_app = None
+        self.analyzer = None
+        self.model_version = None
+        self.scheduler = None
+        self.path_filter = None
         self.daemon = True
-        self.batch_size = 25
+        self._stop_event = threading.Event()
+        self.stats = ScanStats()
+        self._last_checkpoint = time.monotonic()
+        
+        scan_settings = self.api.get_scan_settings()
+        self.scan_settings = scan_settings
+        self.batch_size = scan_settings.get('scan_batch_size', 25)
+        self.read_workers = scan_settings.get('scan_read_workers', 4)
+        self.decode_workers = scan_settings.get('scan_decode_workers', 2)
+        self.detect_workers = scan_settings.get('scan_detect_workers', 1)
+        self.queue_size = scan_settings.get('scan_queue_size', 4)
+        self.detection_max_side = scan_settings.get('detection_max_side', 1280)
+        self.inference_batch_size = scan_settings.get('inference_batch_size', 8)
+        self.onnx_intra_op_threads = scan_settings.get('onnx_intra_op_threads', 0)
+        self.onnx_inter_op_threads = scan_settings.get('onnx_inter_op_threads', 0)
+        self.det_size = scan_settings.get('det_size', 640)
+        self.model_precision = scan_settings.get('model_precision', 'fp32')
+        self.scan_mode = scan_settings.get('scan_mode', 'threads')
+        self.process_workers = scan_settings.get('scan_process_workers', 0)
+        self.process_onnx_threads = scan_settings.get('scan_process_onnx_threads', 2)
+        self.queue_claim_size = max(self.batch_size, self.inference_batch_size) * 4
+        self.quality_gate = QualityGate.from_settings(scan_settings)
+        self.quality_settings = {key: value for key, value in scan_settings.items() if key.startswith('quality_')}
+        self.screening_settings = {key: value for key, value in scan_settings.items() if key.startswith('screening_')}
+    
+    def stop(self):
+        self._stop_event.set()
     
     def should_exclude_path(self, path: str) -> bool:
-        include_folders = self.api.get_include_folders()
-        exclude_folders = self.api.get_exclude_folders()
-        wildcard_text = self.api.get_wildcard_exclusions()
-        
-        path_normalized = os.path.normpath(path)
-        
-        if not include_folders:
-            return False
-        
-        is_in_include = False
-        for include_folder in include_folders:
-            include_normalized = os.path.normpath(include_folder)
-            if path_normalized.startswith(include_normalized):
-                is_in_include = True
-                break
-        
-        if not is_in_include:
-            return True
-        
-        for exclude_folder in exclude_folders:
-            exclude_normalized = os.path.normpath(exclude_folder)
-            if path_normalized.startswith(exclude_normalized):
-                return True
-        
-        if wildcard_text:
-            wildcards = [w.strip() for w in wildcard_text.split(',') if w.strip()]
-            
-            for wildcard in wildcards:
-                wildcard_normalized = os.path.normpath(wildcard)
-                
-                if os.path.isabs(wildcard_normalized):
-                    if path_normalized.startswith(wildcard_normalized):
-                        return True
-                else:
-                    path_parts = path_normalized.split(os.sep)
-                    filename = os.path.basename(path_normalized)
-                    
-                    if fnmatch.fnmatch(filename, wildcard):
-                        return True
-                    
-                    for part in path_parts:
-                        if fnmatch.fnmatch(part, wildcard):
-                            return True
-        
-        return False
+        if self.path_filter is None:
+            self.path_filter = PathFilter.from_api(self.api)
+        return self.path_filter.excludes(path)
     
-    def load_image(self, file_path: str) -> Optional[np.ndarray]:
-        file_ext = Path(file_path).suffix.lower()
-        
+    def load_image(self, file_path: str, data: bytes) -> Optional[Tuple[np.ndarray, float, float]]:
         try:
-            pil_image = Image.open(file_path)
-            pil_image = ImageOps.exif_transpose(pil_image)
-            image_rgb = np.array(pil_image.convert('RGB'))
-            image_bgr = cv2.cvtColor(image_rgb, cv2.COLOR_RGB2BGR)
-            return image_bgr
-            
+            return decode_for_detection(data, self.detection_max_side)
         except Exception as e:
             self.api.update_status(f"ERROR: Cannot read image - {os.path.basename(file_path)}: {str(e)}")
             return None
-
+    
     def run(self):
-        try:
-            self.api.update_status("Initializing InsightFace model...")
-            
-            model_root = get_insightface_root()
-            
-            self.face_app = FaceAnalysis(
-                name='buffalo_l',
-                root=model_root,
-                providers=['CPUExecutionProvider']
-            )
-            self.face_app.prepare(ctx_id=-1, det_size=(640, 640))
-            self.api.update_status("Model loaded")
-        except Exception as e:
-            self.api.update_status(f"Error loading model: {e}")
+        # Before the model and the pipeline start, so their threads and processes inherit the lower priority.
+        # It stays for the whole scan, in the foreground too: it cannot be raised again without privileges
+        if self.api.get_dynamic_resources():
+            lower_priority()
+        
+        if self.scan_mode != 'processes' and not self.load_model():
             return
         
         include_folders = self.api.get_include_folders()
@@ -114,32 +104,65 @@ class ScanWorker(threading.Thread):
             self.api.scan_complete()
             return
         
-        image_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.gif', '.heic', '.heif'}
+        self.path_filter = PathFilter.from_api(self.api)
         
+        # The folder watcher has already queued exactly what changed, so there is nothing to discover
+        if self.incremental:
+            # Photos claimed by an interrupted scan would otherwise wait for the next full scan
+            self.db.release_claimed_scan_queue()
+            self.api.update_status(
+                f"Scanning {self.db.get_scan_queue_size()} new or changed photos found by the folder watcher"
+            )
+            self.api.set_new_photos_found(self.db.get_scan_queue_new_count() > 0)
+        elif self.db.has_resumable_scan_queue():
+            self.resume_scan_queue()
+        elif not self.discover_and_queue(include_folders):
+            return
+        
+        self.run_pipeline()
+        
+        if not self._stop_event.is_set() and not self.queue_failed:
+            self.db.finish_scan_queue()
+        
+        self.api.scan_complete()
+    
+    def resume_scan_queue(self):
+        released = self.db.release_claimed_scan_queue()
+        
+        excluded = [path for path in self.db.get_scan_queue_paths() if self.should_exclude_path(path)]
+        if excluded:
+            self.db.remove_from_scan_queue(excluded)
+            self.api.update_status(f"Dropped {len(excluded)} queued photos that are now excluded")
+        
+        queued = self.db.get_scan_queue_size()
+        self.api.update_status(
+            f"Resuming interrupted scan: {queued} photos left in the scan queue "
+            f"({released} were in flight), skipping discovery"
+        )
+        self.api.set_new_photos_found(self.db.get_scan_queue_new_count() > 0)
+    
+    def discover_and_queue(self, include_folders: List[str]) -> bool:
         self.api.update_status("Discovering photos...")
-        all_image_files = set()
+        discovery = PhotoDiscovery(self.db, self.should_exclude_path, self._stop_event)
+        all_image_files = discovery.discover(include_folders, self.api.update_status)
         
-        for location in include_folders:
-            if not os.path.exists(location):
-                self.api.update_status(f"WARNING: Folder does not exist: {location}")
-                continue
-            
-            self.api.update_status(f"Scanning folder: {location}")
-            
-            for root, dirs, files in os.walk(location):
-                if self.should_exclude_path(root):
-                    dirs.clear()
-                    continue
-                
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    
-                    if Path(file).suffix.lower() in image_extensions:
-                        if not self.should_exclude_path(file_path):
-                            all_image_files.add(file_path)
+        if all_image_files is None:
+            self.api.update_status("Scan cancelled during discovery")
+            self.api.scan_complete()
+            return False
         
+        self.api.update_status(
+            f"Discovery: listed {discovery.dirs_listed} changed directories, "
+            f"reused {discovery.dirs_reused} unchanged ones from the index"
+        )
         self.api.update_status(f"Found {len(all_image_files)} images after applying exclusions")
         
+        self.api.update_status("Matching moved or renamed photos...")
+        moved_count = self.reconcile_moved_photos(all_image_files)
+        if moved_count > 0:
+            self.api.update_status(f"Re-linked {moved_count} moved or renamed photos without rescanning")
+        self.backfill_photo_sizes(all_image_files)
+        
         self.api.update_status("Cleaning up deleted photos from database...")
         deleted_count = self.db.remove_deleted_photos(all_image_files)
         if deleted_count > 0:
@@ -149,27 +172,25 @@ class ScanWorker(threading.Thread):
         
         scanned_paths = self.db.get_all_scanned_paths()
         pending_paths_all = self.db.get_pending_and_error_paths()
-        pending_paths = set(p for p in pending_paths_all if os.path.exists(p))
+        pending_paths = set(p for p in pending_paths_all if p in all_image_files)
         
         stale_pending = len(pending_paths_all) - len(pending_paths)
         if stale_pending > 0:
             self.api.update_status(f"Ignoring {stale_pending} pending files that no longer exist")
         
         new_photos = all_image_files - scanned_paths
-        photos_to_scan = list(new_photos | pending_paths)
+        photos_to_scan = new_photos | pending_paths
         
         if len(photos_to_scan) == 0:
+            self.db.replace_scan_queue([])
+            self.db.finish_scan_queue()
             self.api.update_status("No new photos to scan")
             self.api.set_new_photos_found(False)
             self.api.scan_complete()
-            return
+            return False
         
         self.api.set_new_photos_found(len(new_photos) > 0)
         
-        total = len(photos_to_scan)
-        total_photos = len(all_image_files)
-        scanned_count = total_photos - total
-        
         self.api.update_status(f"Found {len(new_photos)} new photos, {len(pending_paths)} incomplete")
         
         if len(new_photos) > 0:
@@ -188,124 +209,667 @@ class ScanWorker(threading.Thread):
             if len(pending_list) > 10:
                 self.api.update_status(f"  ... and {len(pending_list) - 10} more")
         
-        self.api.update_status(f"Starting scan of {total} photos in batches of {self.batch_size}...")
-        
-        for batch_start in range(0, total, self.batch_size):
-            batch_end = min(batch_start + self.batch_size, total)
-            batch = photos_to_scan[batch_start:batch_end]
+        # Newest photos first: they are the ones the user is most likely waiting for
+        entries = []
+        for file_path in photos_to_scan:
+            try:
+                priority = os.stat(file_path).st_mtime
+            except OSError:
+                priority = 0
+            entries.append((file_path, priority, file_path in new_photos))
+        
+        self.db.replace_scan_queue(entries)
+        return True
+    
+    def load_model(self) -> bool:
+        try:
+            self.api.update_status("Initializing InsightFace model...")
+            
+            self.face_app = create_face_app(
+                det_size=self.det_size,
+                intra_op_threads=self.onnx_intra_op_threads,
+                inter_op_threads=self.onnx_inter_op_threads,
+                precision=self.model_precision,
+                report=self.api.update_status
+            )
+            self.screen_app = screening_app_from_settings(
+                self.screening_settings,
+                intra_op_threads=self.onnx_intra_op_threads,
+                inter_op_threads=self.onnx_inter_op_threads
+            )
+            self.analyzer = BatchedFaceAnalyzer(self.face_app, self.inference_batch_size, self.screen_app)
+            self.model_version = get_model_version(self.face_app)
+            self.api.update_status(f"Model loaded: {self.model_precision.upper()}, detector input {self.det_size}x{self.det_size}")
+            
+            detection_mode = "batched" if self.analyzer.batched_detection else "per photo (detector has a fixed batch size)"
+            self.api.update_status(
+                f"Inference batch size {self.inference_batch_size}: detection {detection_mode}, recognition batched"
+            )
+            if self.screen_app is not None:
+                size = self.screening_settings.get('screening_det_size', 320)
+                self.api.update_status(
+                    f"Face screening on: photos without a candidate face at {size}x{size} skip full detection"
+                )
+            return True
+        except Exception as e:
+            self.api.update_status(f"Error loading model: {e}")
+            return False
+    
+    def reconcile_moved_photos(self, all_image_files: set) -> int:
+        missing = [photo for photo in self.db.get_missing_photos(all_image_files) if photo['file_hash']]
+        if not missing:
+            return 0
+        
+        candidates = all_image_files - self.db.get_all_photo_paths()
+        if not candidates:
+            return 0
+        
+        known_sizes = {photo['file_size'] for photo in missing if photo['file_size'] is not None}
+        # Photos stored before sizes were recorded can only be matched by hashing every candidate,
+        # which the pipeline then reads and hashes again: only worth it for a few new files
+        has_unknown_size = any(photo['file_size'] is None for photo in missing) and \
+            len(candidates) <= self.UNKNOWN_SIZE_HASH_LIMIT
+        hash_versions = {photo['hash_version'] or HASH_VERSION_MD5 for photo in missing}
+        
+        missing_by_hash = {}
+        for photo in missing:
+            key = (photo['hash_version'] or HASH_VERSION_MD5, photo['file_hash'])
+            missing_by_hash.setdefault(key, []).append(photo)
+        
+        moves = []
+        for file_path in sorted(candidates):
+            if self._stop_event.is_set():
+                break
             
-            self.process_batch(batch, scanned_count + batch_start, total_photos, new_photos)
+            try:
+                file_size = os.stat(file_path).st_size
+            except OSError:
+                continue
             
-            should_throttle = self.api.get_dynamic_resources() and not self.api.is_window_foreground()
-            if should_throttle:
-                time.sleep(0.5)
+            # Only files whose size matches a vanished photo are worth hashing
+            if file_size not in known_sizes and not has_unknown_size:
+                continue
+            
+            for hash_version in hash_versions:
+                try:
+                    file_hash = compute_file_hash(file_path, hash_version)
+                except Exception:
+                    break
+                
+                matches = missing_by_hash.get((hash_version, file_hash))
+                if not matches:
+                    continue
+                
+                match = next((photo for photo in matches if photo['file_size'] == file_size), None)
+                if match is None:
+                    match = next((photo for photo in matches if photo['file_size'] is None), None)
+                if match is None:
+                    continue
+                
+                matches.remove(match)
+                moves.append((match['photo_id'], file_path, file_size))
+                if len(moves) <= 10:
+                    self.api.update_status(f"  MOVED: {match['file_path']} -> {file_path}")
+                break
         
-        self.api.scan_complete()
+        if len(moves) > 10:
+            self.api.update_status(f"  ... and {len(moves) - 10} more")
+        
+        return self.db.relocate_photos(moves)
     
-    def process_batch(self, batch: List[str], start_idx: int, total_photos: int, new_photos: set):
+    def backfill_photo_sizes(self, all_image_files: set) -> int:
+        # One stat per photo stored without a size, so later moves of it match by size
+        sizes = []
+        for photo_id, file_path in self.db.get_photos_without_size():
+            if file_path not in all_image_files:
+                continue
+            try:
+                sizes.append((photo_id, os.stat(file_path).st_size))
+            except OSError:
+                continue
+        return self.db.set_photo_sizes(sizes)
+    
+    def run_pipeline(self):
+        self.stats = ScanStats()
+        self.queue_failed = False
+        
+        scanned_count = len(self.db.get_all_scanned_paths())
+        total_photos = scanned_count + self.db.get_scan_queue_size()
+        new_photos = set()
+        
+        self.api.update_status(
+            f"Starting scan of {total_photos - scanned_count} photos in batches of {self.batch_size}..."
+        )
+        
+        def queued_photos():
+            # Claimed in chunks, so priority changes made during the scan are picked up quickly
+            failures = 0
+            while not self._stop_event.is_set():
+                rows = self.db.claim_scan_queue_batch(self.queue_claim_size)
+                if rows is None:
+                    failures += 1
+                    if failures > self.CLAIM_RETRIES:
+                        self.queue_failed = True
+                        self.api.update_status(
+                            "ERROR: Cannot read the scan queue, stopping the scan. "
+                            "The photos still queued are scanned next time"
+                        )
+                        return
+                    self._stop_event.wait(self.CLAIM_RETRY_SECONDS * failures)
+                    continue
+                failures = 0
+                if not rows:
+                    return
+                for file_path, is_new in rows:
+                    if is_new:
+                        new_photos.add(file_path)
+                    yield file_path
+        
         batch_data = []
+        unreadable = []
+        processed = [0]
         
-        for idx, file_path in enumerate(batch):
-            current_overall = start_idx + idx + 1
-            self.api.update_progress(current_overall, total_photos)
-            
-            is_new = file_path in new_photos
-            status_prefix = "NEW" if is_new else "RETRY"
+        def write_result(photo_data: dict):
+            processed[0] += 1
+            self.api.update_progress(scanned_count + processed[0], total_photos)
             
-            if (idx + 1) % 5 == 0 or idx == 0 or (idx + 1) == len(batch):
-                self.api.update_status(f"Scanning {status_prefix}: {os.path.basename(file_path)} (batch {idx + 1}/{len(batch)})")
+            file_path = photo_data['file_path']
+            status_prefix = "NEW" if file_path in new_photos else "RETRY"
+            self.api.log_detail(f"Scanned {status_prefix}: {file_path}")
             
-            photo_data = self.process_photo_no_commit(file_path)
-            if photo_data:
+            # Unreadable photos are stored as errors, retried on the next discovery; vanished ones are dropped
+            if photo_data.get('file_hash') or os.path.exists(file_path):
                 batch_data.append(photo_data)
+            else:
+                unreadable.append(file_path)
+            
+            if len(batch_data) >= self.batch_size:
+                self.commit_batch(batch_data)
+                batch_data.clear()
+                self.db.remove_from_scan_queue(unreadable)
+                unreadable.clear()
+            
+            self.scheduler.throttle()
+        
+        if self.scan_mode == 'processes':
+            self.run_process_pool(queued_photos(), write_result)
+        else:
+            self.run_thread_pipeline(queued_photos(), write_result)
         
         if batch_data:
             self.commit_batch(batch_data)
+        self.db.remove_from_scan_queue(unreadable)
+        
+        self.report_stats()
     
-    def process_photo_no_commit(self, file_path: str) -> Optional[dict]:
+    def run_thread_pipeline(self, photos_to_scan: Iterable[str], write_result):
+        self.api.update_status(
+            f"Pipeline: {self.read_workers} read, {self.decode_workers} decode, "
+            f"{self.detect_workers} detection worker(s)"
+        )
+        
+        self.scheduler = self.create_scheduler(self.decode_workers + self.detect_workers)
+        self.scheduler.on_onnx_threads_change = self.set_onnx_threads
+        
+        pipeline = ScanPipeline([
+            PipelineStage('read', self.read_photo, self.read_workers, self.queue_size),
+            PipelineStage('decode', self.throttled(self.decode_photo), self.decode_workers, self.queue_size),
+            PipelineStage('detect', self.throttled(self.detect_faces), self.detect_workers, self.queue_size,
+                          batch_size=self.inference_batch_size),
+        ], stop_event=self._stop_event)
+        
         try:
-            if not os.path.exists(file_path):
-                self.api.update_status(f"ERROR: File not found - {os.path.basename(file_path)}")
-                return {'file_path': file_path, 'status': 'error', 'faces': []}
-            
-            with open(file_path, 'rb') as f:
-                file_hash = hashlib.md5(f.read()).hexdigest()
-            
-            photo_id = self.db.add_photo(file_path, file_hash)
-            
-            if not photo_id:
-                self.api.update_status(f"ERROR: Failed to add photo to database - {os.path.basename(file_path)}")
-                return None
-            
-            status_row = self.db.conn.execute(
-                'SELECT scan_status FROM photos WHERE photo_id = ?', 
-                (photo_id,)
-            ).fetchone()
-            
-            if not status_row:
-                self.api.update_status(f"ERROR: Photo record not found - {os.path.basename(file_path)}")
-                return None
-            
-            existing_status = status_row[0]
-            
-            if existing_status == 'completed':
-                return None
-            
-            image = self.load_image(file_path)
-            if image is None:
-                self.api.update_status(f"ERROR: Cannot read image - {os.path.basename(file_path)}")
-                return {'file_path': file_path, 'photo_id': photo_id, 'status': 'error', 'faces': []}
-            
-            faces = self.face_app.get(image)
-            
-            if len(faces) == 0:
-                self.api.update_status(f"INFO: No faces detected - {os.path.basename(file_path)}")
-            else:
-                self.api.update_status(f"INFO: Found {len(faces)} face(s) - {os.path.basename(file_path)}")
-            
-            face_data = []
-            for face in faces:
-                embedding = face.embedding
-                embedding_norm = embedding / np.linalg.norm(embedding)
-                bbox = face.bbox.tolist()
-                face_data.append({'embedding': embedding_norm, 'bbox': bbox})
+            pipeline.run(photos_to_scan, write_result)
+        except Exception as e:
+            self.api.update_status(f"ERROR: Scan pipeline failed: {str(e)}")
+        
+        for error in pipeline.errors:
+            self.api.update_status(f"ERROR: Scan pipeline stage failed: {str(error)}")
+        
+        self.api.update_status("Pipeline stage timings:")
+        for line in pipeline.get_stage_summary():
+            self.api.update_status(line)
+    
+    def run_process_pool(self, photos_to_scan: Iterable[str], write_result):
+        # Quantized or downloaded once here, instead of by every worker process at the same time
+        try:
+            if MODEL_PRECISIONS.get(self.model_precision):
+                create_face_app(precision=self.model_precision, report=self.api.update_status)
+            screening_app_from_settings(self.screening_settings)
+        except Exception as e:
+            self.api.update_status(f"Error loading model: {e}")
+            return
+        
+        pool = ProcessScanPool(
+            self.process_workers, self.process_onnx_threads, self.inference_batch_size,
+            self.detection_max_side, self.quality_settings, stop_event=self._stop_event,
+            low_priority=self.api.get_dynamic_resources(), det_size=self.det_size, precision=self.model_precision,
+            screening_settings=self.screening_settings
+        )
+        self.scheduler = self.create_scheduler(pool.workers, include_children=True, threads_per_slot=pool.onnx_threads)
+        pool.scheduler = self.scheduler
+        self.api.update_status(
+            f"Scanning with {pool.workers} worker processes, "
+            f"{pool.onnx_threads} ONNX thread(s) each, loading one model per process..."
+        )
+        
+        def write_process_result(photo_data: dict):
+            for message in photo_data.pop('messages'):
+                self.api.update_status(message)
+            for detail in photo_data.pop('details', []):
+                self.api.log_detail(detail)
+            for name, value in photo_data.pop('stats').items():
+                self.stats.add(name, value)
+            write_result(photo_data)
+        
+        try:
+            pool.run(photos_to_scan, write_process_result)
+        except Exception as e:
+            self.api.update_status(f"ERROR: Scan process pool failed: {str(e)}")
+        
+        for error in pool.errors:
+            self.api.update_status(f"ERROR: Scan worker process failed: {str(error)}")
+    
+    def create_scheduler(self, max_concurrency: int, **kwargs) -> ResourceScheduler:
+        return ResourceScheduler.from_settings(
+            self.scan_settings,
+            lambda: self.api.get_dynamic_resources() and not self.api.is_window_foreground(),
+            max_concurrency, report=self.api.update_status, stop_event=self._stop_event, **kwargs
+        )
+    
+    def throttled(self, work):
+        """Wrap a pipeline stage function so it only runs in a scheduler slot"""
+        def run(item):
+            with self.scheduler.slot():
+                return work(item)
+        return run
+    
+    def set_onnx_threads(self, threads: Optional[int]):
+        """Called by the scheduler: a few threads in the background, the configured counts again in the foreground"""
+        intra_op_threads = threads if threads is not None else self.onnx_intra_op_threads
+        inter_op_threads = 0 if threads is not None else self.onnx_inter_op_threads
+        try:
+            set_session_threads(self.face_app, intra_op_threads, inter_op_threads)
+            if self.screen_app is not None:
+                set_session_threads(self.screen_app, intra_op_threads, inter_op_threads)
+            self.api.update_status(f"Face detection now uses {intra_op_threads or 'all available'} ONNX thread(s)")
+        except Exception as e:
+            self.api.update_status(f"ERROR: Cannot change ONNX thread count: {str(e)}")
+    
+    def report_stats(self):
+        photos_read = self.stats.get('photos_read')
+        if photos_read == 0:
+            return
+        
+        self.report_quality_gate()
+        self.report_screening()
+        
+        if self.scheduler is not None and self.scheduler.paused_seconds > 0:
+            self.api.update_status(f"Background throttle paused the scan for {self.scheduler.paused_seconds:.0f}s in total")
+        
+        bytes_read = self.stats.get('bytes_read')
+        elapsed = self.stats.elapsed()
+        
+        self.api.update_status("Scan statistics:")
+        self.api.update_status(
+            f"  Read {photos_read} photos, {bytes_read / (1024 * 1024):.1f} MB "
+            f"({bytes_read / photos_read / 1024:.0f} KB per photo)"
+        )
+        self.api.update_status(
+            f"  {elapsed / photos_read * 1000:.0f} ms per photo overall "
+            f"({photos_read / elapsed:.1f} photos/s)"
+        )
+        self.api.update_status(
+            f"  Per photo: read {self.stats.get('read_seconds') / photos_read * 1000:.0f} ms, "
+            f"decode {self.stats.get('decode_seconds') / photos_read * 1000:.0f} ms, "
+            f"detect {self.stats.get('detect_seconds') / photos_read * 1000:.0f} ms"
+        )
+    
+    def report_screening(self):
+        screened = self.stats.get('screened_photos')
+        if screened == 0:
+            return
+        
+        hits = self.stats.get('screen_hits')
+        skipped = screened - hits
+        screen_seconds = self.stats.get('screen_seconds')
+        # Time the full detector would have spent on the skipped photos, at its average cost on the others
+        full_detect_seconds = self.stats.get('full_detect_seconds') / hits if hits > 0 else 0
+        saved = skipped * full_detect_seconds - screen_seconds
+        self.api.update_status(
+            f"Face screening: {hits} of {screened} photos had candidate faces ({hits / screened * 100:.0f}% hit rate), "
+            f"full detection skipped on {skipped} photos"
+        )
+        self.api.update_status(
+            f"  Screening took {screen_seconds:.1f}s, estimated {'saving' if saved >= 0 else 'costing'} "
+            f"{abs(saved):.1f}s of detection time"
+        )
+    
+    def report_quality_gate(self):
+        if self.quality_gate is None:
+            return
+        
+        faces_detected = self.stats.get('faces_detected')
+        faces_filtered = self.stats.get('faces_filtered')
+        percent = faces_filtered / faces_detected * 100 if faces_detected > 0 else 0
+        self.api.update_status(
+            f"Quality gate: filtered {faces_filtered} of {faces_detected} faces ({percent:.0f}%) - "
+            f"{self.stats.get('faces_filtered_small')} too small, "
+            f"{self.stats.get('faces_filtered_low_score')} low detection score, "
+            f"{self.stats.get('faces_filtered_blurred')} blurred"
+        )
+    
+    def read_photo(self, file_path: str) -> dict:
+        try:
+            start = time.perf_counter()
+            file_mtime = os.stat(file_path).st_mtime
+            data = read_photo_bytes(file_path)
+            file_hash = hash_bytes(data)
+            self.stats.add('read_seconds', time.perf_counter() - start)
+            self.stats.add('bytes_read', len(data))
+            self.stats.add('photos_read')
             
             return {
                 'file_path': file_path,
-                'photo_id': photo_id,
-                'status': 'completed',
-                'faces': face_data
+                'file_hash': file_hash,
+                'hash_version': HASH_VERSION,
+                'file_size': len(data),
+                'file_mtime': file_mtime,
+                'status': 'pending',
+                'faces': [],
+                'data': data
             }
-            
+        except FileNotFoundError:
+            self.api.update_status(f"ERROR: File not found - {os.path.basename(file_path)}")
+            return {'file_path': file_path, 'status': 'error', 'faces': []}
         except Exception as e:
-            self.api.update_status(f"ERROR: Exception processing {os.path.basename(file_path)}: {str(e)}")
-            return {'file_path': file_path, 'photo_id': photo_id if 'photo_id' in locals() else None, 'status': 'error', 'faces': []}
+            self.api.update_status(f"ERROR: Exception reading {os.path.basename(file_path)}: {str(e)}")
+            return {'file_path': file_path, 'status': 'error', 'faces': []}
     
-    def commit_batch(self, batch_data: List[dict]):
+    def decode_photo(self, photo_data: dict) -> dict:
+        data = photo_data.pop('data', None)
+        if photo_data['status'] == 'error' or data is None:
+            return photo_data
+        
+        start = time.perf_counter()
         try:
-            cursor = self.db.conn.cursor()
+            photo_data.update(read_photo_header(data))
+        except Exception:
+            pass
+        decoded = self.load_image(photo_data['file_path'], data)
+        self.stats.add('decode_seconds', time.perf_counter() - start)
+        
+        if decoded is None:
+            photo_data['status'] = 'error'
+        else:
+            photo_data['image'], photo_data['scale_x'], photo_data['scale_y'] = decoded
+        return photo_data
+    
+    def detect_faces(self, batch: List[dict]) -> List[dict]:
+        pending = [photo_data for photo_data in batch if 'image' in photo_data]
+        if not pending:
+            return batch
+        
+        images = [photo_data.pop('image') for photo_data in pending]
+        scales = [(photo_data['scale_x'], photo_data['scale_y']) for photo_data in pending]
+        
+        batch_stats = ScanStats()
+        try:
+            start = time.perf_counter()
+            faces_per_photo = self.analyzer.analyze(images, self.quality_gate, batch_stats, scales)
+            self.stats.add('detect_seconds', time.perf_counter() - start)
+        except Exception:
+            # Retry one by one so a single bad photo does not fail the whole batch
+            faces_per_photo = []
+            batch_stats = ScanStats()
+            for photo_data, image, scale in zip(pending, images, scales):
+                try:
+                    faces_per_photo.append(self.analyzer.analyze([image], self.quality_gate, batch_stats, [scale])[0])
+                except Exception as e:
+                    self.api.update_status(f"ERROR: Exception processing {os.path.basename(photo_data['file_path'])}: {str(e)}")
+                    faces_per_photo.append(None)
+        
+        for name, value in batch_stats.counters().items():
+            self.stats.add(name, value)
+        
+        for photo_data, faces in zip(pending, faces_per_photo):
+            if faces is None:
+                photo_data['status'] = 'error'
+            else:
+                self.store_faces(photo_data, faces)
+        
+        return batch
+    
+    def store_faces(self, photo_data: dict, faces: list):
+        file_path = photo_data['file_path']
+        
+        if len(faces) == 0:
+            self.api.log_detail(f"INFO: No faces detected - {file_path}")
+        else:
+            self.api.log_detail(f"INFO: Found {len(faces)} face(s) - {file_path}")
+        
+        self.stats.add('faces_detected', len(faces))
+        
+        # Detection ran on a reduced decode; store boxes in original image coordinates
+        scale = np.array([photo_data['scale_x'], photo_data['scale_y']] * 2, dtype=np.float32)
+        
+        face_data = []
+        for face in faces:
+            bbox = (face.bbox * scale).tolist()
+            kps = face.kps * scale[:2]
             
-            for photo_data in batch_data:
-                photo_id = photo_data['photo_id']
-                
-                for face_data in photo_data['faces']:
-                    face_id = self.db.add_face(photo_id, face_data['embedding'], face_data['bbox'])
-                
-                self.db.update_photo_status(photo_id, photo_data['status'])
+            if face.filtered:
+                self.stats.add('faces_filtered')
+                self.stats.add(f'faces_filtered_{face.filtered}')
+                face_data.append({'embedding': None, 'bbox': bbox, 'kps': kps, 'det_score': float(face.det_score)})
+                continue
             
-            self.db.conn.commit()
+            embedding = face.embedding
+            embedding_norm = embedding / np.linalg.norm(embedding)
+            face_data.append({'embedding': embedding_norm, 'bbox': bbox, 'kps': kps, 'det_score': float(face.det_score)})
+        
+        photo_data['faces'] = face_data
+        photo_data['model_version'] = self.model_version
+        photo_data['status'] = 'completed'
+    
+    def commit_batch(self, batch_data: List[dict]):
+        if self.db.ingest_batch(batch_data) is not None:
+            if time.monotonic() - self._last_checkpoint >= self.WAL_CHECKPOINT_SECONDS:
+                self.db.checkpoint_wal()
+                self._last_checkpoint = time.monotonic()
+            return
+        
+        # One bad photo should not cost the whole batch: retry one by one
+        self.api.update_status(f"ERROR: Batch commit failed, retrying {len(batch_data)} photos individually")
+        for photo_data in batch_data:
+            if self.db.ingest_batch([photo_data]) is None:
+                self.api.update_status(f"ERROR: Failed to add photo to database - {os.path.basename(photo_data['file_path'])}")
+
+
+class ReembedWorker(threading.Thread):
+    """Recomputes stored embeddings with the current recognition model from the stored landmarks"""
+    
+    def __init__(self, db, api):
+        super().__init__()
+        self.db = db
+        self.api = api
+        self.daemon = True
+        self._stop_event = threading.Event()
+        
+        scan_settings = self.api.get_scan_settings()
+        self.batch_size = scan_settings.get('scan_batch_size', 25)
+        self.read_workers = scan_settings.get('scan_read_workers', 4)
+        self.decode_workers = scan_settings.get('scan_decode_workers', 2)
+        self.queue_size = scan_settings.get('scan_queue_size', 4)
+        self.detection_max_side = scan_settings.get('detection_max_side', 1280)
+        self.inference_batch_size = scan_settings.get('inference_batch_size', 8)
+        self.onnx_intra_op_threads = scan_settings.get('onnx_intra_op_threads', 0)
+        self.onnx_inter_op_threads = scan_settings.get('onnx_inter_op_threads', 0)
+        self.det_size = scan_settings.get('det_size', 640)
+        self.model_precision = scan_settings.get('model_precision', 'fp32')
+    
+    def stop(self):
+        self._stop_event.set()
+    
+    def run(self):
+        try:
+            self.api.update_status("Initializing InsightFace model for re-embedding...")
+            face_app = create_face_app(
+                det_size=self.det_size,
+                intra_op_threads=self.onnx_intra_op_threads,
+                inter_op_threads=self.onnx_inter_op_threads,
+                precision=self.model_precision,
+                report=self.api.update_status
+            )
+            self.analyzer = BatchedFaceAnalyzer(face_app, self.inference_batch_size)
+            self.model_version = get_model_version(face_app)
+        except Exception as e:
+            self.api.update_status(f"Error loading model: {e}")
+            return
+        
+        faces_by_path, without_landmarks = self.db.get_reembed_candidates(self.model_version)
+        if without_landmarks > 0:
+            self.api.update_status(
+                f"{without_landmarks} faces were scanned before landmarks were stored and need a rescan to be re-embedded"
+            )
+        
+        total_faces = sum(len(faces) for faces in faces_by_path.values())
+        if total_faces == 0:
+            self.api.update_status(f"All faces are already embedded with {self.model_version}")
+            self.api.reembed_complete(0)
+            return
+        
+        self.api.update_status(
+            f"Re-embedding {total_faces} faces in {len(faces_by_path)} photos with {self.model_version} (no detection)"
+        )
+        
+        pipeline = ScanPipeline([
+            PipelineStage('read', self.read_photo, self.read_workers, self.queue_size),
+            PipelineStage('decode', self.decode_photo, self.decode_workers, self.queue_size),
+            PipelineStage('embed', self.embed_faces, 1, self.queue_size, batch_size=self.inference_batch_size),
+        ], stop_event=self._stop_event)
+        
+        pending = []
+        done = [0, 0]
+        
+        def write_result(photo_data: dict):
+            pending.extend(photo_data['embeddings'])
+            done[0] += 1
+            self.api.update_progress(done[0], len(faces_by_path))
             
+            if done[0] % self.batch_size == 0:
+                if self.db.update_face_embeddings(pending, self.model_version):
+                    done[1] += len(pending)
+                pending.clear()
+        
+        try:
+            pipeline.run(((path, faces_by_path[path]) for path in faces_by_path), write_result)
         except Exception as e:
-            self.api.update_status(f"ERROR: Batch commit failed: {str(e)}")
-            self.db.conn.rollback()
-            
-            for photo_data in batch_data:
-                if photo_data.get('photo_id'):
-                    try:
-                        self.db.update_photo_status(photo_data['photo_id'], 'error')
-                        self.db.conn.commit()
-                    except:
-                        pass
+            self.api.update_status(f"ERROR: Re-embedding failed: {str(e)}")
+        
+        if pending and self.db.update_face_embeddings(pending, self.model_version):
+            done[1] += len(pending)
+        
+        for error in pipeline.errors:
+            self.api.update_status(f"ERROR: Re-embedding stage failed: {str(error)}")
+        
+        self.api.update_status(f"Re-embedded {done[1]} of {total_faces} faces")
+        for line in pipeline.get_stage_summary():
+            self.api.update_status(line)
+        
+        self.api.reembed_complete(done[1])
+    
+    def read_photo(self, item) -> Optional[dict]:
+        file_path, faces = item
+        try:
+            return {'file_path': file_path, 'faces': faces, 'data': read_photo_bytes(file_path)}
+        except Exception as e:
+            self.api.update_status(f"ERROR: Cannot re-embed {os.path.basename(file_path)}: {str(e)}")
+            return None
+    
+    def decode_photo(self, photo_data: dict) -> Optional[dict]:
+        try:
+            image, scale_x, scale_y = decode_for_detection(photo_data.pop('data'), self.detection_max_side)
+        except Exception as e:
+            self.api.update_status(f"ERROR: Cannot read image - {os.path.basename(photo_data['file_path'])}: {str(e)}")
+            return None
+        
+        # Landmarks are stored in original image coordinates; align on the reduced decode like the scan did
+        scale = np.array([scale_x, scale_y], dtype=np.float32)
+        photo_data['crops'] = [self.analyzer.align(image, kps / scale) for _, kps in photo_data['faces']]
+        return photo_data
+    
+    def embed_faces(self, batch: List[dict]) -> List[dict]:
+        crops = [crop for photo_data in batch for crop in photo_data.pop('crops')]
+        embeddings = self.analyzer.embed(crops)
+        embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        
+        index = 0
+        for photo_data in batch:
+            face_ids = [face_id for face_id, _ in photo_data.pop('faces')]
+            photo_data['embeddings'] = list(zip(face_ids, embeddings[index:index + len(face_ids)]))
+            index += len(face_ids)
+        return batch
+
+
+class NormalizedEmbeddings:
+    """Unit-length embeddings held on the clustering device as float32, float16 or per-vector scaled int8"""
+    
+    BLOCK_ROWS = 65536
+    DTYPES = {'float32': torch.float32, 'float16': torch.float16, 'int8': torch.int8}
+    
+    def __init__(self, count: int, embedding_format: str = 'float32'):
+        self.embedding_format = embedding_format if embedding_format in self.DTYPES else 'float32'
+        self.values = torch.empty((count, EMBEDDING_DIM), dtype=self.DTYPES[self.embedding_format], device=DEVICE)
+        self.scales = torch.empty(count, dtype=torch.float32, device=DEVICE) \
+            if self.embedding_format == 'int8' else None
+    
+    @classmethod
+    def from_array(cls, embeddings, embedding_format: str = 'float32') -> 'NormalizedEmbeddings':
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        normalized = cls(len(embeddings), embedding_format)
+        for start in range(0, len(embeddings), cls.BLOCK_ROWS):
+            normalized.fill(start, embeddings[start:start + cls.BLOCK_ROWS])
+        return normalized
+    
+    def fill(self, start: int, block: np.ndarray):
+        """Normalise a float32 block and store it in its compact form at row start"""
+        block = block / np.maximum(np.linalg.norm(block, axis=1, keepdims=True), 1e-12)
+        end = start + len(block)
+        if self.scales is None:
+            self.values[start:end] = torch.from_numpy(block)
+            return
+        codes, scales = quantize_int8(block)
+        # Scales that make every dequantised row unit length again
+        scales /= np.maximum(np.linalg.norm(codes * scales[:, None], axis=1), 1e-12)
+        self.values[start:end] = torch.from_numpy(codes)
+        self.scales[start:end] = torch.from_numpy(scales)
+    
+    def trim(self, count: int):
+        self.values = self.values[:count]
+        if self.scales is not None:
+            self.scales = self.scales[:count]
+    
+    def __len__(self) -> int:
+        return len(self.values)
+    
+    @property
+    def nbytes(self) -> int:
+        scale_bytes = self.scales.element_size() * self.scales.nelement() if self.scales is not None else 0
+        return self.values.element_size() * self.values.nelement() + scale_bytes
+    
+    def rows(self, index) -> torch.Tensor:
+        """float32 rows for a slice or a list of row indices"""
+        if self.scales is not None:
+            return self.values[index].float() * self.scales[index].unsqueeze(1)
+        return self.values[index].float()
+    
+    def similarities(self, queries: torch.Tensor) -> torch.Tensor:
+        """Cosine similarity of the float32 rows queries to every embedding"""
+        if self.embedding_format == 'float32':
+            return torch.mm(queries, self.values.T)
+        return torch.cat([torch.mm(queries, self.rows(slice(start, start + self.BLOCK_ROWS)).T)
+                          for start in range(0, len(self), self.BLOCK_ROWS)], dim=1)
 
 
 class ClusterWorker(threading.Thread):
@@ -321,7 +885,7 @@ class ClusterWorker(threading.Thread):
     def run(self):
         try:
             self.api.update_status("Loading embeddings...")
-            face_ids, embeddings = self.db.get_all_embeddings()
+            face_ids, embeddings = self.load_embeddings()
             
             if len(embeddings) == 0:
                 self.api.update_status("No faces found")
@@ -344,6 +908,8 @@ class ClusterWorker(threading.Thread):
                 
                 self.api.update_status(f"Total hidden faces to track: {len(hidden_face_ids)}")
             
+            self.api.update_status(f"Holding embeddings as {embeddings.embedding_format}: "
+                                   f"{embeddings.nbytes / (1024 * 1024):.0f} MB")
             self.api.update_status(f"Clustering {len(embeddings)} faces with Chinese Whispers...")
             
             person_ids, confidences, embeddings_norm = self.cluster_with_pytorch(embeddings)
@@ -376,6 +942,24 @@ class ClusterWorker(threading.Thread):
         except Exception as e:
             self.api.update_status(f"Error: {str(e)}")
     
+    def load_embeddings(self) -> Tuple[List[int], NormalizedEmbeddings]:
+        # Block by block into the compact form, so the full float32 matrix is never held in host memory
+        cache_key = self.db.get_embedding_cache_key()
+        cached = self.db.embedding_cache.get(cache_key)
+        if cached is not None:
+            self.api.update_status("Embeddings unchanged since the last clustering, reusing them")
+            face_ids, embeddings = cached
+            return list(face_ids), embeddings
+        
+        embeddings = NormalizedEmbeddings(self.db.count_embeddings(), self.db.get_embedding_format())
+        face_ids = []
+        for chunk_ids, block in self.db.iter_embedding_chunks():
+            embeddings.fill(len(face_ids), block)
+            face_ids.extend(chunk_ids)
+        embeddings.trim(len(face_ids))
+        self.db.embedding_cache.put(cache_key, (tuple(face_ids), embeddings), embeddings.nbytes + 8 * len(face_ids))
+        return face_ids, embeddings
+    
     def restore_hidden_persons(self, clustering_id: int, face_ids: List[int], person_ids: List[int], hidden_face_ids: set):
         new_person_ids_to_hide = set()
         
@@ -392,16 +976,16 @@ class ClusterWorker(threading.Thread):
         
         self.api.update_status(f"Hidden {len(new_person_ids_to_hide)} persons after reclustering")
     
-    def cluster_with_pytorch(self, embeddings: np.ndarray) -> Tuple[List[int], List[float], torch.Tensor]:
+    def cluster_with_pytorch(self, embeddings) -> Tuple[List[int], List[float], NormalizedEmbeddings]:
         n_faces = len(embeddings)
         
         device_name = "GPU" if GPU_AVAILABLE else "CPU"
         self.api.update_status(f"Using {device_name} for clustering...")
         
-        embeddings_tensor = torch.tensor(embeddings, dtype=torch.float32).to(DEVICE)
-        
-        self.api.update_status("Normalizing embeddings...")
-        embeddings_norm = embeddings_tensor / embeddings_tensor.norm(dim=1, keepdim=True)
+        if not isinstance(embeddings, NormalizedEmbeddings):
+            self.api.update_status("Normalizing embeddings...")
+            embeddings = NormalizedEmbeddings.from_array(embeddings)
+        embeddings_norm = embeddings
         
         batch_size = 1000
         n_batches = (n_faces + batch_size - 1) // batch_size
@@ -414,9 +998,9 @@ class ClusterWorker(threading.Thread):
         for i in range(n_batches):
             start_i = i * batch_size
             end_i = min((i + 1) * batch_size, n_faces)
-            batch_i = embeddings_norm[start_i:end_i]
+            batch_i = embeddings_norm.rows(slice(start_i, end_i))
             
-            similarities = torch.mm(batch_i, embeddings_norm.T)
+            similarities = embeddings_norm.similarities(batch_i)
             similarities_cpu = similarities.cpu().numpy()
             
             for local_idx, global_idx in enumerate(range(start_i, end_i)):
@@ -490,7 +1074,7 @@ class ClusterWorker(threading.Thread):
                 confidences[cluster_indices[0]] = 0.0
                 continue
             
-            cluster_embeddings = embeddings_norm[cluster_indices]
+            cluster_embeddings = embeddings_norm.rows(cluster_indices)
             centroid = cluster_embeddings.mean(dim=0)
             centroid = centroid / centroid.norm()
             
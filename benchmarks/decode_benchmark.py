@@ -0,0 +1,137 @@
+"""
+Benchmark full-resolution vs reduced-resolution decoding for face detection.
+
+Each mode runs in its own subprocess so peak RSS is measured independently.
+Uses the photos given on the command line, or generates synthetic 24 MP JPEG
+and 12 MP PNG files when none are given.
+
+    python benchmarks/decode_benchmark.py [--max-side 1280] [photo ...]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+sys.path.insert(0, APP_DIR)
+
+
+def peak_rss_mb():
+    # VmHWM belongs to the current address space; ru_maxrss on Linux would also
+    # include the parent's peak from before the subprocess exec
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS reports bytes
+        return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset / 1024 / 1024
+        except Exception:
+            return None
+
+
+def create_synthetic_photos(folder):
+    import numpy as np
+    from PIL import Image
+    
+    rng = np.random.default_rng(0)
+    photos = []
+    for name, (width, height), fmt in [('synthetic_24mp.jpg', (6000, 4000), 'JPEG'),
+                                       ('synthetic_12mp.png', (4000, 3000), 'PNG')]:
+        gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+        noise = rng.normal(0, 25, (height, width, 3)).astype(np.float32)
+        pixels = np.clip(gradient + noise, 0, 255).astype(np.uint8)
+        path = os.path.join(folder, name)
+        Image.fromarray(pixels).save(path, fmt, quality=92)
+        photos.append(path)
+    return photos
+
+
+def decode_image(data):
+    """The full-resolution decode the scan used before decode_for_detection"""
+    from io import BytesIO
+    import numpy as np
+    import cv2
+    from PIL import Image, ImageOps
+    
+    pil_image = Image.open(BytesIO(data))
+    pil_image = ImageOps.exif_transpose(pil_image)
+    image_rgb = np.array(pil_image.convert('RGB'))
+    return cv2.cvtColor(image_rgb, cv2.COLOR_RGB2BGR)
+
+
+def run_worker(mode, max_side, iterations, photos):
+    from photo_io import read_photo_bytes, decode_for_detection
+    
+    buffers = [read_photo_bytes(path) for path in photos]
+    
+    start = time.perf_counter()
+    decoded = 0
+    for _ in range(iterations):
+        for data in buffers:
+            if mode == 'full':
+                decode_image(data)
+            else:
+                decode_for_detection(data, max_side)
+            decoded += 1
+    elapsed = time.perf_counter() - start
+    
+    print(json.dumps({
+        'photos_per_second': decoded / elapsed,
+        'ms_per_photo': elapsed / decoded * 1000,
+        'peak_rss_mb': peak_rss_mb()
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('photos', nargs='*', help='Photos to decode (synthetic ones are generated if omitted)')
+    parser.add_argument('--max-side', type=int, default=1280, help='Longest side for the reduced decode')
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--worker', choices=['full', 'reduced'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.worker:
+        run_worker(args.worker, args.max_side, args.iterations, args.photos)
+        return 0
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        photos = args.photos or create_synthetic_photos(temp_dir)
+        
+        print(f"Decoding {len(photos)} photo(s) x {args.iterations} iterations, max side {args.max_side}")
+        results = {}
+        for mode in ['full', 'reduced']:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--worker', mode,
+                 '--max-side', str(args.max_side), '--iterations', str(args.iterations)] + photos,
+                check=True, capture_output=True, text=True
+            ).stdout
+            results[mode] = json.loads(output.strip().splitlines()[-1])
+        
+        for mode, result in results.items():
+            rss = f"{result['peak_rss_mb']:.0f} MB" if result['peak_rss_mb'] is not None else "n/a"
+            print(f"{mode:>8}: {result['photos_per_second']:6.2f} photos/s, "
+                  f"{result['ms_per_photo']:7.1f} ms/photo, peak RSS {rss}")
+        
+        speedup = results['reduced']['photos_per_second'] / results['full']['photos_per_second']
+        print(f"Throughput speedup: {speedup:.1f}x")
+    
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
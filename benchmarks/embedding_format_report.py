@@ -0,0 +1,174 @@
+"""
+Clustering accuracy of the reduced-precision embedding formats.
+
+Builds a synthetic labelled set of face embeddings (persons with a varying
+number of faces of varying quality, plus faces of people seen only once),
+stores every embedding in each format of --formats, reads it back and clusters
+it with the app's Chinese Whispers clustering at --threshold. Every run uses
+the same random seeds, so differences come from the precision alone:
+
+- bytes per stored embedding and memory held while clustering
+- cosine similarity error against float32 on all pairs of --sample faces
+- adjusted Rand index of the cluster assignments against float32
+- faces assigned differently from float32 (unmatched counted as its own group)
+- pairwise precision and recall against the true persons
+
+    python benchmarks/embedding_format_report.py [--persons 500] [--threshold 50]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+import numpy as np
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from embedding_codec import EMBEDDING_FORMATS, encode_embedding, decode_embeddings_into
+from workers import ClusterWorker, NormalizedEmbeddings
+
+
+class QuietAPI:
+    def update_status(self, message):
+        pass
+
+
+def synthetic_set(persons, max_faces, singletons, noise, dim=512, seed=0):
+    """Embeddings around one random direction per person, with per-face noise and magnitudes."""
+    # Noise drawn from a range spreads genuine pairs around the clustering threshold like real
+    # faces of mixed quality.
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((persons, dim)).astype(np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    
+    counts = np.minimum(rng.geometric(1 / 8, persons) + 1, max_faces)
+    labels = np.concatenate([np.repeat(np.arange(persons), counts), np.arange(persons, persons + singletons)])
+    directions = np.concatenate([centers[labels[:counts.sum()]],
+                                 rng.standard_normal((singletons, dim)).astype(np.float32) / np.sqrt(dim)])
+    
+    sigma = rng.uniform(noise[0], noise[1], len(labels)).astype(np.float32)
+    embeddings = directions + rng.standard_normal((len(labels), dim)).astype(np.float32) * (sigma / np.sqrt(dim))[:, None]
+    embeddings *= (rng.uniform(15, 30, len(labels)) / np.linalg.norm(embeddings, axis=1))[:, None]
+    
+    order = rng.permutation(len(labels))
+    return embeddings[order].astype(np.float32), labels[order]
+
+
+def stored_round_trip(embeddings, embedding_format):
+    values = [encode_embedding(embedding, embedding_format) for embedding in embeddings]
+    decoded = np.empty_like(embeddings)
+    decode_embeddings_into(values, decoded)
+    return decoded, len(values[0])
+
+
+def groups(person_ids):
+    """Cluster labels with every unmatched face (person 0) in a group of its own"""
+    person_ids = np.asarray(person_ids)
+    return np.where(person_ids == 0, -np.arange(1, len(person_ids) + 1), person_ids)
+
+
+def pairs(counts):
+    counts = np.asarray(counts, dtype=np.float64)
+    return float((counts * (counts - 1) / 2).sum())
+
+
+def pair_statistics(a, b):
+    """Pairs together in both, pairs together in a, pairs together in b, all pairs"""
+    _, joint = np.unique(np.stack([a, b]), axis=1, return_counts=True)
+    _, a_counts = np.unique(a, return_counts=True)
+    _, b_counts = np.unique(b, return_counts=True)
+    return pairs(joint), pairs(a_counts), pairs(b_counts), pairs([len(a)])
+
+
+def adjusted_rand_index(a, b):
+    both, in_a, in_b, total = pair_statistics(a, b)
+    expected = in_a * in_b / total
+    maximum = (in_a + in_b) / 2
+    return (both - expected) / (maximum - expected) if maximum != expected else 1.0
+
+
+def moved_faces(reference, groups_):
+    """Faces not in the group that holds most of their reference group's faces"""
+    moved = 0
+    for label in np.unique(reference):
+        members = groups_[reference == label]
+        _, counts = np.unique(members, return_counts=True)
+        moved += len(members) - counts.max()
+    return moved
+
+
+def cluster(embeddings, embedding_format, threshold):
+    random.seed(0)
+    torch.manual_seed(0)
+    worker = ClusterWorker(None, threshold, QuietAPI())
+    normalized = NormalizedEmbeddings.from_array(embeddings, embedding_format)
+    start = time.perf_counter()
+    person_ids, _, _ = worker.cluster_with_pytorch(normalized)
+    return normalized, person_ids, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--formats', nargs='+', choices=EMBEDDING_FORMATS, default=EMBEDDING_FORMATS)
+    parser.add_argument('--persons', type=int, default=500)
+    parser.add_argument('--max-faces', type=int, default=60, help='Most faces of one person')
+    parser.add_argument('--singletons', type=int, default=1000, help='Faces of people seen only once')
+    parser.add_argument('--noise', type=float, nargs=2, default=[0.8, 1.3],
+                        help='Range of the per-face noise; 1.0 puts a genuine pair near cosine 0.5')
+    parser.add_argument('--threshold', type=float, default=50, help='Clustering threshold in percent')
+    parser.add_argument('--sample', type=int, default=2000, help='Faces whose pairwise similarities are compared')
+    args = parser.parse_args()
+    
+    embeddings, labels = synthetic_set(args.persons, args.max_faces, args.singletons, args.noise)
+    print(f"{len(embeddings)} faces of {args.persons} persons and {args.singletons} single faces")
+    
+    formats = ['float32'] + [f for f in args.formats if f != 'float32']
+    reference_groups, reference_similarities = None, None
+    rows = []
+    for embedding_format in formats:
+        print(f"Clustering {embedding_format}...")
+        decoded, stored_bytes = stored_round_trip(embeddings, embedding_format)
+        normalized, person_ids, seconds = cluster(decoded, embedding_format, args.threshold)
+        
+        sample = normalized.rows(slice(0, args.sample))
+        similarities = normalized.similarities(sample)[:, :args.sample].cpu().numpy()
+        
+        assigned = groups(person_ids)
+        if reference_groups is None:
+            reference_groups, reference_similarities = assigned, similarities
+        error = np.abs(similarities - reference_similarities)
+        
+        both, in_assigned, in_truth, _ = pair_statistics(assigned, labels)
+        rows.append({
+            'format': embedding_format,
+            'bytes': stored_bytes,
+            'memory': normalized.nbytes / (1024 * 1024),
+            'max_error': float(error.max()),
+            'mean_error': float(error.mean()),
+            'ari': adjusted_rand_index(assigned, reference_groups),
+            'moved': moved_faces(reference_groups, assigned),
+            'precision': both / in_assigned if in_assigned else float('nan'),
+            'recall': both / in_truth if in_truth else float('nan'),
+            'persons': len(set(person_ids) - {0}),
+            'seconds': seconds,
+        })
+    
+    print()
+    print(f"{'format':>8} {'bytes':>6} {'memory':>9} {'max err':>8} {'mean err':>9} {'ARI':>7} {'moved':>6} "
+          f"{'precision':>9} {'recall':>7} {'persons':>8} {'seconds':>8}")
+    for row in rows:
+        print(f"{row['format']:>8} {row['bytes']:6d} {row['memory']:7.1f}MB {row['max_error']:8.5f} "
+              f"{row['mean_error']:9.6f} {row['ari']:7.4f} {row['moved']:6d} {row['precision']:9.4f} "
+              f"{row['recall']:7.4f} {row['persons']:8d} {row['seconds']:8.1f}")
+    print()
+    print("err: cosine similarity error against float32; ARI and moved: assignments against float32")
+    print("precision and recall: of the same-person pairs, against the true persons")
+    
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
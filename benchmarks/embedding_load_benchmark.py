@@ -0,0 +1,130 @@
+"""
+Load time of all face embeddings, as done at the start of every recalibration.
+
+For every size in --faces, builds a synthetic database in a temporary folder
+with the embeddings in LMDB and times:
+
+- the former loader: one LMDB transaction, point lookup and unpickle per face
+- FaceDatabase.get_all_embeddings: one cursor pass in a single transaction,
+  merge joined with the face ids and decoded into a preallocated matrix
+- FaceDatabase.iter_embedding_chunks copied into one buffer, as clustering does
+- the memory-mapped matrix storage, after moving the embeddings to it
+
+Each load uses a freshly opened database. The matrix numbers are given both
+for the load itself (a memmap, nothing read yet) and for load plus one pass
+over every row, which is what clustering pays when it copies the matrix.
+
+    python benchmarks/embedding_load_benchmark.py --faces 100000 1000000
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from database import FaceDatabase
+
+
+def create_library(folder, faces, faces_per_photo=2, dim=512):
+    db = FaceDatabase(folder)
+    rng = np.random.default_rng(0)
+    cursor = db.conn.cursor()
+    
+    photos = (faces + faces_per_photo - 1) // faces_per_photo
+    cursor.executemany(
+        'INSERT INTO photos (photo_id, file_path, file_hash, scan_status) VALUES (?, ?, ?, ?)',
+        ((i + 1, f"/photos/{i}.jpg", str(i), 'completed') for i in range(photos))
+    )
+    cursor.executemany(
+        'INSERT INTO faces (face_id, photo_id, bbox_x1, bbox_y1, bbox_x2, bbox_y2) VALUES (?, ?, 0, 0, 1, 1)',
+        ((i + 1, i // faces_per_photo + 1) for i in range(faces))
+    )
+    db.conn.commit()
+    
+    chunk = 50000
+    for start in range(0, faces, chunk):
+        embeddings = rng.standard_normal((min(chunk, faces - start), dim), dtype=np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        db.store.put_many(list(range(start + 1, start + len(embeddings) + 1)), embeddings)
+    db.close()
+
+
+def load_per_face(db):
+    """The loader before the cursor pass, kept here as the baseline"""
+    cursor = db.conn.cursor()
+    cursor.execute('SELECT face_id FROM faces WHERE is_filtered = 0')
+    face_ids = []
+    embeddings = []
+    for row in cursor.fetchall():
+        embedding = db.get_face_embedding(row['face_id'])
+        if embedding is not None:
+            face_ids.append(row['face_id'])
+            embeddings.append(embedding)
+    return face_ids, np.array(embeddings)
+
+
+def load_chunked(db):
+    embeddings = np.empty((db.count_embeddings(), 512), dtype=np.float32)
+    face_ids = []
+    for chunk_ids, block in db.iter_embedding_chunks():
+        embeddings[len(face_ids):len(face_ids) + len(chunk_ids)] = block
+        face_ids.extend(chunk_ids)
+    return face_ids, embeddings[:len(face_ids)]
+
+
+def time_load(folder, storage, load, touch=False):
+    db = FaceDatabase(folder, storage)
+    start = time.perf_counter()
+    face_ids, embeddings = load(db)
+    loaded = time.perf_counter() - start
+    if touch:
+        np.asarray(embeddings, dtype=np.float32).sum()
+    total = time.perf_counter() - start
+    db.close()
+    return len(face_ids), loaded, total
+
+
+def run(faces):
+    with tempfile.TemporaryDirectory() as folder:
+        print(f"Creating a library of {faces} faces...")
+        create_library(folder, faces)
+        
+        count, per_face_seconds, _ = time_load(folder, 'lmdb', load_per_face)
+        print(f"  lmdb per face: {count} embeddings in {per_face_seconds:8.3f}s")
+        count, cursor_seconds, _ = time_load(folder, 'lmdb', FaceDatabase.get_all_embeddings)
+        print(f"    lmdb cursor: {count} embeddings in {cursor_seconds:8.3f}s "
+              f"({per_face_seconds / max(cursor_seconds, 1e-9):.1f}x)")
+        count, chunked_seconds, _ = time_load(folder, 'lmdb', load_chunked)
+        print(f"   lmdb chunked: {count} embeddings in {chunked_seconds:8.3f}s "
+              f"({per_face_seconds / max(chunked_seconds, 1e-9):.1f}x)")
+        
+        db = FaceDatabase(folder)
+        start = time.perf_counter()
+        db.set_embedding_storage('matrix')
+        print(f"  moved to the matrix storage in {time.perf_counter() - start:.1f}s")
+        db.close()
+        
+        count, matrix_seconds, touched_seconds = time_load(folder, 'matrix', FaceDatabase.get_all_embeddings, touch=True)
+        print(f"         matrix: {count} embeddings in {matrix_seconds:8.3f}s "
+              f"({touched_seconds:.3f}s including one pass over every row, "
+              f"{per_face_seconds / max(touched_seconds, 1e-9):.0f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--faces', type=int, nargs='+', default=[100000])
+    args = parser.parse_args()
+    
+    for faces in args.faces:
+        run(faces)
+    
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""
+Compares the embedding stores (LMDB, SQLite and the memory-mapped matrix).
+
+For every store in --stores and every size in --vectors, fills a new store in
+a temporary folder with synthetic unit vectors and measures:
+
+- ingest rate: put_many in batches of --batch vectors, as scanning writes them
+- random lookup latency: get_many of one random face, median and 99th percentile
+  over --lookups lookups, as opening a face does
+- full scan throughput: iter_all over every vector, as recalibrating does
+- on-disk size, in total and per vector
+
+Lookups and the scan use the store reopened after ingest. The files are fresh
+in the page cache, so the numbers show the cost of the store itself rather
+than that of the disk.
+
+    python benchmarks/embedding_store_benchmark.py --vectors 10000 100000 1000000
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from database import EMBEDDING_STORAGES, open_embedding_store
+from embedding_codec import EMBEDDING_DIM, EMBEDDING_FORMATS
+
+
+def batches(vectors, batch, seed=0):
+    rng = np.random.default_rng(seed)
+    for start in range(0, vectors, batch):
+        embeddings = rng.standard_normal((min(batch, vectors - start), EMBEDDING_DIM), dtype=np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        yield list(range(start + 1, start + len(embeddings) + 1)), embeddings
+
+
+def run(storage, vectors, embedding_format, batch, lookups):
+    with tempfile.TemporaryDirectory() as folder:
+        store = open_embedding_store(storage, folder, embedding_format)
+        ingest_seconds = 0.0
+        for face_ids, embeddings in batches(vectors, batch):
+            start = time.perf_counter()
+            store.put_many(face_ids, embeddings)
+            ingest_seconds += time.perf_counter() - start
+        store.close()
+
+        store = open_embedding_store(storage, folder, embedding_format)
+        rng = np.random.default_rng(1)
+        latencies = []
+        for face_id in rng.integers(1, vectors + 1, lookups).tolist():
+            start = time.perf_counter()
+            found_ids, _ = store.get_many([face_id])
+            latencies.append(time.perf_counter() - start)
+            assert found_ids == [face_id]
+
+        start = time.perf_counter()
+        scanned = 0
+        for face_ids, block in store.iter_all():
+            scanned += len(face_ids)
+        scan_seconds = time.perf_counter() - start
+        assert scanned == vectors
+
+        size = store.disk_size()
+        store.close()
+
+    latencies = np.array(latencies) * 1e6
+    return {
+        'store': storage,
+        'vectors': vectors,
+        'ingest': vectors / max(ingest_seconds, 1e-9),
+        'p50': float(np.percentile(latencies, 50)),
+        'p99': float(np.percentile(latencies, 99)),
+        'scan': vectors / max(scan_seconds, 1e-9),
+        'size': size / (1024 * 1024),
+        'per_vector': size / vectors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stores', nargs='+', choices=EMBEDDING_STORAGES, default=EMBEDDING_STORAGES)
+    parser.add_argument('--vectors', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--format', choices=EMBEDDING_FORMATS, default='float32',
+                        help='Encoding of the LMDB and SQLite stores; the matrix keeps float32')
+    parser.add_argument('--batch', type=int, default=1000, help='Vectors per put_many')
+    parser.add_argument('--lookups', type=int, default=2000, help='Random single-face lookups timed')
+    args = parser.parse_args()
+
+    rows = []
+    for vectors in args.vectors:
+        for storage in args.stores:
+            print(f"{storage}: {vectors} vectors...")
+            rows.append(run(storage, vectors, args.format, args.batch, args.lookups))
+
+    print()
+    print(f"{'store':>7} {'vectors':>8} {'ingest/s':>10} {'lookup p50':>11} {'p99':>9} {'scan/s':>11} "
+          f"{'size':>10} {'bytes/vec':>9}")
+    for row in rows:
+        print(f"{row['store']:>7} {row['vectors']:8d} {row['ingest']:10.0f} {row['p50']:9.1f}us "
+              f"{row['p99']:7.1f}us {row['scan']:11.0f} {row['size']:8.1f}MB {row['per_vector']:9.0f}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
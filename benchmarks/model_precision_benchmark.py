@@ -0,0 +1,231 @@
+"""
+Accuracy and throughput of the face model precisions and detector input sizes.
+
+Runs every combination of --precisions and --det-sizes over a labelled set of
+photos and compares it with FP32 at 640x640, the app's default:
+
+- photos/s and faces/s for detection plus recognition (decoding excluded)
+- detection recall: share of the reference faces found again (IoU >= 0.5)
+- recognition drift: cosine similarity between the embeddings of the same
+  aligned crops (reference landmarks), i.e. the error of the quantized
+  recognition model alone
+- end to end drift: cosine similarity between the embeddings of matched faces
+- verification accuracy on the labels at the clustering threshold and at the
+  best threshold
+
+The labelled set is a folder with one subfolder per person. The largest face of
+each photo is taken to be that person.
+
+    python benchmarks/model_precision_benchmark.py /path/to/labelled [--precisions fp32 int8] [--det-sizes 320 640]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from discovery import IMAGE_EXTENSIONS
+from photo_io import read_photo_bytes, decode_for_detection
+from face_models import create_face_app, BatchedFaceAnalyzer, MODEL_PRECISIONS, DETECTION_SIZES
+
+REFERENCE = ('fp32', 640)
+
+
+def load_labelled_set(folder, max_side, limit):
+    images, labels, names = [], [], []
+    for person in sorted(os.listdir(folder)):
+        person_dir = os.path.join(folder, person)
+        if not os.path.isdir(person_dir):
+            continue
+        
+        files = sorted(name for name in os.listdir(person_dir)
+                       if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS)
+        for name in files[:limit] if limit else files:
+            path = os.path.join(person_dir, name)
+            try:
+                image, _, _ = decode_for_detection(read_photo_bytes(path), max_side)
+            except Exception as e:
+                print(f"Skipping {path}: {e}")
+                continue
+            images.append(image)
+            labels.append(person)
+            names.append(path)
+    return images, labels, names
+
+
+def run_configuration(images, precision, det_size, batch_size, threads, repeat):
+    face_app = create_face_app(det_size=det_size, intra_op_threads=threads, precision=precision)
+    analyzer = BatchedFaceAnalyzer(face_app, batch_size)
+    
+    # Warm-up outside the timing: the first runs allocate onnxruntime's buffers
+    analyzer.analyze(images[:batch_size])
+    
+    start = time.perf_counter()
+    for _ in range(repeat):
+        faces = []
+        for i in range(0, len(images), batch_size):
+            faces.extend(analyzer.analyze(images[i:i + batch_size]))
+    elapsed = time.perf_counter() - start
+    
+    return analyzer, faces, elapsed / repeat
+
+
+def iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    intersection = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def normalize(embedding):
+    return embedding / max(np.linalg.norm(embedding), 1e-12)
+
+
+def match_faces(reference, faces):
+    """Pairs of (reference face, face) with IoU >= 0.5, greedily by IoU"""
+    pairs = []
+    used = set()
+    for ref in reference:
+        best, best_iou = None, 0.5
+        for index, face in enumerate(faces):
+            overlap = iou(ref.bbox, face.bbox)
+            if index not in used and overlap >= best_iou:
+                best, best_iou = index, overlap
+        if best is not None:
+            used.add(best)
+            pairs.append((ref, faces[best]))
+    return pairs
+
+
+def largest_face(faces):
+    if not faces:
+        return None
+    return max(faces, key=lambda face: (face.bbox[2] - face.bbox[0]) * (face.bbox[3] - face.bbox[1]))
+
+
+def verification(embeddings, labels, threshold):
+    """Accuracy over all pairs at the threshold and at the best threshold"""
+    matrix = np.vstack([normalize(e) for e in embeddings])
+    similarities = matrix @ matrix.T
+    upper = np.triu_indices(len(labels), k=1)
+    scores = similarities[upper]
+    labels = np.asarray(labels)
+    same = labels[upper[0]] == labels[upper[1]]
+    
+    if not same.any() or same.all():
+        return None, None, None
+    
+    # Genuine and impostor pairs weigh the same, there are far more impostor pairs
+    def balanced_accuracy(t):
+        return ((scores[same] >= t).mean() + (scores[~same] < t).mean()) / 2
+    
+    candidates = np.unique(np.append(np.round(scores, 3), threshold))
+    accuracies = [balanced_accuracy(t) for t in candidates]
+    best = int(np.argmax(accuracies))
+    return balanced_accuracy(threshold), accuracies[best], candidates[best]
+
+
+def fmt(value, spec):
+    return format(value, spec) if value is not None else 'n/a'
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if len(values) else float('nan')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('folder', help='Labelled photos, one subfolder per person')
+    parser.add_argument('--precisions', nargs='+', choices=list(MODEL_PRECISIONS), default=list(MODEL_PRECISIONS))
+    parser.add_argument('--det-sizes', nargs='+', type=int, choices=DETECTION_SIZES, default=[320, 480, 640])
+    parser.add_argument('--max-side', type=int, default=1280, help='Longest side photos are decoded at')
+    parser.add_argument('--limit', type=int, default=0, help='At most this many photos per person')
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--threads', type=int, default=0, help='onnxruntime intra-op threads (0: all cores)')
+    parser.add_argument('--repeat', type=int, default=1, help='Timed passes over the photos')
+    parser.add_argument('--threshold', type=float, default=50, help='Clustering threshold in percent')
+    args = parser.parse_args()
+    
+    images, labels, _ = load_labelled_set(args.folder, args.max_side, args.limit)
+    if not images:
+        print("No photos found")
+        return 1
+    print(f"{len(images)} photos of {len(set(labels))} persons")
+    
+    configurations = [REFERENCE] + [(precision, det_size) for precision in args.precisions
+                                    for det_size in args.det_sizes if (precision, det_size) != REFERENCE]
+    
+    reference_analyzer, reference_faces = None, None
+    rows = []
+    for precision, det_size in configurations:
+        print(f"Running {precision} at {det_size}x{det_size}...")
+        analyzer, faces, seconds = run_configuration(
+            images, precision, det_size, args.batch_size, args.threads, args.repeat
+        )
+        face_count = sum(len(photo_faces) for photo_faces in faces)
+        
+        if reference_faces is None:
+            reference_analyzer, reference_faces = analyzer, faces
+        
+        # Same crops through both recognition models: drift of the recognition model alone
+        crops, reference_embeddings = [], []
+        for image, photo_faces in zip(images, reference_faces):
+            for face in photo_faces:
+                if face.embedding is not None:
+                    crops.append(reference_analyzer.align(image, face.kps))
+                    reference_embeddings.append(face.embedding)
+        embeddings = analyzer.embed(crops)
+        recognition_drift = [float(normalize(a) @ normalize(b)) for a, b in zip(reference_embeddings, embeddings)]
+        
+        matched, end_to_end = 0, []
+        for ref_faces, photo_faces in zip(reference_faces, faces):
+            pairs = match_faces(ref_faces, photo_faces)
+            matched += len(pairs)
+            end_to_end.extend(float(normalize(ref.embedding) @ normalize(face.embedding)) for ref, face in pairs)
+        reference_count = sum(len(photo_faces) for photo_faces in reference_faces)
+        
+        labelled = [(largest_face(photo_faces), label) for photo_faces, label in zip(faces, labels)]
+        labelled = [(face.embedding, label) for face, label in labelled if face is not None]
+        accuracy, best_accuracy, best_threshold = verification(
+            [e for e, _ in labelled], [label for _, label in labelled], args.threshold / 100
+        ) if len(labelled) > 1 else (None, None, None)
+        
+        rows.append({
+            'config': f"{precision}@{det_size}",
+            'photos_per_second': len(images) / seconds,
+            'faces_per_second': face_count / seconds,
+            'faces': face_count,
+            'recall': matched / reference_count if reference_count else float('nan'),
+            'rec_mean': float(np.mean(recognition_drift)) if recognition_drift else float('nan'),
+            'rec_p1': percentile(recognition_drift, 1),
+            'e2e_mean': float(np.mean(end_to_end)) if end_to_end else float('nan'),
+            'e2e_p1': percentile(end_to_end, 1),
+            'accuracy': accuracy,
+            'best_accuracy': best_accuracy,
+            'best_threshold': best_threshold,
+        })
+    
+    baseline = rows[0]['photos_per_second']
+    print()
+    print(f"{'config':>22} {'photos/s':>9} {'speedup':>8} {'faces':>6} {'recall':>7} "
+          f"{'rec cos':>8} {'rec p1':>7} {'e2e cos':>8} {'e2e p1':>7} {'acc@' + format(args.threshold, 'g'):>7} "
+          f"{'best acc':>9} {'at':>5}")
+    for row in rows:
+        print(f"{row['config']:>22} {row['photos_per_second']:9.2f} {row['photos_per_second'] / baseline:7.2f}x "
+              f"{row['faces']:6d} {row['recall']:7.3f} {row['rec_mean']:8.5f} {row['rec_p1']:7.4f} "
+              f"{row['e2e_mean']:8.5f} {row['e2e_p1']:7.4f} {fmt(row['accuracy'], '7.3f'):>7} "
+              f"{fmt(row['best_accuracy'], '9.3f'):>9} {fmt(row['best_threshold'], '5.2f'):>5}")
+    print()
+    print("rec cos: cosine similarity to FP32 on the same face crops; e2e cos: on faces detected by both")
+    print("p1: 1st percentile, the worst 1% of faces drift at least this much")
+    
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
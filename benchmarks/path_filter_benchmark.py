@@ -0,0 +1,147 @@
+"""
+Micro-benchmark for the compiled scan path filter.
+
+Generates a synthetic library of paths, checks that PathFilter returns the same
+decision as the original per-path ScanWorker.should_exclude_path logic, and
+times both over the full list.
+
+    python benchmarks/path_filter_benchmark.py --paths 1000000
+"""
+
+import os
+import sys
+import time
+import random
+import fnmatch
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from path_filter import PathFilter
+
+
+def legacy_should_exclude(path, include_folders, exclude_folders, wildcard_text):
+    """The original implementation, kept verbatim as the reference"""
+    path_normalized = os.path.normpath(path)
+    
+    if not include_folders:
+        return False
+    
+    is_in_include = False
+    for include_folder in include_folders:
+        include_normalized = os.path.normpath(include_folder)
+        if path_normalized.startswith(include_normalized):
+            is_in_include = True
+            break
+    
+    if not is_in_include:
+        return True
+    
+    for exclude_folder in exclude_folders:
+        exclude_normalized = os.path.normpath(exclude_folder)
+        if path_normalized.startswith(exclude_normalized):
+            return True
+    
+    if wildcard_text:
+        wildcards = [w.strip() for w in wildcard_text.split(',') if w.strip()]
+        
+        for wildcard in wildcards:
+            wildcard_normalized = os.path.normpath(wildcard)
+            
+            if os.path.isabs(wildcard_normalized):
+                if path_normalized.startswith(wildcard_normalized):
+                    return True
+            else:
+                path_parts = path_normalized.split(os.sep)
+                filename = os.path.basename(path_normalized)
+                
+                if fnmatch.fnmatch(filename, wildcard):
+                    return True
+                
+                for part in path_parts:
+                    if fnmatch.fnmatch(part, wildcard):
+                        return True
+    
+    return False
+
+
+def build_config(base):
+    include_folders = [
+        os.path.join(base, 'Photos'),
+        os.path.join(base, 'Phone Backup'),
+        os.path.join(base, 'Archive', '2010'),
+    ]
+    exclude_folders = [
+        os.path.join(base, 'Photos', 'Screenshots'),
+        os.path.join(base, 'Photos', '2019', 'raw'),
+    ]
+    wildcard_text = ', '.join([
+        '*.gif', '*thumbnail*', '*cache*', '.*', 'Private?',
+        os.path.join(base, 'Phone Backup', 'WhatsApp'),
+    ])
+    return include_folders, exclude_folders, wildcard_text
+
+
+def build_paths(base, count, seed=42):
+    rng = random.Random(seed)
+    roots = ['Photos', 'Phone Backup', 'Archive', 'Photos2', 'Downloads']
+    folders = ['2015', '2016', '2017', '2018', '2019', 'Screenshots', 'raw', 'WhatsApp',
+               'Holiday', 'Family', '.thumbnails', 'cache', 'Private1', 'Edited', '2010']
+    names = ['IMG_{:05d}.jpg', 'DSC{:05d}.JPG', 'photo_{:05d}.heic', 'anim_{:05d}.gif',
+             'scan_{:05d}_thumbnail.png', 'PXL_{:05d}.jpg']
+    
+    paths = []
+    for i in range(count):
+        depth = rng.randint(0, 4)
+        parts = [base, rng.choice(roots)] + [rng.choice(folders) for _ in range(depth)]
+        parts.append(rng.choice(names).format(i % 100000))
+        paths.append(os.path.join(*parts))
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--paths', type=int, default=1000000, help='Number of synthetic paths')
+    parser.add_argument('--verify', type=int, default=200000,
+                        help='Number of paths compared against the legacy implementation')
+    args = parser.parse_args()
+    
+    base = os.path.abspath(os.sep + 'library')
+    include_folders, exclude_folders, wildcard_text = build_config(base)
+    
+    print(f"Generating {args.paths} synthetic paths...")
+    paths = build_paths(base, args.paths)
+    
+    path_filter = PathFilter(include_folders, exclude_folders, wildcard_text)
+    
+    sample = paths[:args.verify]
+    mismatches = 0
+    for path in sample:
+        expected = legacy_should_exclude(path, include_folders, exclude_folders, wildcard_text)
+        if path_filter.excludes(path) != expected:
+            mismatches += 1
+            if mismatches <= 10:
+                print(f"  MISMATCH: {path} (legacy={expected})")
+    print(f"Verified {len(sample)} paths: {mismatches} mismatches")
+    
+    start = time.perf_counter()
+    legacy_excluded = sum(
+        1 for path in paths
+        if legacy_should_exclude(path, include_folders, exclude_folders, wildcard_text)
+    )
+    legacy_seconds = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    path_filter = PathFilter(include_folders, exclude_folders, wildcard_text)
+    compiled_excluded = sum(1 for path in paths if path_filter.excludes(path))
+    compiled_seconds = time.perf_counter() - start
+    
+    print(f"Legacy filter:   {legacy_seconds:7.2f}s ({len(paths) / legacy_seconds:,.0f} paths/s), {legacy_excluded} excluded")
+    print(f"Compiled filter: {compiled_seconds:7.2f}s ({len(paths) / compiled_seconds:,.0f} paths/s), {compiled_excluded} excluded")
+    print(f"Speedup: {legacy_seconds / compiled_seconds:.1f}x")
+    
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
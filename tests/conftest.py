@@ -0,0 +1,11 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+
+def unit_vectors(count, seed=0):
+    embeddings = np.random.default_rng(seed).standard_normal((count, 512)).astype(np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
@@ -0,0 +1,79 @@
+import io
+import json
+import sys
+
+import pytest
+
+import cli
+
+
+def run_cli(monkeypatch, *argv):
+    """Exit code and the JSON events printed to stdout"""
+    out = io.StringIO()
+    monkeypatch.setattr(sys, 'stdout', out)
+    exit_code = cli.main(list(argv))
+    return exit_code, [json.loads(line) for line in out.getvalue().splitlines()]
+
+
+def test_stats_of_empty_library(tmp_path, monkeypatch):
+    exit_code, events = run_cli(monkeypatch, '--data-dir', str(tmp_path / 'data'), 'stats')
+
+    assert exit_code == cli.EXIT_OK
+    assert events[-1]['event'] == 'result'
+    assert events[-1]['command'] == 'stats'
+    assert events[-1]['total_photos'] == 0
+    assert events[-1]['clustering'] is None
+
+
+def test_export_without_clustering_fails(tmp_path, monkeypatch):
+    exit_code, events = run_cli(monkeypatch, '--data-dir', str(tmp_path / 'data'), 'export',
+                                str(tmp_path / 'faces.csv'))
+
+    assert exit_code == cli.EXIT_FAILED
+    assert events[-1]['event'] == 'status'
+    assert events[-1]['message'].startswith('ERROR')
+    assert not (tmp_path / 'faces.csv').exists()
+
+
+def test_invalid_arguments_exit_with_2(tmp_path, monkeypatch):
+    with pytest.raises(SystemExit) as exc_info:
+        run_cli(monkeypatch, '--data-dir', str(tmp_path / 'data'), 'scan', '--mode', 'fibers')
+    assert exc_info.value.code == 2
+
+
+def test_scan_of_missing_folder_fails(tmp_path, monkeypatch):
+    pytest.importorskip('torch')
+    exit_code, events = run_cli(monkeypatch, '--data-dir', str(tmp_path / 'data'), 'scan',
+                                '--add-folder', str(tmp_path / 'missing'))
+
+    assert exit_code == cli.EXIT_FAILED
+    assert events[-1]['message'].startswith('ERROR: Not a folder')
+
+
+def test_ctrl_c_stops_the_worker():
+    class Worker:
+        stopped = False
+
+        def start(self):
+            pass
+
+        def is_alive(self):
+            return True
+
+        def join(self, timeout=None):
+            if timeout is not None:
+                raise KeyboardInterrupt
+
+        def stop(self):
+            self.stopped = True
+
+    class StatusLog:
+        def __init__(self):
+            self.messages = []
+
+        def update_status(self, message):
+            self.messages.append(message)
+
+    worker = Worker()
+    assert not cli.run_worker(worker, StatusLog())
+    assert worker.stopped
@@ -0,0 +1,65 @@
+import pytest
+
+from conftest import unit_vectors
+from database import EMBEDDING_STORAGES, FaceDatabase
+
+
+def scanned_photo(file_path, embeddings):
+    return {
+        'file_path': file_path,
+        'file_hash': file_path,
+        'hash_version': 1,
+        'file_size': 1000,
+        'status': 'completed',
+        'model_version': 'test',
+        'faces': [{'bbox': [10.0 * i, 0.0, 10.0 * i + 8, 8.0], 'embedding': embedding, 'det_score': 0.9}
+                  for i, embedding in enumerate(embeddings)],
+    }
+
+
+def count_rows(db, table):
+    return db.conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+
+@pytest.mark.parametrize('storage', EMBEDDING_STORAGES)
+def test_orphans_are_removed(tmp_path, storage):
+    db = FaceDatabase(tmp_path, embedding_storage=storage)
+    db.ingest_batch([scanned_photo('/photos/a.jpg', unit_vectors(2)),
+                     scanned_photo('/photos/b.jpg', unit_vectors(1, seed=1))])
+    face_ids = sorted(db.get_all_face_ids())
+    db.tag_faces(face_ids, 'Alice')
+
+    # What older versions left behind when they deleted a photo
+    db.conn.execute("DELETE FROM photos WHERE file_path = '/photos/b.jpg'")
+    db.conn.commit()
+
+    result = db.compact_storage()
+    assert result['orphan_faces'] == 1
+    assert result['orphan_rows'] == 1
+    assert result['orphan_embeddings'] == 1
+    assert sorted(db.get_all_face_ids()) == face_ids[:2]
+    assert db.get_all_embeddings()[0] == face_ids[:2]
+    assert count_rows(db, 'face_tags') == 2
+
+    assert db.compact_storage(vacuum=True, compact_embeddings=True)['orphan_faces'] == 0
+    assert db.get_all_embeddings()[0] == face_ids[:2]
+    db.close()
+
+
+def test_old_clusterings_are_removed(tmp_path):
+    db = FaceDatabase(tmp_path)
+    db.ingest_batch([scanned_photo('/photos/a.jpg', unit_vectors(2))])
+    face_ids = sorted(db.get_all_face_ids())
+    clustering_ids = []
+    for threshold in range(50, 55):
+        clustering_id = db.create_clustering(threshold)
+        db.save_cluster_assignments(clustering_id, face_ids, [1, 2], [1.0, 1.0])
+        clustering_ids.append(clustering_id)
+
+    result = db.compact_storage(keep_clusterings=3)
+    assert result['clusterings_removed'] == 2
+    assert result['assignments_removed'] == 4
+    assert [row[0] for row in db.conn.execute('SELECT clustering_id FROM clusterings ORDER BY clustering_id')] == \
+        clustering_ids[2:]
+    assert db.get_active_clustering()['clustering_id'] == clustering_ids[-1]
+    db.close()
@@ -0,0 +1,135 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from conftest import unit_vectors
+from database import EMBEDDING_STORAGES, FaceDatabase, embedding_store_path
+
+
+def scanned_photo(file_path, embeddings):
+    return {
+        'file_path': file_path,
+        'file_hash': file_path,
+        'hash_version': 1,
+        'file_size': 1000,
+        'status': 'completed',
+        'model_version': 'test',
+        'faces': [{'bbox': [10.0 * i, 0.0, 10.0 * i + 8, 8.0], 'embedding': embedding, 'det_score': 0.9}
+                  for i, embedding in enumerate(embeddings)],
+    }
+
+
+def face_count(db):
+    return db.conn.execute('SELECT COUNT(*) FROM faces').fetchone()[0]
+
+
+@pytest.mark.parametrize('source, target', list(itertools.permutations(EMBEDDING_STORAGES, 2)))
+def test_set_embedding_storage_round_trip(tmp_path, source, target):
+    db = FaceDatabase(tmp_path, embedding_storage=source)
+    embeddings = unit_vectors(3)
+    db.ingest_batch([scanned_photo('/photos/a.jpg', embeddings)])
+    face_ids, _ = db.get_all_embeddings()
+
+    assert db.set_embedding_storage(target) == 3
+    assert db.get_embedding_storage() == target
+    assert not embedding_store_path(source, tmp_path).exists()
+
+    assert db.set_embedding_storage(source) == 3
+    db.close()
+
+    # Reopened without a storage, the library stays where it was moved
+    db = FaceDatabase(tmp_path)
+    assert db.get_embedding_storage() == source
+    moved_ids, moved = db.get_all_embeddings()
+    assert moved_ids == face_ids
+    np.testing.assert_array_equal(moved, embeddings)
+    db.close()
+
+
+@pytest.mark.parametrize('storage', EMBEDDING_STORAGES)
+def test_ingest_batch(tmp_path, storage):
+    db = FaceDatabase(tmp_path, embedding_storage=storage)
+    db.add_to_scan_queue([('/photos/a.jpg', 0, True), ('/photos/b.jpg', 0, True)])
+    embeddings = unit_vectors(2)
+
+    photo_ids = db.ingest_batch([scanned_photo('/photos/a.jpg', embeddings[:1]),
+                                 scanned_photo('/photos/b.jpg', embeddings[1:])])
+    assert len(photo_ids) == 2
+    assert db.get_scan_queue_size() == 0
+    face_ids, stored = db.get_all_embeddings()
+    assert len(face_ids) == 2
+    np.testing.assert_array_equal(stored, embeddings)
+
+    # A completed photo is not written again
+    assert db.ingest_batch([scanned_photo('/photos/a.jpg', embeddings[:1])]) == []
+    assert face_count(db) == 2
+    db.close()
+
+
+class FailingCommit:
+    """Connection whose commit fails, as a full disk or a lost lock would"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def commit(self):
+        raise OSError("disk I/O error")
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+@pytest.mark.parametrize('storage', EMBEDDING_STORAGES)
+def test_ingest_batch_fails_after_store_write(tmp_path, storage):
+    db = FaceDatabase(tmp_path, embedding_storage=storage)
+    db.ingest_batch([scanned_photo('/photos/a.jpg', unit_vectors(1))])
+    db.add_to_scan_queue([('/photos/b.jpg', 0, True)])
+    face_ids, embeddings = db.get_all_embeddings()
+
+    conn = db.conn
+    db.conn = FailingCommit(conn)
+    assert db.ingest_batch([scanned_photo('/photos/b.jpg', unit_vectors(2, seed=1))]) is None
+    db.conn = conn
+
+    # Neither the rows nor the embeddings of the failed batch are left behind
+    assert face_count(db) == 1
+    assert db.store.count() == 1
+    assert db.get_scan_queue_size() == 1
+    assert conn.execute('SELECT COUNT(*) FROM photos WHERE file_path = ?', ('/photos/b.jpg',)).fetchone()[0] == 0
+    stored_ids, stored = db.get_all_embeddings()
+    assert stored_ids == face_ids
+    np.testing.assert_array_equal(stored, embeddings)
+
+    # The batch can be written once the database is back
+    assert len(db.ingest_batch([scanned_photo('/photos/b.jpg', unit_vectors(2, seed=1))])) == 1
+    assert db.store.count() == 3
+    db.close()
+
+
+def test_watcher_entries_do_not_skip_discovery(tmp_path):
+    db = FaceDatabase(tmp_path)
+    assert db.add_to_scan_queue([('/photos/a.jpg', 0, True)]) == 1
+    assert not db.has_resumable_scan_queue()
+
+    # A queue left by an interrupted discovery scan still resumes with the watcher's entries in it
+    db.replace_scan_queue([('/photos/b.jpg', 0, True)])
+    db.add_to_scan_queue([('/photos/a.jpg', 0, True)])
+    assert db.has_resumable_scan_queue()
+    assert sorted(db.get_scan_queue_paths()) == ['/photos/a.jpg', '/photos/b.jpg']
+    db.close()
+
+
+def test_unreadable_photo_is_stored_as_error(tmp_path):
+    db = FaceDatabase(tmp_path)
+    rescanned = dict(scanned_photo('/photos/b.jpg', unit_vectors(1)), status='pending')
+    db.ingest_batch([rescanned])
+
+    unreadable = [{'file_path': path, 'status': 'error', 'faces': []} for path in ('/photos/a.jpg', '/photos/b.jpg')]
+    assert len(db.ingest_batch(unreadable)) == 2
+
+    rows = db.conn.execute('SELECT file_path, file_hash, scan_status FROM photos ORDER BY file_path').fetchall()
+    assert [tuple(row) for row in rows] == [('/photos/a.jpg', None, 'error'), ('/photos/b.jpg', '/photos/b.jpg', 'error')]
+    assert face_count(db) == 1
+    assert sorted(db.get_pending_and_error_paths()) == ['/photos/a.jpg', '/photos/b.jpg']
+    db.close()
@@ -0,0 +1,105 @@
+import os
+import shutil
+import threading
+import time
+
+import pytest
+
+from database import FaceDatabase
+from discovery import PhotoDiscovery, collapse_include_folders
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = FaceDatabase(tmp_path / "db")
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def library(tmp_path):
+    root = tmp_path / "photos"
+    for path in ("a.jpg", "notes.txt", "2020/b.JPG", "2020/c.png", "2021/d.heic", "2021/skip/e.jpg"):
+        (root / path).parent.mkdir(parents=True, exist_ok=True)
+        (root / path).write_bytes(b"x")
+    age(root)
+    return root
+
+
+def age(root):
+    # Directory mtimes inside the settle window are not trusted, so make them old
+    for dir_path, _, _ in os.walk(root):
+        set_mtime(dir_path, 60)
+
+
+def set_mtime(path, seconds_ago):
+    past = time.time() - seconds_ago
+    os.utime(path, (past, past))
+
+
+def discover(db, root, exclude=lambda path: False):
+    discovery = PhotoDiscovery(db, exclude)
+    files = discovery.discover([str(root)], lambda message: None)
+    return discovery, {os.path.relpath(path, root).replace(os.sep, '/') for path in files}
+
+
+def test_first_walk_lists_every_directory(db, library):
+    discovery, files = discover(db, library)
+    assert files == {"a.jpg", "2020/b.JPG", "2020/c.png", "2021/d.heic", "2021/skip/e.jpg"}
+    assert (discovery.dirs_listed, discovery.dirs_reused) == (4, 0)
+
+
+def test_unchanged_directories_are_reused(db, library):
+    discover(db, library)
+    discovery, files = discover(db, library)
+    assert files == {"a.jpg", "2020/b.JPG", "2020/c.png", "2021/d.heic", "2021/skip/e.jpg"}
+    assert (discovery.dirs_listed, discovery.dirs_reused) == (0, 4)
+
+
+def test_only_changed_directory_is_listed(db, library):
+    discover(db, library)
+    (library / "2020" / "new.jpg").write_bytes(b"x")
+    (library / "2021" / "d.heic").unlink()
+    set_mtime(library / "2020", 30)
+    set_mtime(library / "2021", 30)
+
+    discovery, files = discover(db, library)
+    assert files == {"a.jpg", "2020/b.JPG", "2020/c.png", "2020/new.jpg", "2021/skip/e.jpg"}
+    assert (discovery.dirs_listed, discovery.dirs_reused) == (2, 2)
+
+
+def test_removed_directory_leaves_the_index(db, library):
+    discover(db, library)
+    shutil.rmtree(library / "2021")
+    set_mtime(library, 30)
+
+    discovery, files = discover(db, library)
+    assert files == {"a.jpg", "2020/b.JPG", "2020/c.png"}
+    assert set(db.get_directory_index()) == {str(library), str(library / "2020")}
+
+
+def test_recent_mtime_is_listed_again(db, library):
+    os.utime(library / "2020")
+    discover(db, library)
+    assert db.get_directory_index()[str(library / "2020")]['mtime'] is None
+
+    discovery, _ = discover(db, library)
+    assert (discovery.dirs_listed, discovery.dirs_reused) == (1, 3)
+
+
+def test_excluded_paths_are_skipped(db, library):
+    skip = str(library / "2021" / "skip")
+    _, files = discover(db, library, lambda path: path == skip or path.endswith(".png"))
+    assert files == {"a.jpg", "2020/b.JPG", "2021/d.heic"}
+
+
+def test_stop_returns_none(db, library):
+    stop_event = threading.Event()
+    stop_event.set()
+    assert PhotoDiscovery(db, lambda path: False, stop_event).discover([str(library)], lambda message: None) is None
+
+
+def test_collapse_include_folders(tmp_path):
+    photos = str(tmp_path / "photos")
+    assert collapse_include_folders([os.path.join(photos, "2020"), photos, photos + "2", photos + os.sep]) == \
+        [photos, photos + "2"]
@@ -0,0 +1,86 @@
+import numpy as np
+
+from conftest import unit_vectors
+from database import FaceDatabase
+from embedding_cache import EmbeddingCache
+
+
+def scanned_photo(file_path, embeddings):
+    return {
+        'file_path': file_path,
+        'file_hash': file_path,
+        'hash_version': 1,
+        'file_size': 1000,
+        'status': 'completed',
+        'model_version': 'test',
+        'faces': [{'bbox': [10.0 * i, 0.0, 10.0 * i + 8, 8.0], 'embedding': embedding, 'det_score': 0.9}
+                  for i, embedding in enumerate(embeddings)],
+    }
+
+
+def test_least_recently_used_is_evicted_first():
+    cache = EmbeddingCache(max_bytes=300)
+    assert cache.put('a', 'matrix a', 100)
+    assert cache.put('b', 'matrix b', 100)
+    assert cache.put('c', 'matrix c', 100)
+    assert cache.get('a') == 'matrix a'
+
+    assert cache.put('d', 'matrix d', 100)
+    assert cache.get('b') is None
+    assert [cache.get(key) for key in 'acd'] == ['matrix a', 'matrix c', 'matrix d']
+    assert cache.nbytes == 300
+
+
+def test_too_large_entry_is_not_kept():
+    cache = EmbeddingCache(max_bytes=100)
+    cache.put('a', 'matrix a', 50)
+    assert not cache.put('b', 'matrix b', 101)
+    assert cache.get('b') is None
+    assert cache.get('a') == 'matrix a'
+
+
+def test_replacing_a_key_counts_its_bytes_once():
+    cache = EmbeddingCache(max_bytes=1000)
+    cache.put('a', 'old', 400)
+    cache.put('a', 'new', 300)
+    assert cache.get('a') == 'new'
+    assert cache.nbytes == 300
+    assert len(cache) == 1
+
+
+def test_lower_cap_shrinks_the_cache():
+    cache = EmbeddingCache(max_bytes=1000)
+    for key in 'abc':
+        cache.put(key, key, 300)
+    cache.set_max_bytes(500)
+    assert len(cache) == 1
+    assert cache.get('c') == 'c'
+
+    assert cache.evict('c')
+    assert not cache.evict('c')
+    assert cache.nbytes == 0
+
+
+def test_cache_key_changes_with_every_write(tmp_path):
+    db = FaceDatabase(tmp_path)
+    keys = [db.get_embedding_cache_key()]
+
+    db.ingest_batch([scanned_photo('/photos/a.jpg', unit_vectors(2))])
+    keys.append(db.get_embedding_cache_key())
+    db.get_all_embeddings()
+    assert db.get_embedding_cache_key() == keys[-1]
+
+    face_ids, embeddings = db.get_all_embeddings()
+    # Same faces and ids, new embeddings: only the write generation tells them apart
+    db.update_face_embeddings(list(zip(face_ids, embeddings[::-1])), 'test 2')
+    keys.append(db.get_embedding_cache_key())
+
+    db.remove_photos(['/photos/a.jpg'])
+    keys.append(db.get_embedding_cache_key())
+
+    db.set_embedding_format('int8')
+    keys.append(db.get_embedding_cache_key())
+
+    assert len(set(keys)) == len(keys)
+    np.testing.assert_array_equal(db.get_all_embeddings()[1], np.array([]))
+    db.close()
@@ -0,0 +1,57 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from conftest import unit_vectors
+from embedding_codec import EMBEDDING_DIM, decode_embedding, decode_embeddings_into, encode_embedding
+
+
+@pytest.mark.parametrize('embedding_format, tolerance', [('float32', 0), ('float16', 1e-3), ('int8', 1e-2)])
+def test_round_trip(embedding_format, tolerance):
+    embedding = unit_vectors(1)[0]
+    decoded = decode_embedding(encode_embedding(embedding, embedding_format))
+
+    assert decoded.dtype == np.float32
+    assert decoded.shape == (EMBEDDING_DIM,)
+    np.testing.assert_allclose(decoded, embedding, atol=tolerance)
+
+
+def test_encoded_sizes():
+    embedding = unit_vectors(1)[0]
+    assert len(encode_embedding(embedding, 'float16')) == 1 + EMBEDDING_DIM * 2
+    assert len(encode_embedding(embedding, 'int8')) == 1 + 4 + EMBEDDING_DIM
+
+
+def test_int8_zero_vector():
+    decoded = decode_embedding(encode_embedding(np.zeros(EMBEDDING_DIM, dtype=np.float32), 'int8'))
+    np.testing.assert_array_equal(decoded, np.zeros(EMBEDDING_DIM, dtype=np.float32))
+
+
+def test_decode_mixed_formats_into():
+    embeddings = unit_vectors(7)
+    values = [encode_embedding(embeddings[0], 'float32'),
+              encode_embedding(embeddings[1], 'float16'),
+              encode_embedding(embeddings[2], 'int8'),
+              encode_embedding(embeddings[3], 'float32'),
+              # Older pickles, which the layout shortcut does not know
+              pickle.dumps(embeddings[4], protocol=2),
+              encode_embedding(embeddings[5], 'int8'),
+              encode_embedding(embeddings[6], 'float16')]
+    out = np.empty((len(values), EMBEDDING_DIM), dtype=np.float32)
+    decode_embeddings_into(values, out)
+
+    for row, value in enumerate(values):
+        np.testing.assert_array_equal(out[row], decode_embedding(value))
+    np.testing.assert_allclose(out, embeddings, atol=1e-2)
+
+
+@pytest.mark.parametrize('embedding_format', ['float32', 'float16', 'int8'])
+def test_decode_same_format_into(embedding_format):
+    embeddings = unit_vectors(5)
+    values = [encode_embedding(embedding, embedding_format) for embedding in embeddings]
+    out = np.empty((len(values), EMBEDDING_DIM), dtype=np.float32)
+    decode_embeddings_into(values, out)
+
+    for row, value in enumerate(values):
+        np.testing.assert_array_equal(out[row], decode_embedding(value))
@@ -0,0 +1,137 @@
+import numpy as np
+
+from embedding_matrix import EmbeddingMatrix, TOMBSTONE
+
+
+def vectors(count, dim=8, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+
+
+def test_put_and_get(tmp_path):
+    matrix = EmbeddingMatrix(tmp_path, dim=8)
+    embeddings = vectors(3)
+    assert matrix.put_many([1, 2, 3], embeddings) == 3
+
+    assert matrix.count() == 3
+    face_ids, found = matrix.get_many([3, 1, 99])
+    assert face_ids == [3, 1]
+    np.testing.assert_array_equal(found, embeddings[[2, 0]])
+    np.testing.assert_array_equal(matrix.get(2), embeddings[1])
+    assert matrix.get(99) is None
+
+
+def test_overwrite_keeps_row(tmp_path):
+    matrix = EmbeddingMatrix(tmp_path, dim=8)
+    matrix.put_many([1, 2], vectors(2))
+    replacement = vectors(1, seed=1)
+    matrix.put_many([2], replacement)
+
+    assert matrix.count() == 2
+    assert (tmp_path / "matrix_0.f32").stat().st_size == 2 * 8 * 4
+    np.testing.assert_array_equal(matrix.get(2), replacement[0])
+
+
+def test_delete_leaves_tombstone(tmp_path):
+    matrix = EmbeddingMatrix(tmp_path, dim=8)
+    embeddings = vectors(3)
+    matrix.put_many([1, 2, 3], embeddings)
+
+    assert matrix.delete_many([2, 99]) == 1
+    assert matrix.count() == 2
+    assert matrix.get(2) is None
+    assert sorted(matrix.face_ids().tolist()) == [1, 3]
+    assert np.fromfile(tmp_path / "ids_0.i64", dtype=np.int64).tolist() == [1, TOMBSTONE, 3]
+    face_ids, found = matrix.all()
+    assert face_ids.tolist() == [1, 3]
+    np.testing.assert_array_equal(found, embeddings[[0, 2]])
+
+
+def test_compact_starts_new_generation(tmp_path):
+    matrix = EmbeddingMatrix(tmp_path, dim=8)
+    embeddings = vectors(4)
+    matrix.put_many([1, 2, 3, 4], embeddings)
+    matrix.delete_many([1, 3])
+
+    assert matrix.compact() > 0
+    assert matrix.generation == 1
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["ids_1.i64", "matrix_1.f32", "meta.json"]
+    face_ids, found = matrix.all()
+    assert face_ids.tolist() == [2, 4]
+    np.testing.assert_array_equal(found, embeddings[[1, 3]])
+    assert matrix.compact() == 0
+
+
+def test_delete_compacts_past_ratio(tmp_path):
+    matrix = EmbeddingMatrix(tmp_path, dim=8)
+    matrix.COMPACT_MIN_ROWS = 2
+    matrix.put_many([1, 2, 3, 4], vectors(4))
+    matrix.delete_many([1])
+    assert matrix.generation == 0
+
+    matrix.delete_many([2])
+    assert matrix.generation == 1
+    assert matrix.face_ids().tolist() == [3, 4]
+
+
+def test_reopen(tmp_path):
+    matrix = EmbeddingMatrix(tmp_path, dim=8)
+    embeddings = vectors(4)
+    matrix.put_many([1, 2, 3, 4], embeddings)
+    matrix.delete_many([4])
+    matrix.close()
+
+    reopened = EmbeddingMatrix(tmp_path, dim=8)
+    assert reopened.count() == 3
+    face_ids, found = reopened.get_many([1, 2, 3, 4])
+    assert face_ids == [1, 2, 3]
+    np.testing.assert_array_equal(found, embeddings[:3])
+
+    reopened.compact()
+    reopened.close()
+    assert EmbeddingMatrix(tmp_path, dim=8).face_ids().tolist() == [1, 2, 3]
+
+
+def test_reopen_truncates_half_written_append(tmp_path):
+    matrix = EmbeddingMatrix(tmp_path, dim=8)
+    embeddings = vectors(3)
+    matrix.put_many([1, 2], embeddings[:2])
+    matrix.close()
+
+    # A crash after the row was appended but before its id
+    with open(tmp_path / "matrix_0.f32", 'ab') as f:
+        f.write(embeddings[2].tobytes())
+    with open(tmp_path / "ids_0.i64", 'ab') as f:
+        f.write(b'\0\0\0')
+
+    reopened = EmbeddingMatrix(tmp_path, dim=8)
+    assert reopened.count() == 2
+    assert (tmp_path / "matrix_0.f32").stat().st_size == 2 * 8 * 4
+    assert (tmp_path / "ids_0.i64").stat().st_size == 2 * 8
+
+    reopened.put_many([3], embeddings[2:])
+    face_ids, found = reopened.all()
+    assert face_ids.tolist() == [1, 2, 3]
+    np.testing.assert_array_equal(found, embeddings)
+
+
+def test_clear(tmp_path):
+    matrix = EmbeddingMatrix(tmp_path, dim=8)
+    matrix.put_many([1, 2], vectors(2))
+    matrix.clear()
+
+    assert matrix.count() == 0
+    assert matrix.get_many([1, 2])[0] == []
+    assert EmbeddingMatrix(tmp_path, dim=8).count() == 0
+
+
+def test_all_maps_the_file_without_tombstones(tmp_path):
+    matrix = EmbeddingMatrix(tmp_path, dim=8)
+    embeddings = vectors(5)
+    matrix.put_many([1, 2, 3, 4, 5], embeddings)
+
+    face_ids, found = matrix.all()
+    assert isinstance(found, np.memmap)
+    chunks = list(matrix.iter_all(chunk_rows=2))
+    assert [len(ids) for ids, _ in chunks] == [2, 2, 1]
+    assert all(isinstance(chunk, np.memmap) for _, chunk in chunks)
+    np.testing.assert_array_equal(np.vstack([chunk for _, chunk in chunks]), embeddings)
@@ -0,0 +1,72 @@
+import json
+import re
+import threading
+import time
+
+from event_bus import EventBus
+
+
+def messages_in(script):
+    match = re.search(r'updateStatusMessages\((.*?)\);', script)
+    return json.loads(match.group(1)) if match else []
+
+
+def test_flush_sends_messages_and_latest_progress_in_one_call():
+    calls = []
+    bus = EventBus(calls.append)
+    bus.post_status("first")
+    bus.post_progress(1, 10)
+    bus.post_status("second")
+    bus.post_progress(5, 10)
+    bus.flush()
+
+    assert len(calls) == 1
+    assert messages_in(calls[0]) == ["first", "second"]
+    assert calls[0].endswith("updateProgress(5, 10, 50.0);")
+
+    bus.flush()
+    assert len(calls) == 1
+
+
+def test_old_messages_are_dropped_past_the_limit():
+    calls = []
+    bus = EventBus(calls.append, max_messages=3)
+    for i in range(5):
+        bus.post_status(f"message {i}")
+    bus.flush()
+
+    assert messages_in(calls[0]) == ["... 2 more messages, see the log file", "message 2", "message 3", "message 4"]
+
+
+def test_ui_updates_are_rate_limited():
+    calls = []
+    bus = EventBus(calls.append, rate=10.0)
+    bus.start()
+
+    # A thousand updates from several threads reach the UI in at most one call per interval
+    def post(thread_index):
+        for i in range(250):
+            bus.post_progress(i, 250)
+            bus.post_status(f"thread {thread_index} photo {i}")
+            time.sleep(0.002)
+
+    start = time.monotonic()
+    threads = [threading.Thread(target=post, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    bus.close()
+    elapsed = time.monotonic() - start
+
+    assert 2 <= len(calls) <= elapsed * 10 + 2
+    assert sum(len(messages_in(script)) for script in calls) == 1000
+
+
+def test_ui_errors_do_not_escape():
+    def evaluate_js(script):
+        raise RuntimeError("window closed")
+
+    bus = EventBus(evaluate_js)
+    bus.post_status("lost")
+    bus.flush()
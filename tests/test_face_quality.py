@@ -0,0 +1,60 @@
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+from face_quality import QualityGate, blur_score
+
+
+def detection(width, height, det_score=0.9):
+    return SimpleNamespace(bbox=np.array([100.0, 100.0, 100.0 + width, 100.0 + height]), det_score=det_score)
+
+
+def sharp_crop():
+    crop = np.zeros((112, 112, 3), dtype=np.uint8)
+    crop[::8] = 255
+    crop[:, ::8] = 255
+    return crop
+
+
+def test_gate_is_off_unless_enabled():
+    assert QualityGate.from_settings({'quality_min_face_size': 40}) is None
+    gate = QualityGate.from_settings({'quality_gate_enabled': True, 'quality_min_face_size': 40})
+    assert gate.min_face_size == 40
+    assert gate.min_det_score == 0.0
+
+
+def test_zero_thresholds_accept_everything():
+    gate = QualityGate()
+    assert gate.check_detection(detection(1, 1, det_score=0.01)) is None
+    assert gate.check_crop(np.zeros((112, 112, 3), dtype=np.uint8)) is None
+
+
+def test_small_faces_are_rejected_on_their_shorter_side():
+    gate = QualityGate(min_face_size=40)
+    assert gate.check_detection(detection(40, 60)) is None
+    assert gate.check_detection(detection(60, 39)) == 'small'
+
+
+def test_low_detector_scores_are_rejected():
+    gate = QualityGate(min_det_score=0.6)
+    assert gate.check_detection(detection(80, 80, det_score=0.6)) is None
+    assert gate.check_detection(detection(80, 80, det_score=0.5)) == 'low_score'
+
+
+def test_blurred_crops_are_rejected():
+    crop = sharp_crop()
+    blurred = cv2.GaussianBlur(crop, (15, 15), 5)
+    assert blur_score(blurred) < blur_score(crop)
+
+    gate = QualityGate(min_blur_score=(blur_score(blurred) + blur_score(crop)) / 2)
+    assert gate.check_crop(crop) is None
+    assert gate.check_crop(blurred) == 'blurred'
+
+
+def test_face_size_is_measured_in_original_pixels():
+    gate = QualityGate(min_face_size=40)
+    # 30 px in a decode at half size is a 60 px face in the photo
+    assert gate.check_detection(detection(30, 30), 2.0, 2.0) is None
+    assert gate.check_detection(detection(30, 18), 2.0, 2.0) == 'small'
+    assert gate.check_detection(detection(30, 30)) == 'small'
@@ -0,0 +1,133 @@
+import os
+import time
+
+import numpy as np
+
+from conftest import unit_vectors
+from database import FaceDatabase
+from folder_watcher import FolderWatcher
+from path_filter import PathFilter
+from photo_io import HASH_VERSION, compute_file_hash
+
+
+def make_watcher(db, root, debounce=2.0, max_delay=10.0):
+    path_filter = PathFilter([str(root)], [], '')
+    return FolderWatcher(db, lambda: path_filter, lambda batch: None, debounce=debounce, max_delay=max_delay)
+
+
+def write_photo(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    return str(path)
+
+
+def scanned_photo(file_path, faces):
+    stat = os.stat(file_path)
+    return {
+        'file_path': file_path,
+        'file_hash': compute_file_hash(file_path, HASH_VERSION),
+        'hash_version': HASH_VERSION,
+        'file_size': stat.st_size,
+        'file_mtime': stat.st_mtime,
+        'status': 'completed',
+        'model_version': 'test',
+        'faces': [{'bbox': bbox, 'embedding': embedding, 'det_score': 0.9} for bbox, embedding in faces],
+    }
+
+
+def photo_face_ids(db, file_path):
+    return [row[0] for row in db.conn.execute(
+        'SELECT face_id FROM faces JOIN photos USING (photo_id) WHERE file_path = ? ORDER BY face_id', (file_path,))]
+
+
+def test_events_wait_for_quiet_folders(tmp_path):
+    watcher = make_watcher(None, tmp_path, debounce=0.05)
+    watcher.add_event('created', str(tmp_path / 'a.jpg'), False)
+    assert watcher._take_ready_events() == []
+
+    time.sleep(0.03)
+    watcher.add_event('modified', str(tmp_path / 'a.jpg'), False)
+    time.sleep(0.03)
+    # Still within the debounce of the last event
+    assert watcher._take_ready_events() == []
+
+    time.sleep(0.05)
+    assert [kind for kind, *_ in watcher._take_ready_events()] == ['created', 'modified']
+    assert watcher._take_ready_events() == []
+
+
+def test_steady_events_are_taken_after_max_delay(tmp_path):
+    watcher = make_watcher(None, tmp_path, debounce=1.0, max_delay=0.1)
+    taken = []
+    start = time.monotonic()
+    while not taken and time.monotonic() - start < 2:
+        watcher.add_event('created', str(tmp_path / f'{len(taken)}.jpg'), False)
+        taken = watcher._take_ready_events()
+        time.sleep(0.01)
+
+    assert taken
+    assert time.monotonic() - start < 1.0
+
+
+def test_new_moved_and_deleted_photos(tmp_path):
+    db = FaceDatabase(tmp_path / 'data')
+    root = tmp_path / 'photos'
+    kept = write_photo(root / 'kept.jpg', b'kept')
+    gone = write_photo(root / 'gone.jpg', b'gone')
+    db.ingest_batch([scanned_photo(kept, []), scanned_photo(gone, [])])
+    watcher = make_watcher(db, root)
+
+    new = write_photo(root / 'new.jpg', b'new')
+    moved = str(root / 'sub' / 'kept.jpg')
+    os.makedirs(os.path.dirname(moved))
+    os.rename(kept, moved)
+    os.remove(gone)
+    batch = watcher.apply([('created', new, False, None), ('moved', kept, False, moved),
+                           ('deleted', gone, False, None), ('created', str(root / 'notes.txt'), False, None)])
+
+    assert (batch.queued, batch.relocated, batch.removed) == (1, 1, 1)
+    assert db.get_scan_queue_paths() == [new]
+    assert db.get_photo_id(moved) is not None
+    assert db.get_photo_id(kept) is None
+    assert db.get_photo_id(gone) is None
+    db.close()
+
+
+def test_touched_photo_is_not_rescanned(tmp_path):
+    db = FaceDatabase(tmp_path / 'data')
+    path = write_photo(tmp_path / 'photos' / 'a.jpg', b'photo')
+    db.ingest_batch([scanned_photo(path, [])])
+    os.utime(path, (time.time() + 60, time.time() + 60))
+
+    batch = make_watcher(db, tmp_path / 'photos').apply([('modified', path, False, None)])
+
+    assert batch.queued == 0
+    assert db.get_photo_states([path])[path]['file_mtime'] == os.stat(path).st_mtime
+    db.close()
+
+
+def test_edited_photo_keeps_its_tags(tmp_path):
+    db = FaceDatabase(tmp_path / 'data')
+    path = write_photo(tmp_path / 'photos' / 'a.jpg', b'photo')
+    embeddings = unit_vectors(4)
+    db.ingest_batch([scanned_photo(path, [([0.0, 0.0, 100.0, 100.0], embeddings[0]),
+                                          ([500.0, 0.0, 600.0, 100.0], embeddings[1])])])
+    old_ids = photo_face_ids(db, path)
+    db.tag_faces([old_ids[0]], 'Alice')
+    db.tag_faces([old_ids[1]], 'Bob')
+
+    # Edited in place: Alice's face moved, Bob's box stayed while retouching changed his embedding,
+    # and a face without tags appeared
+    write_photo(tmp_path / 'photos' / 'a.jpg', b'edited photo')
+    batch = make_watcher(db, tmp_path / 'photos').apply([('modified', path, False, None)])
+    assert batch.queued == 1
+    db.ingest_batch([scanned_photo(path, [([300.0, 300.0, 380.0, 380.0], embeddings[0] + 0.01),
+                                          ([505.0, 0.0, 600.0, 100.0], embeddings[2]),
+                                          ([800.0, 800.0, 900.0, 900.0], embeddings[3])])])
+
+    new_ids = photo_face_ids(db, path)
+    assert not set(new_ids) & set(old_ids)
+    assert db.get_face_tags(new_ids) == {new_ids[0]: 'Alice', new_ids[1]: 'Bob'}
+    assert db.get_face_tags(old_ids) == {}
+    assert db.get_scan_queue_size() == 0
+    db.close()
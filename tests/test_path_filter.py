@@ -0,0 +1,106 @@
+import fnmatch
+import itertools
+import os
+
+import pytest
+
+from path_filter import PathFilter
+
+
+# ScanWorker.should_exclude_path before PathFilter, the reference every decision must match
+def legacy_should_exclude(path, include_folders, exclude_folders, wildcard_text):
+    path_normalized = os.path.normpath(path)
+
+    if not include_folders:
+        return False
+
+    is_in_include = False
+    for include_folder in include_folders:
+        include_normalized = os.path.normpath(include_folder)
+        if path_normalized.startswith(include_normalized):
+            is_in_include = True
+            break
+
+    if not is_in_include:
+        return True
+
+    for exclude_folder in exclude_folders:
+        exclude_normalized = os.path.normpath(exclude_folder)
+        if path_normalized.startswith(exclude_normalized):
+            return True
+
+    if wildcard_text:
+        wildcards = [w.strip() for w in wildcard_text.split(',') if w.strip()]
+
+        for wildcard in wildcards:
+            wildcard_normalized = os.path.normpath(wildcard)
+
+            if os.path.isabs(wildcard_normalized):
+                if path_normalized.startswith(wildcard_normalized):
+                    return True
+            else:
+                path_parts = path_normalized.split(os.sep)
+                filename = os.path.basename(path_normalized)
+
+                if fnmatch.fnmatch(filename, wildcard):
+                    return True
+
+                for part in path_parts:
+                    if fnmatch.fnmatch(part, wildcard):
+                        return True
+
+    return False
+
+
+BASE = os.path.abspath(os.sep + 'library')
+
+
+def join(*parts):
+    return os.path.join(BASE, *parts)
+
+
+CONFIGS = [
+    ([], [], ''),
+    ([join('Photos')], [], ''),
+    ([join('Photos'), join('Phone Backup'), join('Archive', '2010')],
+     [join('Photos', 'Screenshots'), join('Photos', '2019', 'raw')],
+     '*.gif, *thumbnail*, *cache*, .*, Private?, ' + join('Phone Backup', 'WhatsApp')),
+    # Trailing separators and nested includes, normalised like the original did
+    ([join('Photos') + os.sep, join('Photos', '2019')], [join('Photos', '2019') + os.sep], ' , [ab]*.JPG ,'),
+    ([join('Photos', 'a')], [join('Photos', 'a', 'b')], '*'),
+]
+
+NAMES = ['Photos', 'Photos2', 'Phone Backup', 'Archive', '2010', '2010s', '2019', 'raw', 'rawer',
+         'Screenshots', 'WhatsApp', 'Private1', 'Private12', '.hidden', 'my cache', 'a', 'b',
+         'img.jpg', 'IMG.JPG', 'anim.gif', 'b1.JPG', 'thumbnail.png']
+
+
+def candidate_paths():
+    paths = [BASE, join(), os.path.abspath(os.sep + 'elsewhere')]
+    for depth in (1, 2, 3):
+        for parts in itertools.product(NAMES, repeat=depth):
+            if depth < 3 or parts[0] in ('Photos', 'Phone Backup', 'Archive'):
+                paths.append(join(*parts))
+    return paths
+
+
+@pytest.mark.parametrize('include_folders, exclude_folders, wildcard_text', CONFIGS)
+def test_matches_original_rules(include_folders, exclude_folders, wildcard_text):
+    path_filter = PathFilter(include_folders, exclude_folders, wildcard_text)
+    for path in candidate_paths():
+        assert path_filter.excludes(path) == \
+            legacy_should_exclude(path, include_folders, exclude_folders, wildcard_text), path
+
+
+def test_folder_prefix_matches_like_startswith():
+    path_filter = PathFilter([join('Photos')], [join('Photos', 'raw')], '')
+    assert not path_filter.excludes(join('Photos2', 'a.jpg'))
+    assert path_filter.excludes(join('Photos', 'rawer', 'a.jpg'))
+    assert path_filter.excludes(join('Other', 'a.jpg'))
+
+
+def test_wildcards_match_any_component():
+    path_filter = PathFilter([join('Photos')], [], '*.gif, Private?')
+    assert path_filter.excludes(join('Photos', 'anim.gif'))
+    assert path_filter.excludes(join('Photos', 'Private1', 'a.jpg'))
+    assert not path_filter.excludes(join('Photos', 'Private12', 'a.jpg'))
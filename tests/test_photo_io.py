@@ -0,0 +1,67 @@
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from photo_io import HASH_VERSION_BLAKE2B, HASH_VERSION_MD5, compute_file_hash, decode_for_detection, \
+    hash_bytes, read_photo_bytes
+
+
+def encode(image, image_format='JPEG', orientation=None):
+    exif = Image.Exif()
+    if orientation is not None:
+        exif[0x0112] = orientation
+    buffer = BytesIO()
+    image.save(buffer, image_format, exif=exif)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize('hash_version', [HASH_VERSION_MD5, HASH_VERSION_BLAKE2B])
+def test_hash_of_buffer_matches_streamed_file(tmp_path, hash_version):
+    path = tmp_path / "photo.jpg"
+    path.write_bytes(np.random.default_rng(0).bytes(3 * 1024 * 1024 + 17))
+
+    data = read_photo_bytes(str(path))
+    assert hash_bytes(data, hash_version) == compute_file_hash(str(path), hash_version)
+
+
+def test_unknown_hash_version():
+    with pytest.raises(ValueError):
+        hash_bytes(b"data", 99)
+
+
+def test_full_size_without_max_side():
+    image, scale_x, scale_y = decode_for_detection(encode(Image.new('RGB', (400, 300))), 0)
+    assert image.shape == (300, 400, 3)
+    assert (scale_x, scale_y) == (1.0, 1.0)
+
+
+@pytest.mark.parametrize('image_format', ['JPEG', 'PNG'])
+@pytest.mark.parametrize('size, max_side', [((4000, 3000), 1280), ((3000, 4000), 1280), ((2000, 1500), 1280),
+                                            ((1300, 900), 1280), ((5000, 100), 640)])
+def test_reduced_decode_fits_max_side(image_format, size, max_side):
+    image, scale_x, scale_y = decode_for_detection(encode(Image.new('RGB', size), image_format), max_side)
+    height, width = image.shape[:2]
+
+    assert max(width, height) == max_side
+    assert scale_x == pytest.approx(size[0] / width)
+    assert scale_y == pytest.approx(size[1] / height)
+
+
+def test_small_photo_is_not_enlarged():
+    image, scale_x, scale_y = decode_for_detection(encode(Image.new('RGB', (640, 480))), 1280)
+    assert image.shape == (480, 640, 3)
+    assert (scale_x, scale_y) == (1.0, 1.0)
+
+
+def test_orientation_swaps_scales():
+    data = encode(Image.new('RGB', (4000, 2000), (255, 0, 0)), orientation=6)
+    image, scale_x, scale_y = decode_for_detection(data, 1000)
+
+    # Shown rotated by 90 degrees: boxes in the oriented image scale back by the swapped factors
+    assert image.shape[:2] == (1000, 500)
+    assert scale_x == pytest.approx(2000 / 500)
+    assert scale_y == pytest.approx(4000 / 1000)
+    # BGR, like cv2.imread
+    assert image[10, 10].tolist()[2] > 200
@@ -0,0 +1,101 @@
+import os
+
+import pytest
+
+pytest.importorskip('torch')
+
+from database import FaceDatabase
+from path_filter import PathFilter
+from photo_io import HASH_VERSION, compute_file_hash
+from workers import ScanWorker
+
+
+class StatusLog:
+    def __init__(self):
+        self.messages = []
+
+    def get_scan_settings(self):
+        return {}
+
+    def update_status(self, message):
+        self.messages.append(message)
+
+    def scan_complete(self):
+        self.messages.append("complete")
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = FaceDatabase(tmp_path / "db")
+    yield db
+    db.close()
+
+
+def write_photo(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    return str(path)
+
+
+def stored_photo(db, path, file_size='stat'):
+    file_hash = compute_file_hash(path, HASH_VERSION)
+    size = os.path.getsize(path) if file_size == 'stat' else file_size
+    return db.add_photo(path + ".old", file_hash, HASH_VERSION, size)
+
+
+def photo_paths(db):
+    return {row[0]: row[1] for row in db.conn.execute('SELECT photo_id, file_path FROM photos')}
+
+
+def test_moved_photo_is_relinked(db, tmp_path):
+    moved = write_photo(tmp_path / "photos" / "renamed.jpg", b"photo one" * 100)
+    other = write_photo(tmp_path / "photos" / "new.jpg", b"photo two" * 100)
+    photo_id = stored_photo(db, moved)
+
+    worker = ScanWorker(db, StatusLog())
+    assert worker.reconcile_moved_photos({moved, other}) == 1
+    assert photo_paths(db) == {photo_id: moved}
+
+
+def test_changed_content_is_not_relinked(db, tmp_path):
+    path = write_photo(tmp_path / "photos" / "a.jpg", b"photo one" * 100)
+    photo_id = stored_photo(db, path)
+    write_photo(tmp_path / "photos" / "a.jpg", b"photo ONE" * 100)
+
+    assert ScanWorker(db, StatusLog()).reconcile_moved_photos({path}) == 0
+    assert photo_paths(db) == {photo_id: path + ".old"}
+
+
+def test_unknown_size_hashes_only_few_new_files(db, tmp_path):
+    moved = write_photo(tmp_path / "photos" / "renamed.jpg", b"photo one" * 100)
+    others = {write_photo(tmp_path / "photos" / f"new{i}.jpg", bytes([i]) * 50) for i in range(3)}
+    photo_id = stored_photo(db, moved, file_size=None)
+
+    worker = ScanWorker(db, StatusLog())
+    worker.UNKNOWN_SIZE_HASH_LIMIT = 3
+    assert worker.reconcile_moved_photos({moved} | others) == 0
+
+    worker.UNKNOWN_SIZE_HASH_LIMIT = 4
+    assert worker.reconcile_moved_photos({moved} | others) == 1
+    assert photo_paths(db) == {photo_id: moved}
+
+
+def test_backfill_photo_sizes(db, tmp_path):
+    present = write_photo(tmp_path / "photos" / "a.jpg", b"photo one" * 100)
+    present_id = db.add_photo(present, "hash-a", HASH_VERSION)
+    gone_id = db.add_photo(str(tmp_path / "photos" / "gone.jpg"), "hash-b", HASH_VERSION)
+
+    assert ScanWorker(db, StatusLog()).backfill_photo_sizes({present}) == 1
+    sizes = dict(db.conn.execute('SELECT photo_id, file_size FROM photos').fetchall())
+    assert sizes == {present_id: 900, gone_id: None}
+
+
+def test_cancelled_discovery_completes_the_scan(db, tmp_path):
+    write_photo(tmp_path / "photos" / "a.jpg", b"photo one" * 100)
+    api = StatusLog()
+    worker = ScanWorker(db, api)
+    worker.path_filter = PathFilter([str(tmp_path / "photos")], [], '')
+    worker.stop()
+
+    assert not worker.discover_and_queue([str(tmp_path / "photos")])
+    assert api.messages[-2:] == ["Scan cancelled during discovery", "complete"]
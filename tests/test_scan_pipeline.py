@@ -0,0 +1,131 @@
+import threading
+import time
+
+import pytest
+
+from scan_pipeline import PipelineStage, ScanPipeline
+
+
+def run_to_list(pipeline, source):
+    results = []
+    pipeline.run(source, results.append)
+    return results
+
+
+def test_single_workers_keep_order():
+    pipeline = ScanPipeline([
+        PipelineStage("double", lambda x: x * 2),
+        PipelineStage("label", lambda x: f"item {x}"),
+    ])
+    assert run_to_list(pipeline, range(50)) == [f"item {x * 2}" for x in range(50)]
+
+
+def test_parallel_workers_process_every_item():
+    def slow_square(x):
+        time.sleep(0.001)
+        return x * x
+
+    pipeline = ScanPipeline([
+        PipelineStage("square", slow_square, workers=4, queue_size=2),
+        PipelineStage("increment", lambda x: x + 1, workers=3),
+    ])
+    assert sorted(run_to_list(pipeline, range(200))) == sorted(x * x + 1 for x in range(200))
+    assert pipeline.stages[0].items_processed == 200
+    assert pipeline.stages[1].items_processed == 200
+
+
+def test_none_drops_item():
+    pipeline = ScanPipeline([PipelineStage("odd", lambda x: x if x % 2 else None)])
+    assert run_to_list(pipeline, range(10)) == [1, 3, 5, 7, 9]
+
+
+def test_stop_ends_run_and_joins_threads():
+    stop_event = threading.Event()
+    sunk = []
+
+    def sink(item):
+        sunk.append(item)
+        if len(sunk) == 5:
+            stop_event.set()
+
+    pipeline = ScanPipeline([PipelineStage("pass", lambda x: x, workers=2, queue_size=1)], stop_event)
+    # An endless source: only the stop ends the run
+    pipeline.run(iter(int, 1), sink)
+
+    assert len(sunk) == 5
+    assert not any(thread.is_alive() for thread in pipeline._threads)
+
+
+def test_stage_error_stops_pipeline():
+    def fail_on_three(x):
+        if x == 3:
+            raise ValueError("bad item")
+        return x
+
+    pipeline = ScanPipeline([PipelineStage("check", fail_on_three)])
+    results = run_to_list(pipeline, range(100))
+
+    assert pipeline.stop_event.is_set()
+    assert [str(e) for e in pipeline.errors] == ["bad item"]
+    # Items already past the failing stage may or may not reach the sink before it sees the stop
+    assert results == [0, 1, 2][:len(results)]
+
+
+def test_source_error_stops_pipeline():
+    def source():
+        yield 1
+        raise OSError("listing failed")
+
+    pipeline = ScanPipeline([PipelineStage("pass", lambda x: x)])
+    run_to_list(pipeline, source())
+
+    assert pipeline.stop_event.is_set()
+    assert [str(e) for e in pipeline.errors] == ["listing failed"]
+
+
+def test_sink_error_is_raised():
+    def sink(item):
+        raise RuntimeError("database locked")
+
+    pipeline = ScanPipeline([PipelineStage("pass", lambda x: x, queue_size=1)])
+    with pytest.raises(RuntimeError, match="database locked"):
+        pipeline.run(range(100), sink)
+    assert not any(thread.is_alive() for thread in pipeline._threads)
+
+
+def test_batch_stage_gets_lists_and_keeps_order():
+    batch_sizes = []
+
+    def batch_double(items):
+        batch_sizes.append(len(items))
+        return [x * 2 for x in items]
+
+    pipeline = ScanPipeline([PipelineStage("double", batch_double, batch_size=4)])
+    assert run_to_list(pipeline, range(50)) == [x * 2 for x in range(50)]
+    assert max(batch_sizes) <= 4
+    assert pipeline.stages[0].items_processed == 50
+
+
+def test_batch_stage_flushes_partial_batch_after_wait():
+    sunk = threading.Event()
+    stop_event = threading.Event()
+
+    def source():
+        yield 1
+        # A batch of one is passed on after batch_wait instead of waiting for more items
+        assert sunk.wait(timeout=5)
+        stop_event.set()
+
+    def sink(item):
+        sunk.set()
+
+    pipeline = ScanPipeline([PipelineStage("pass", lambda items: items, batch_size=8, batch_wait=0.01)], stop_event)
+    pipeline.run(source(), sink)
+
+    assert sunk.is_set()
+    assert not pipeline.errors
+
+
+def test_batch_stage_drops_none_results():
+    pipeline = ScanPipeline([PipelineStage("odd", lambda items: [x if x % 2 else None for x in items], batch_size=3)])
+    assert run_to_list(pipeline, range(10)) == [1, 3, 5, 7, 9]
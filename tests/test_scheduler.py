@@ -0,0 +1,97 @@
+import threading
+import time
+
+from scheduler import ResourceScheduler
+
+
+def photo_budget_scheduler(background, max_concurrency=3):
+    scheduler = ResourceScheduler(lambda: background[0], max_concurrency, mode='photos', photos_per_second=2.0)
+    scheduler.MAX_PAUSE = 0.3
+    return scheduler
+
+
+def control_step(scheduler, photos):
+    # As if a whole control interval had passed since the window started
+    scheduler._window_start -= scheduler.CONTROL_INTERVAL
+    scheduler.throttle(photos)
+
+
+def test_foreground_scan_is_not_throttled():
+    scheduler = photo_budget_scheduler([False])
+    for _ in range(5):
+        control_step(scheduler, 100)
+    assert scheduler.concurrency == 3
+    assert scheduler.pause == 0.0
+
+
+def test_background_scan_over_budget_drops_workers_then_pauses():
+    background = [True]
+    scheduler = photo_budget_scheduler(background)
+
+    control_step(scheduler, 100)
+    control_step(scheduler, 100)
+    assert scheduler.concurrency == 1
+    assert scheduler.pause == 0.0
+
+    control_step(scheduler, 100)
+    assert scheduler.pause == 0.25
+    control_step(scheduler, 100)
+    assert scheduler.pause == 0.3
+    assert scheduler.paused_seconds > 0.5
+
+    # Under budget the pause goes first, then the workers come back
+    control_step(scheduler, 0)
+    control_step(scheduler, 0)
+    assert scheduler.pause == 0.0
+    assert scheduler.concurrency == 1
+    control_step(scheduler, 0)
+    assert scheduler.concurrency == 2
+
+
+def test_foreground_again_restores_full_speed():
+    background = [True]
+    scheduler = photo_budget_scheduler(background)
+    for _ in range(3):
+        control_step(scheduler, 100)
+    assert scheduler.pause > 0
+
+    background[0] = False
+    control_step(scheduler, 100)
+    assert scheduler.concurrency == 3
+    assert scheduler.pause == 0.0
+
+
+def test_slot_limits_concurrent_workers():
+    scheduler = ResourceScheduler(lambda: True, 4)
+    scheduler.concurrency = 2
+    lock = threading.Lock()
+    running = [0, 0]
+
+    def work():
+        with scheduler.slot():
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+
+    threads = [threading.Thread(target=work) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert running[1] == 2
+
+
+def test_stop_releases_waiting_workers():
+    stop_event = threading.Event()
+    scheduler = ResourceScheduler(lambda: True, 1, stop_event=stop_event)
+    scheduler._paused_until = time.monotonic() + 60
+    stop_event.set()
+
+    start = time.monotonic()
+    with scheduler.slot():
+        pass
+    assert time.monotonic() - start < 1
@@ -0,0 +1,36 @@
+import os
+import time
+
+from PIL import Image
+
+from thumbnail_cache import ThumbnailCache
+
+
+def write_photo(path, color):
+    Image.new('RGB', (64, 48), color).save(path, 'JPEG')
+    return str(path)
+
+
+def test_cached_thumbnail_is_reused(tmp_path):
+    cache = ThumbnailCache(tmp_path / 'cache')
+    path = write_photo(tmp_path / 'a.jpg', (255, 0, 0))
+    stored_mtime = os.path.getmtime(path)
+
+    thumbnail = cache.create_thumbnail_with_cache(1, path, 32, source_mtime=stored_mtime)
+    assert thumbnail is not None
+    assert cache.get_cached_thumbnail(1, path, None, 32, stored_mtime) == thumbnail
+
+
+def test_photo_edited_after_its_scan_is_redrawn(tmp_path):
+    cache = ThumbnailCache(tmp_path / 'cache')
+    path = write_photo(tmp_path / 'a.jpg', (255, 0, 0))
+    stored_mtime = os.path.getmtime(path)
+    red = cache.create_thumbnail_with_cache(1, path, 32, source_mtime=stored_mtime)
+
+    # Edited without a rescan: the mtime stored at scan time is older than the cached thumbnail
+    write_photo(path, (0, 0, 255))
+    later = time.time() + 60
+    os.utime(path, (later, later))
+
+    assert cache.get_cached_thumbnail(1, path, None, 32, stored_mtime) is None
+    assert cache.create_thumbnail_with_cache(1, path, 32, source_mtime=stored_mtime) != red